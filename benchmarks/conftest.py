@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+Fixtures shared by the benchmarks.
+
+Libraries are generated once per size for the whole session. Pass
+`--library-size=1000,10000,100000` to benchmark several sizes and
+`--library-cache=DIR` to keep generated libraries between runs. Pass
+`--metadata-backend=memory,native` to benchmark without exiftool.
+"""
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from click.testing import CliRunner
+from json import loads
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+elodie_root = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, elodie_root)
+sys.path.insert(0, benchmarks_dir)
+
+os.environ['TZ'] = 'GMT'
+
+from elodie import constants
+from elodie.dependencies import get_exiftool
+from elodie.external.pyexiftool import ExifTool
+from elodie.config import load_config
+from elodie.localstorage import Db
+from elodie.media import backend
+
+import generate
+
+
+def pytest_addoption(parser):
+    parser.addoption('--library-size', default='1000',
+                     help='Comma separated number of files in the libraries '
+                          'to benchmark with.')
+    parser.addoption('--library-seed', type=int, default=0,
+                     help='Seed used to generate libraries.')
+    parser.addoption('--library-cache', default=None,
+                     help='Directory to keep generated libraries in between '
+                          'runs.')
+    parser.addoption('--metadata-backend', default=None,
+                     help='Comma separated metadata backends to use instead '
+                          'of the ones in config.ini.')
+
+
+def pytest_generate_tests(metafunc):
+    if 'library_size' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('library_size').split(',')
+        metafunc.parametrize('library_size', [int(s) for s in sizes],
+                             scope='session')
+
+
+class Library(object):
+    """A generated library.
+
+    :param str path: Directory containing the media files.
+    :param list manifest: Metadata each file was generated with.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def application_directory():
+    """Use a temporary application directory for the whole session."""
+    directory = tempfile.mkdtemp('-elodie-benchmarks')
+    os.environ['ELODIE_APPLICATION_DIRECTORY'] = directory
+    shutil.copy2(os.path.join(elodie_root, 'config.ini-sample'),
+                 os.path.join(directory, 'config.ini'))
+    yield directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def metadata_backend(request, application_directory):
+    """Configure the backends passed with --metadata-backend for the
+    session.
+    """
+    names = request.config.getoption('metadata_backend')
+    if names is not None:
+        with open(os.path.join(application_directory, 'config.ini'),
+                  'a') as f:
+            f.write('\n[Metadata]\nbackends=%s\n' % names)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+    backend.set_backend(None)
+    yield backend.get_backend()
+    backend.set_backend(None)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def exiftool(request):
+    """Start ExifTool once for the entire session unless the metadata
+    backends don't use it.
+    """
+    names = request.config.getoption('metadata_backend')
+    if names is not None and 'exiftool' not in names.split(','):
+        yield None
+        return
+
+    exiftool_addedargs = [
+        u'-config',
+        u'"{}"'.format(constants.exiftool_config)
+    ]
+    exiftool = ExifTool(executable_=get_exiftool(),
+                        addedargs=exiftool_addedargs)
+    exiftool.start()
+    yield exiftool
+    exiftool.terminate()
+
+
+@pytest.fixture(scope='session')
+def elodie():
+    """The elodie.py command line module."""
+    spec = importlib.util.spec_from_file_location(
+        'elodie_cli', os.path.join(elodie_root, 'elodie.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def library(request, library_size, tmp_path_factory):
+    """Generate, or reuse from --library-cache, a library of library_size
+    files.
+    """
+    seed = request.config.getoption('library_seed')
+    cache = request.config.getoption('library_cache')
+    if cache is None:
+        destination = str(tmp_path_factory.mktemp('library-%d' %
+                                                  library_size))
+    else:
+        destination = os.path.join(os.path.abspath(cache),
+                                   '%d-%d' % (library_size, seed))
+
+    manifest_file = os.path.join(destination, 'manifest.jsonl')
+    if not os.path.isfile(manifest_file):
+        shutil.rmtree(destination, ignore_errors=True)
+        generate.generate(destination, library_size, seed)
+
+    with open(manifest_file, 'r') as f:
+        manifest = [loads(line) for line in f]
+    return Library(os.path.join(destination, 'library'), manifest)
+
+
+@pytest.fixture(scope='session')
+def location_cache():
+    """Fill the location cache with the cities the library is clustered
+    around so that no lookups leave the machine.
+    """
+    db = Db()
+    for name, latitude, longitude in generate.CLUSTERS:
+        db.add_location(latitude, longitude, {'city': name, 'default': name})
+    db.update_location_db()
+    return db
+
+
+@pytest.fixture(scope='session')
+def imported_library(elodie, library, location_cache, tmp_path_factory):
+    """Import the library once. Returns the destination and the hash db
+    written by the import.
+    """
+    destination = str(tmp_path_factory.mktemp('imported-%d' %
+                                              len(library.manifest)))
+    _reset_hash_db()
+    CliRunner().invoke(elodie._import, ['--destination', destination,
+                                        library.path])
+    return (destination, dict(Db().hash_db))
+
+
+@pytest.fixture
+def reset_hash_db():
+    """Function which replaces the hash db and drops every source index."""
+    return _reset_hash_db
+
+
+def _reset_hash_db(hash_db=None):
+    db = Db()
+    db.hash_db = dict(hash_db or {})
+    db.update_hash_db()
+    shutil.rmtree(os.path.join(constants.application_directory(),
+                               'sources'), ignore_errors=True)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+Generate a synthetic media library to benchmark Elodie with.
+
+The library is generated offline and is fully determined by its size and
+seed. It contains JPEGs with EXIF dates, GPS coordinates clustered around a
+few cities and camera details, PNGs, MP4 stubs with a creation date and text
+files with a JSON header. Files are spread across album folders and a share
+of them are exact duplicates of other files.
+
+A manifest.jsonl is written next to the library with one line per file
+describing the metadata it was generated with.
+
+    ./benchmarks/generate.py --count=1000 /tmp/elodie-library
+"""
+from __future__ import print_function
+
+import io
+import os
+import random
+import struct
+import time
+
+from json import dumps
+
+import click
+import piexif
+from PIL import Image
+
+#: Cities which GPS coordinates are clustered around.
+CLUSTERS = (
+    ('Sunnyvale', 37.368830, -122.036350),
+    ('Paris', 48.856613, 2.352222),
+    ('Tokyo', 35.676192, 139.650311),
+    ('Cape Town', -33.924870, 18.424055),
+    ('Sydney', -33.868820, 151.209296),
+    ('Reykjavik', 64.146582, -21.942635),
+    ('Buenos Aires', -34.603684, -58.381559),
+    ('Nairobi', -1.292066, 36.821946),
+)
+
+#: Maximum distance in degrees of a coordinate from its city.
+#: 0.01 degrees is about 1km so every coordinate is within Elodie's 3km
+#:  location cache radius of its city.
+JITTER = 0.01
+
+#: Share of each type of file in the library.
+FILE_TYPES = (
+    ('jpg', 0.6),
+    ('png', 0.1),
+    ('mp4', 0.15),
+    ('txt', 0.15),
+)
+
+#: Files are dated between these times.
+DATE_START = time.mktime((2005, 1, 1, 0, 0, 0, 0, 0, -1))
+DATE_END = time.mktime((2020, 12, 31, 0, 0, 0, 0, 0, -1))
+
+#: Seconds between the QuickTime epoch of 1904-01-01 and the Unix epoch.
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+
+def generate(destination, count, seed=0, duplicates=0.05,
+             gps_share=0.8, files_per_album=50):
+    """Generate a library of `count` files.
+
+    :param str destination: Directory to write the library and manifest
+        into. The files are written to `destination/library`.
+    :param int count: Number of files.
+    :param int seed: Seed of the random number generator.
+    :param float duplicates: Share of files which are copies of another.
+    :param float gps_share: Share of files which have GPS coordinates.
+    :param int files_per_album: Average number of files in an album folder.
+    :returns: list(dict) of the manifest entries.
+    """
+    rand = random.Random(seed)
+    destination = os.path.abspath(destination)
+    library = os.path.join(destination, 'library')
+    albums = max(1, count // files_per_album)
+    extensions = [e for e, _ in FILE_TYPES]
+    weights = [w for _, w in FILE_TYPES]
+
+    manifest = []
+    for index in range(count):
+        # A third of the files aren't in an album.
+        album = None
+        folder = library
+        if rand.random() > 0.33:
+            album = 'Album %04d' % rand.randrange(albums)
+            folder = os.path.join(library, album)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        if manifest and rand.random() < duplicates:
+            original = rand.choice(manifest)
+            entry = dict(original)
+            entry['duplicate_of'] = original['path']
+            entry['path'] = os.path.join(
+                folder,
+                'copy-%06d-%s' % (index, os.path.basename(original['path']))
+            )
+            with open(original['path'], 'rb') as f_in:
+                content = f_in.read()
+        else:
+            extension = rand.choices(extensions, weights)[0]
+            entry = {
+                'path': os.path.join(folder, 'file-%06d.%s' % (index,
+                                                              extension)),
+                'extension': extension,
+                'date_taken': int(rand.uniform(DATE_START, DATE_END)),
+                'album': album,
+                'title': None,
+                'latitude': None,
+                'longitude': None,
+                'location': None,
+            }
+            if extension in ('jpg', 'txt') and rand.random() < gps_share:
+                name, latitude, longitude = rand.choice(CLUSTERS)
+                entry['location'] = name
+                entry['latitude'] = round(
+                    latitude + rand.uniform(-JITTER, JITTER), 6)
+                entry['longitude'] = round(
+                    longitude + rand.uniform(-JITTER, JITTER), 6)
+            if extension == 'txt':
+                entry['title'] = 'Note %d' % index
+            content = CONTENT[extension](entry, index, rand)
+
+        with open(entry['path'], 'wb') as f:
+            f.write(content)
+        os.utime(entry['path'], (entry['date_taken'], entry['date_taken']))
+        manifest.append(entry)
+
+    with open(os.path.join(destination, 'manifest.jsonl'), 'w') as f:
+        for entry in manifest:
+            f.write(dumps(entry) + '\n')
+
+    return manifest
+
+
+def jpg(entry, index, rand):
+    """Get the bytes of a small JPEG with EXIF."""
+    image = Image.new('RGB', (32, 24), color=(
+        rand.randrange(256), rand.randrange(256), rand.randrange(256)
+    ))
+    exif_date = time.strftime(
+        '%Y:%m:%d %H:%M:%S', time.localtime(entry['date_taken'])
+    ).encode('ascii')
+    exif = {
+        '0th': {
+            piexif.ImageIFD.Make: b'Elodie',
+            piexif.ImageIFD.Model: b'Benchmark %d' % rand.randrange(5),
+        },
+        'Exif': {
+            piexif.ExifIFD.DateTimeOriginal: exif_date,
+            piexif.ExifIFD.DateTimeDigitized: exif_date,
+            # Makes sure no two generated images are identical.
+            piexif.ExifIFD.ImageUniqueID: b'%032d' % index,
+        },
+    }
+    if entry['latitude'] is not None:
+        exif['GPS'] = gps(entry['latitude'], entry['longitude'])
+
+    output = io.BytesIO()
+    image.save(output, 'jpeg', exif=piexif.dump(exif))
+    return output.getvalue()
+
+
+def gps(latitude, longitude):
+    """Get the EXIF GPS IFD for coordinates."""
+    def rational(decimal):
+        decimal = abs(decimal)
+        degrees = int(decimal)
+        minutes = int((decimal - degrees) * 60)
+        seconds = int(round((decimal - degrees - minutes / 60.0) * 360000))
+        return ((degrees, 1), (minutes, 1), (seconds, 100))
+
+    return {
+        piexif.GPSIFD.GPSLatitudeRef: b'N' if latitude >= 0 else b'S',
+        piexif.GPSIFD.GPSLatitude: rational(latitude),
+        piexif.GPSIFD.GPSLongitudeRef: b'E' if longitude >= 0 else b'W',
+        piexif.GPSIFD.GPSLongitude: rational(longitude),
+    }
+
+
+def png(entry, index, rand):
+    """Get the bytes of a small PNG. PNGs are dated by their mtime."""
+    image = Image.new('RGB', (32, 24), color=(
+        rand.randrange(256), rand.randrange(256), rand.randrange(256)
+    ))
+    # Makes sure no two generated images are identical.
+    image.putpixel((0, 0), (index & 255, (index >> 8) & 255,
+                            (index >> 16) & 255))
+    output = io.BytesIO()
+    image.save(output, 'png')
+    return output.getvalue()
+
+
+def mp4(entry, index, rand):
+    """Get the bytes of an MP4 stub with a creation date and no tracks."""
+    def box(box_type, payload):
+        return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+    created = entry['date_taken'] + QUICKTIME_EPOCH_OFFSET
+    mvhd = struct.pack(
+        '>I4I I H10x 9I 24x I',
+        0,  # version and flags
+        created,  # creation time
+        created,  # modification time
+        1000,  # time scale
+        1000,  # duration
+        0x00010000,  # preferred rate
+        0x0100,  # preferred volume
+        0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000,  # matrix
+        1,  # next track id
+    )
+    return box(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41') + \
+        box(b'moov', box(b'mvhd', mvhd)) + \
+        box(b'free', b'%032d' % index)
+
+
+def txt(entry, index, rand):
+    """Get the bytes of a text file with a JSON header."""
+    header = {'date_taken': float(entry['date_taken']),
+              'title': entry['title']}
+    if entry['latitude'] is not None:
+        header['latitude'] = str(entry['latitude'])
+        header['longitude'] = str(entry['longitude'])
+    return (dumps(header) + '\n\nGenerated note %d.\n' % index).encode('utf-8')
+
+
+CONTENT = {'jpg': jpg, 'png': png, 'mp4': mp4, 'txt': txt}
+
+
+@click.command()
+@click.option('--count', type=int, default=1000,
+              help='Number of files to generate.')
+@click.option('--seed', type=int, default=0,
+              help='Seed of the random number generator.')
+@click.option('--duplicates', type=float, default=0.05,
+              help='Share of files which are copies of another.')
+@click.argument('destination', type=click.Path(file_okay=False))
+def main(count, seed, duplicates, destination):
+    """Generate a synthetic media library in DESTINATION."""
+    start = time.time()
+    generate(destination, count, seed, duplicates)
+    print('Generated %d files in %.1fs' % (count, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
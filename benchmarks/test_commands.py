@@ -0,0 +1,102 @@
+"""
+Benchmarks of the commands users run against a whole library.
+"""
+import os
+import shutil
+import tempfile
+
+from click.testing import CliRunner
+
+#: Number of files updated by the update benchmark. The library size only
+#:  changes the size of the hash db it has to maintain.
+UPDATE_SAMPLE_SIZE = 100
+
+
+def rounds(count):
+    """Run benchmarks of small libraries a few times and of large ones once.
+
+    :param int count: Number of files the benchmark handles.
+    :returns: int
+    """
+    return max(1, min(5, 10000 // max(1, count)))
+
+
+def test_import(benchmark, elodie, library, location_cache, reset_hash_db,
+                tmp_path):
+    def setup():
+        reset_hash_db()
+        return (tempfile.mkdtemp(dir=str(tmp_path)),), {}
+
+    def run(destination):
+        return CliRunner().invoke(elodie._import,
+                                  ['--destination', destination,
+                                   library.path])
+
+    result = benchmark.pedantic(run, setup=setup, rounds=rounds(len(library.manifest)))
+
+    assert result.exception is None or isinstance(result.exception,
+                                                  SystemExit), result.output
+
+
+def test_import_unchanged(benchmark, elodie, library, location_cache,
+                          reset_hash_db, tmp_path):
+    """Import a library a second time when nothing has changed."""
+    destination = str(tmp_path)
+    reset_hash_db()
+    runner = CliRunner()
+    runner.invoke(elodie._import, ['--destination', destination,
+                                   library.path])
+
+    benchmark.pedantic(runner.invoke, args=(
+        elodie._import, ['--destination', destination, library.path]
+    ), rounds=rounds(len(library.manifest)))
+
+
+def test_generate_db(benchmark, elodie, imported_library):
+    destination, hash_db = imported_library
+
+    result = benchmark.pedantic(CliRunner().invoke, args=(
+        elodie._generate_db, ['--source', destination]
+    ), rounds=rounds(len(hash_db)))
+
+    assert result.exception is None, result.output
+
+
+def test_verify(benchmark, elodie, imported_library, reset_hash_db):
+    destination, hash_db = imported_library
+    reset_hash_db(hash_db)
+
+    result = benchmark.pedantic(CliRunner().invoke, args=(elodie._verify,),
+                                rounds=rounds(len(hash_db)))
+
+    assert result.exception is None, result.output
+
+
+def test_update(benchmark, elodie, imported_library, reset_hash_db,
+                tmp_path):
+    destination, hash_db = imported_library
+    sample = sorted(hash_db.values())[:UPDATE_SAMPLE_SIZE]
+
+    def setup():
+        # update moves files so each round updates a fresh copy of the
+        #  sample which keeps the folder structure of the library.
+        reset_hash_db(hash_db)
+        copy = tempfile.mkdtemp(dir=str(tmp_path))
+        paths = []
+        for file_path in sample:
+            copy_path = os.path.join(copy, os.path.relpath(file_path,
+                                                           destination))
+            if not os.path.isdir(os.path.dirname(copy_path)):
+                os.makedirs(os.path.dirname(copy_path))
+            shutil.copy2(file_path, copy_path)
+            paths.append(copy_path)
+        return (paths,), {}
+
+    def run(paths):
+        return CliRunner().invoke(elodie._update,
+                                  ['--album', 'Benchmark'] + paths)
+
+    result = benchmark.pedantic(run, setup=setup, rounds=3)
+
+    assert result.exception is None or isinstance(result.exception,
+                                                  SystemExit), result.output
@@ -0,0 +1,87 @@
+"""
+Benchmarks of the work Elodie does for every file in a library which does
+not touch the file itself.
+"""
+import os
+import time
+
+from elodie import geolocation
+from elodie.filesystem import FileSystem
+from elodie.media.media import Media
+from elodie.media.photo import Photo
+
+MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'mp4': 'video/mp4',
+    'txt': 'text/plain',
+}
+
+
+def get_metadata(entry):
+    """Build the metadata Elodie would read from a generated file.
+
+    :param dict entry: Manifest entry of the file.
+    :returns: dict
+    """
+    directory_path, file_name = os.path.split(entry['path'])
+    base_name, extension = os.path.splitext(file_name)
+    return {
+        'date_taken': time.gmtime(entry['date_taken']),
+        'camera_make': 'Elodie' if entry['extension'] == 'jpg' else None,
+        'camera_model': None,
+        'latitude': entry['latitude'],
+        'longitude': entry['longitude'],
+        'album': entry['album'],
+        'title': entry['title'],
+        'mime_type': MIME_TYPES[entry['extension']],
+        'original_name': None,
+        'base_name': base_name,
+        'extension': extension[1:],
+        'directory_path': directory_path,
+    }
+
+
+def test_path_rendering(benchmark, library, location_cache):
+    metadata_list = [get_metadata(entry) for entry in library.manifest]
+    filesystem = FileSystem()
+
+    def run():
+        for metadata in metadata_list:
+            filesystem.get_folder_path(metadata)
+            filesystem.get_file_name(metadata)
+
+    benchmark(run)
+
+
+def test_location_lookup(benchmark, library, location_cache):
+    coordinates = [(entry['latitude'], entry['longitude'])
+                   for entry in library.manifest
+                   if entry['latitude'] is not None]
+
+    def run():
+        for latitude, longitude in coordinates:
+            geolocation.place_name(latitude, longitude)
+
+    benchmark(run)
+
+
+def test_metadata_extraction(benchmark, library):
+    """Turn prefetched EXIF into metadata records for every photo."""
+    photos = []
+    for entry in library.manifest:
+        if entry['extension'] != 'jpg':
+            continue
+        photo = Photo(os.path.join(library.path, entry['path']))
+        photo.exif_metadata = {
+            'SourceFile': photo.source,
+            'EXIF:Make': 'Elodie',
+            'EXIF:DateTimeOriginal': time.strftime(
+                '%Y:%m:%d %H:%M:%S', time.gmtime(entry['date_taken'])),
+            'EXIF:GPSLatitude': abs(entry['latitude'] or 0),
+            'EXIF:GPSLatitudeRef': 'N',
+            'XMP:Title': entry['title'],
+        }
+        photos.append(photo)
+
+    benchmark(Media.read_metadata_batch, photos)
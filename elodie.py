@@ -5,9 +5,11 @@ import os
 import re
 import sys
 from datetime import datetime
+from hashlib import blake2b
+from itertools import islice
+from json import dumps, loads
 
 import click
-from send2trash import send2trash
 
 # Verify that external dependencies are present first, so the user gets a
 # more user-friendly error instead of an ImportError traceback.
@@ -18,25 +20,32 @@ if not verify_dependencies():
 from elodie import constants
 from elodie import geolocation
 from elodie import log
+from elodie import metrics
+from elodie import timing
 from elodie.compatability import _decode
 from elodie.config import load_config
-from elodie.filesystem import FileSystem
-from elodie.localstorage import Db
+from elodie.filesystem import FileSystem, send2trash
+from elodie.journal import Journal
+from elodie.localstorage import Db, SourceIndex, commit_metadata_cache
 from elodie.media.base import Base, get_all_subclasses
 from elodie.media.media import Media
 from elodie.media.text import Text
 from elodie.media.audio import Audio
 from elodie.media.photo import Photo
 from elodie.media.video import Video
-from elodie.plugins.plugins import Plugins
+from elodie.plugins.plugins import Plugins, flush_plugin_dbs
+from elodie.progress import MODES as PROGRESS_MODES, get_progress
 from elodie.result import Result
 from elodie.external.pyexiftool import ExifTool
 from elodie.dependencies import get_exiftool
 from elodie import constants
+# Modules only used by a single command, like elodie.plan or elodie.server,
+#  are imported by that command so every other command starts faster.
 
 FILESYSTEM = FileSystem()
 
-def import_file(_file, destination, album_from_folder, trash, allow_duplicates, location=None, time=None, db=None):
+@timing.timed('import_file')
+def import_file(_file, destination, album_from_folder, trash, allow_duplicates, location=None, time=None, db=None, journal=None, source_index=None):
     
     _file = _decode(_file)
     destination = _decode(destination)
@@ -62,7 +71,8 @@ def import_file(_file, destination, album_from_folder, trash, allow_duplicates,
         return
 
     if album_from_folder:
-        media.set_album_from_folder()
+        with timing.stage('metadata.write'):
+            media.set_album_from_folder()
 
     # Apply location and time updates if provided
     if location:
@@ -71,7 +81,8 @@ def import_file(_file, destination, album_from_folder, trash, allow_duplicates,
         update_time(media, _file, time)
 
     dest_path = FILESYSTEM.process_file(_file, destination,
-        media, allowDuplicate=allow_duplicates, move=False, db=db)
+        media, allowDuplicate=allow_duplicates, move=False, db=db,
+        journal=journal, source_index=source_index)
     if dest_path:
         log.all('%s -> %s' % (_file, dest_path))
     if trash:
@@ -82,6 +93,214 @@ def import_file(_file, destination, album_from_folder, trash, allow_duplicates,
 
     return dest_path or None
 
+def import_files(files, destination, album_from_folder, trash, allow_duplicates, location=None, time=None, db=None, journal=None, source_indexes=None, completed=None, progress=None):
+    """Import files sharing a single Db.
+
+    The Db and source indexes are flushed to disk every 100 imported files
+    and once all files were imported, when the plugins' databases are
+    flushed too.
+
+    Files are passed to the plugins' `before_batch()` and `after_batch()`
+    methods in chunks of the plugins' `batch_size`. If the after queue of
+    the plugins is enabled an imported file is yielded once its plugins'
+    `after()` methods ran, which may be after later files.
+
+    :param set completed: Files which were imported before an import was
+        interrupted.
+    :param progress: :class:`~elodie.progress.Progress` which is told when
+        each file is started. The caller tells it when the file finished.
+    :returns: generator of tuple(str, bool or None, str or None) of the
+        file, its status for :class:`~elodie.result.Result` and where it was
+        imported to.
+    """
+    if source_indexes is None:
+        source_indexes = []
+    if completed is None:
+        completed = set()
+
+    after_queue = FILESYSTEM.plugins.start_after_queue()
+    try:
+        for row in _import_files(files, destination, album_from_folder, trash,
+                                 allow_duplicates, location, time, db,
+                                 journal, source_indexes, completed,
+                                 progress, after_queue):
+            yield row
+        for row in get_after_rows(FILESYSTEM.plugins.stop_after_queue()):
+            yield row
+    finally:
+        FILESYSTEM.plugins.stop_after_queue()
+
+    # Final flush for any remaining entries.
+    db.update_hash_db()
+    for this_index in source_indexes:
+        this_index.write(prune=True)
+    flush_plugin_dbs()
+    commit_metadata_cache()
+
+def _import_files(files, destination, album_from_folder, trash, allow_duplicates, location, time, db, journal, source_indexes, completed, progress, after_queue):
+    """Import files for :func:`import_files`."""
+    files = iter(files)
+    files_imported = 0
+    plugins = FILESYSTEM.plugins
+    plugins.load()
+    while True:
+        chunk = list(islice(files, plugins.batch_size))
+        if not chunk:
+            break
+
+        # If any plugin raises an exception in before_batch() then none of
+        #  the files in the chunk are imported.
+        plugins_run_before_batch_status = plugins.start_batch(chunk)
+        if plugins_run_before_batch_status is False:
+            log.warn('At least one plugin batch pre-run failed for %d files' %
+                     len(chunk))
+
+        for current_file in chunk:
+            if progress is not None:
+                progress.file_started(current_file)
+
+            if plugins_run_before_batch_status is False:
+                yield (current_file, False, None)  # error
+                continue
+
+            if current_file in completed:
+                log.info('%s was imported before being interrupted. Skipping...' %
+                         current_file)
+                yield (current_file, True, None)
+                continue
+
+            source_index = None
+            for this_index in source_indexes:
+                if this_index.contains(current_file):
+                    source_index = this_index
+                    break
+
+            if source_index is not None:
+                unchanged = source_index.get_unchanged(current_file)
+                if unchanged is not None and os.path.isfile(unchanged[1]):
+                    log.info('%s already at %s.' % (current_file, unchanged[1]))
+                    yield (current_file, None, unchanged[1])  # duplicate
+                    continue
+
+            dest_path = import_file(current_file, destination, album_from_folder,
+                        trash, allow_duplicates, location, time, db=db,
+                        journal=journal, source_index=source_index)
+            if dest_path:
+                files_imported += 1
+                # Flush to disk every 100 successfully imported files so that
+                # partial progress is preserved if the process is interrupted.
+                if files_imported % 100 == 0:
+                    db.update_hash_db()
+                    for this_index in source_indexes:
+                        this_index.write()
+                if not after_queue:
+                    yield (current_file, True, dest_path)
+            elif not allow_duplicates:
+                yield (current_file, None, None)  # duplicate
+            else:
+                yield (current_file, False, None)  # error
+
+            for row in get_after_rows(plugins.get_after_results()):
+                yield row
+
+        if plugins.finish_batch() is False:
+            log.warn('At least one plugin batch post-run failed for %d files' %
+                     len(chunk))
+
+def get_after_rows(results):
+    """Turn the results of the plugins' after queue into rows for
+    :class:`~elodie.result.Result`.
+
+    A file whose plugins failed was imported but is counted as an error.
+
+    :returns: generator of tuple(str, bool, str)
+    """
+    for file_path, final_file_path, status in results:
+        if status is False:
+            log.warn('At least one plugin post-run failed for %s' % file_path)
+        yield (file_path, status is not False, final_file_path)
+
+def get_files_to_import(source, file, paths, exclude_regex):
+    """Get the files passed in to be imported or planned.
+
+    Directories are walked as files are consumed so an import can start
+    before every file was found. A file is only yielded once even if it was
+    passed in more than once, like when a directory and one of its
+    subdirectories are both passed in. A digest of each path is kept to
+    remember the files yielded, and only when the paths passed in overlap.
+
+    :returns: generator of str
+    """
+    paths = set(paths)
+    if source:
+        source = _decode(source)
+        paths.add(source)
+    if file:
+        paths.add(file)
+    paths = [os.path.expanduser(path) for path in paths]
+
+    exclude_regex_list = get_exclude_regex_list(exclude_regex)
+
+    # Once sorted, a path inside another directory passed in sorts right
+    #  after it or after another path inside it.
+    roots = sorted(os.path.join(os.path.abspath(path), '') for path in paths)
+    seen = None
+    if any(b.startswith(a) for a, b in zip(roots, roots[1:])):
+        seen = set()
+
+    for path in paths:
+        if os.path.isdir(path):
+            files = FILESYSTEM.get_all_files(path, None, exclude_regex_list)
+        elif not FILESYSTEM.should_exclude(path, exclude_regex_list, True):
+            files = [path]
+        else:
+            continue
+
+        for current_file in files:
+            if seen is not None:
+                digest = blake2b(
+                    os.path.abspath(current_file).encode('utf-8',
+                                                         'surrogateescape'),
+                    digest_size=16
+                ).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            yield current_file
+
+def get_exclude_regex_list(exclude_regex):
+    """Get the regular expressions of files to exclude.
+
+    If no exclude list was passed in we check if there's a config.
+
+    :returns: set(str)
+    """
+    if len(exclude_regex) == 0:
+        config = load_config()
+        if 'Exclusions' in config:
+            exclude_regex = [value for key, value in config.items('Exclusions')]
+
+    return set(exclude_regex)
+
+def get_source_indexes(source, paths):
+    """Get a SourceIndex for each directory passed in to be imported.
+
+    Nested directories share the index of the outermost one.
+
+    :returns: list(:class:`~elodie.localstorage.SourceIndex`)
+    """
+    directories = set()
+    for path in set(paths) | set([source] if source else []):
+        path = os.path.abspath(os.path.expanduser(_decode(path)))
+        if os.path.isdir(path):
+            directories.add(path)
+
+    source_indexes = []
+    for directory in sorted(directories):
+        if not any(i.contains(directory) for i in source_indexes):
+            source_indexes.append(SourceIndex(directory))
+    return source_indexes
+
 @click.command('batch')
 @click.option('--debug', default=False, is_flag=True,
               help='Show more verbose debug output.')
@@ -94,6 +313,7 @@ def _batch(debug, dry_run):
     constants.dry_run = dry_run
     plugins = Plugins()
     plugins.run_batch()
+    plugins.write_summary()
        
 
 @click.command('import')
@@ -120,65 +340,299 @@ def _batch(debug, dry_run):
               help='Show what would be done without making any changes.')
 @click.option('--exclude-regex', default=set(), multiple=True,
               help='Regular expression for directories or files to exclude.')
+@click.option('--resume', default=False, is_flag=True,
+              help='Resume an interrupted import using its journal.')
+@click.option('--profile', default=False, is_flag=True,
+              help='Show how long each stage of the import took.')
+@click.option('--profile-out', type=click.Path(dir_okay=False),
+              help='Write how long each stage of the import took as JSON.')
+@click.option('--progress', type=click.Choice(PROGRESS_MODES),
+              help='Show progress as dots, a bar or JSON lines.')
+@click.option('--progress-fd', type=int,
+              help='Write progress to this file descriptor instead of stderr.')
+@click.option('--report', type=click.Path(dir_okay=False),
+              help='Write the status of every file to this CSV or JSON Lines file.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='Keep Prometheus metrics up to date in this file.')
 @click.argument('paths', nargs=-1, type=click.Path())
-def _import(destination, source, file, album_from_folder, trash, allow_duplicates, location, time, debug, dry_run, exclude_regex, paths):
+def _import(destination, source, file, album_from_folder, trash, allow_duplicates, location, time, debug, dry_run, exclude_regex, resume, profile, profile_out, progress, progress_fd, report, metrics_file, paths):
     """Import files or directories by reading their EXIF and organizing them accordingly.
     """
     constants.debug = debug
     constants.dry_run = dry_run
+    # JSON progress includes the time each file spent in each stage.
+    constants.profile = (profile or profile_out is not None or
+                         progress == 'json')
     has_errors = False
-    result = Result()
+    result = Result(report)
+    exporter = metrics.Exporter(metrics_file).start()
 
     destination = _decode(destination)
     destination = os.path.abspath(os.path.expanduser(destination))
 
-    files = set()
-    paths = set(paths)
-    if source:
-        source = _decode(source)
-        paths.add(source)
-    if file:
-        paths.add(file)
-
-    # if no exclude list was passed in we check if there's a config
-    if len(exclude_regex) == 0:
-        config = load_config()
-        if 'Exclusions' in config:
-            exclude_regex = [value for key, value in config.items('Exclusions')]
-
-    exclude_regex_list = set(exclude_regex)
-
-    for path in paths:
-        path = os.path.expanduser(path)
-        if os.path.isdir(path):
-            files.update(FILESYSTEM.get_all_files(path, None, exclude_regex_list))
-        else:
-            if not FILESYSTEM.should_exclude(path, exclude_regex_list, True):
-                files.add(path)
+    files = get_files_to_import(source, file, paths, exclude_regex)
 
     # Share a single Db instance across the whole import batch.
     # This avoids re-reading hash.json / location.json from disk for every
     # file and allows us to batch the writes instead of flushing after each
     # individual file (a major bottleneck at 30-50k files).
     db = Db()
+
+    # Every file is journaled before and after it's imported. When resuming
+    #  we replay the journal which cleans up partially imported files and
+    #  tells us which files we can skip without touching them.
+    journal = Journal(destination=destination)
+    completed = set()
+    if resume:
+        completed = journal.replay(db)
+    journal.open(resume=resume)
+
+    # Each source directory keeps an index of the files imported from it.
+    # Files which haven't changed since they were imported are known to be
+    #  duplicates and are skipped without being read. The index doesn't
+    #  know which options a file was imported with so it's not used when
+    #  they change what's imported.
+    source_indexes = []
+    if not (allow_duplicates or album_from_folder or location or time):
+        source_indexes = get_source_indexes(source, paths)
+
+    # Files are found as they're imported so the total isn't known up
+    #  front. The source indexes give an estimate until the files have been
+    #  counted in the background.
+    estimate = sum(len(this_index.index) for this_index in source_indexes)
+    progress = get_progress(progress, progress_fd)
+    progress.start(estimate or None)
+    progress.count(get_files_to_import(source, file, paths, exclude_regex))
+    for current_file, status, dest_path in import_files(
+            files, destination, album_from_folder, trash, allow_duplicates,
+            location, time, db=db, journal=journal,
+            source_indexes=source_indexes, completed=completed,
+            progress=progress):
+        result.append((current_file, status))
+        progress.file_finished(current_file, status, dest_path)
+        has_errors = has_errors is True or status is not True
+    progress.finish()
+
+    # The import ran to completion so there's nothing left to resume.
+    journal.close(remove=True)
+    exporter.stop()
+
+    result.write()
+    FILESYSTEM.plugins.write_summary()
+    if profile:
+        timing.write()
+    if profile_out:
+        timing.write_json(profile_out)
+
+    if has_errors:
+        sys.exit(1)
+
+
+@click.command('watch')
+@click.option('--destination', type=click.Path(file_okay=False),
+              required=True, help='Copy imported files into this directory.')
+@click.option('--source', type=click.Path(file_okay=False, exists=True),
+              required=True, multiple=True,
+              help='Watch this directory for new files.')
+@click.option('--album-from-folder', default=False, is_flag=True,
+              help="Use images' folders as their album names.")
+@click.option('--trash', default=False, is_flag=True,
+              help='After copying files, move the old files to the trash.')
+@click.option('--allow-duplicates', default=False, is_flag=True,
+              help='Import the file even if it\'s already been imported.')
+@click.option('--quiet-period', type=float, default=2.0,
+              help=('Seconds a file must be left untouched after it was '
+                    'written before it is imported.'))
+@click.option('--poll', default=False, is_flag=True,
+              help='Poll for changes instead of using inotify.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Show more verbose debug output.')
+@click.option('--dry-run', default=False, is_flag=True,
+              help='Show what would be done without making any changes.')
+@click.option('--exclude-regex', default=set(), multiple=True,
+              help='Regular expression for directories or files to exclude.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='Keep Prometheus metrics up to date in this file.')
+def _watch(destination, source, album_from_folder, trash, allow_duplicates, quiet_period, poll, debug, dry_run, exclude_regex, metrics_file):
+    """Watch directories and import new files as soon as they're written.
+    """
+    from elodie.watch import get_watcher, watch
+
+    constants.debug = debug
+    constants.dry_run = dry_run
+
+    destination = _decode(destination)
+    destination = os.path.abspath(os.path.expanduser(destination))
+    sources = [os.path.abspath(os.path.expanduser(_decode(s))) for s in source]
+
+    # Files copied into a watched directory would be picked up and imported
+    #  again.
+    real_destination = os.path.realpath(destination)
+    for this_source in sources:
+        real_source = os.path.realpath(this_source)
+        if real_destination == real_source or \
+                real_destination.startswith(real_source + os.sep):
+            log.all('Destination %s is inside the watched directory %s' %
+                    (destination, this_source))
+            sys.exit(1)
+
+    extensions = set()
+    for cls in get_all_subclasses(Base):
+        extensions.update(cls.extensions)
+    exclude_regex_list = [re.compile(r) for r in get_exclude_regex_list(exclude_regex)]
+
+    def should_import(path):
+        return os.path.splitext(path)[1][1:].lower() in extensions and \
+            not FILESYSTEM.should_exclude(path, exclude_regex_list, False)
+
+    # The Db and ExifTool stay alive for as long as we're watching so each
+    #  new file only costs what it takes to import it.
+    db = Db()
+    source_indexes = []
+    if not (allow_duplicates or album_from_folder):
+        source_indexes = get_source_indexes(None, sources)
+    # Nothing is printed but the result counts files for the metrics.
+    result = Result()
+
+    def import_ready_files(files):
+        written = []
+        for current_file in files:
+            source_index = None
+            for this_index in source_indexes:
+                if this_index.contains(current_file):
+                    source_index = this_index
+                    break
+
+            if source_index is not None:
+                unchanged = source_index.get_unchanged(current_file)
+                if unchanged is not None and os.path.isfile(unchanged[1]):
+                    log.info('%s already at %s.' % (current_file, unchanged[1]))
+                    result.append((current_file, None))  # duplicate
+                    continue
+
+            dest_path = import_file(current_file, destination,
+                                    album_from_folder, trash,
+                                    allow_duplicates, db=db,
+                                    source_index=source_index)
+            if dest_path:
+                written.append(dest_path)
+                result.append((current_file, True))
+            elif not allow_duplicates:
+                result.append((current_file, None))  # duplicate
+            else:
+                result.append((current_file, False))  # error
+
+        db.update_hash_db()
+        for this_index in source_indexes:
+            this_index.write()
+        commit_metadata_cache()
+        return written
+
+    watcher = get_watcher(sources, polling=poll)
+    exporter = metrics.Exporter(metrics_file).start()
+    log.all('Watching %s' % ', '.join(sources))
+    try:
+        watch(watcher, import_ready_files, quiet_period, should_import)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        exporter.stop()
+
+
+@click.command('plan')
+@click.option('--destination', type=click.Path(file_okay=False),
+              required=True, help='Copy imported files into this directory.')
+@click.option('--source', type=click.Path(file_okay=False),
+              help='Import files from this directory, if specified.')
+@click.option('--file', type=click.Path(dir_okay=False),
+              help='Import this file, if specified.')
+@click.option('--output', type=click.Path(dir_okay=False), required=True,
+              help='Write the plan to this file.')
+@click.option('--album-from-folder', default=False, is_flag=True,
+              help="Use images' folders as their album names.")
+@click.option('--allow-duplicates', default=False, is_flag=True,
+              help='Import the file even if it\'s already been imported.')
+@click.option('--workers', type=int, default=None,
+              help='Number of files to analyze in parallel.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Show more verbose debug output.')
+@click.option('--exclude-regex', default=set(), multiple=True,
+              help='Regular expression for directories or files to exclude.')
+@click.argument('paths', nargs=-1, type=click.Path())
+def _plan(destination, source, file, output, album_from_folder, allow_duplicates, workers, debug, exclude_regex, paths):
+    """Plan an import without modifying any files. The plan is written as JSON Lines and can be run with the apply command.
+    """
+    from elodie.plan import Plan
+
+    constants.debug = debug
+    has_errors = False
+    result = Result()
+
+    destination = _decode(destination)
+    destination = os.path.abspath(os.path.expanduser(destination))
+
+    files = get_files_to_import(source, file, paths, exclude_regex)
+
+    planner = Plan(FILESYSTEM, Db(), workers)
+    with open(output, 'w') as f:
+        for record in planner.plan(files, destination, album_from_folder,
+                                   allow_duplicates):
+            f.write(dumps(record) + '\n')
+            if record['status'] == Plan.IMPORT:
+                log.all('%s -> %s' % (record['source'], record['destination']))
+                result.append((record['source'], True))
+            elif record['status'] == Plan.DUPLICATE:
+                result.append((record['source'], None))
+            else:
+                log.warn('%s: %s' % (record['source'], record['error']))
+                result.append((record['source'], False))
+                has_errors = True
+
+    result.write()
+
+    if has_errors:
+        sys.exit(1)
+
+
+@click.command('apply')
+@click.option('--trash', default=False, is_flag=True,
+              help='After copying files, move the old files to the trash.')
+@click.option('--workers', type=int, default=None,
+              help='Number of files to copy in parallel.')
+@click.option('--debug', default=False, is_flag=True,
+              help='Show more verbose debug output.')
+@click.option('--dry-run', default=False, is_flag=True,
+              help='Show what would be done without making any changes.')
+@click.argument('plan_file', type=click.Path(dir_okay=False, exists=True))
+def _apply(trash, workers, debug, dry_run, plan_file):
+    """Apply a plan created by the plan command. Files are copied and tagged without reading their metadata again.
+    """
+    from elodie.plan import Plan
+
+    constants.debug = debug
+    constants.dry_run = dry_run
+    has_errors = False
+    result = Result()
+
+    db = Db()
+    planner = Plan(FILESYSTEM, db, workers)
     files_imported = 0
-    for current_file in files:
-        dest_path = import_file(current_file, destination, album_from_folder,
-                    trash, allow_duplicates, location, time, db=db)
-        if dest_path:
-            result.append((current_file, True))
-            files_imported += 1
-            # Flush to disk every 100 successfully imported files so that
-            # partial progress is preserved if the process is interrupted.
-            if files_imported % 100 == 0:
-                db.update_hash_db()
-        elif not allow_duplicates:
-            result.append((current_file, None))  # duplicate
-        else:
-            result.append((current_file, False))  # error
-        has_errors = has_errors is True or not dest_path
+    with open(plan_file, 'r') as f:
+        records = (loads(line) for line in f if line.strip())
+        for record, dest_path in planner.apply(records, trash):
+            if dest_path:
+                log.all('%s -> %s' % (record['source'], dest_path))
+                result.append((record['source'], True))
+                files_imported += 1
+                if files_imported % 100 == 0:
+                    db.update_hash_db()
+            elif record['status'] == Plan.DUPLICATE:
+                result.append((record['source'], None))
+            else:
+                result.append((record['source'], False))
+                has_errors = True
 
-    # Final flush for any remaining entries.
     db.update_hash_db()
 
     result.write()
@@ -192,7 +646,11 @@ def _import(destination, source, file, album_from_folder, trash, allow_duplicate
               required=True, help='Source of your photo library.')
 @click.option('--debug', default=False, is_flag=True,
               help='Show more verbose debug output.')
-def _generate_db(source, debug):
+@click.option('--progress', type=click.Choice(PROGRESS_MODES), default='dots',
+              help='Show progress as dots, a bar or JSON lines.')
+@click.option('--progress-fd', type=int,
+              help='Write progress to this file descriptor instead of stderr.')
+def _generate_db(source, debug, progress, progress_fd):
     """Regenerate the hash.json database which contains all of the sha256 signatures of media files. The hash.json file is located at ~/.elodie/.
     """
     constants.debug = debug
@@ -207,40 +665,61 @@ def _generate_db(source, debug):
     db.backup_hash_db()
     db.reset_hash_db()
 
+    progress = get_progress(progress, progress_fd)
+    progress.start()
     for current_file in FILESYSTEM.get_all_files(source):
+        progress.file_started(current_file)
         result.append((current_file, True))
         db.add_hash(db.checksum(current_file), current_file)
-        log.progress()
+        progress.file_finished(current_file, True)
     
     db.update_hash_db()
-    log.progress('', True)
+    progress.finish()
     result.write()
 
+def verify_files(db):
+    """Check that every file in the hash db exists and matches its checksum.
+
+    :returns: generator of tuple(str, bool)
+    """
+    for checksum, file_path in db.all():
+        if not os.path.isfile(file_path):
+            yield (file_path, False)
+            continue
+
+        yield (file_path, checksum == db.checksum(file_path))
+
 @click.command('verify')
 @click.option('--debug', default=False, is_flag=True,
               help='Show more verbose debug output.')
-def _verify(debug):
+@click.option('--progress', type=click.Choice(PROGRESS_MODES), default='dots',
+              help='Show progress as dots, a bar or JSON lines.')
+@click.option('--progress-fd', type=int,
+              help='Write progress to this file descriptor instead of stderr.')
+@click.option('--report', type=click.Path(dir_okay=False),
+              help='Write the status of every file to this CSV or JSON Lines file.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='Keep Prometheus metrics up to date in this file.')
+def _verify(debug, progress, progress_fd, report, metrics_file):
     constants.debug = debug
-    result = Result()
+    result = Result(report)
+    exporter = metrics.Exporter(metrics_file).start()
     db = Db()
-    for checksum, file_path in db.all():
-        if not os.path.isfile(file_path):
-            result.append((file_path, False))
-            log.progress('x')
-            continue
+    progress = get_progress(progress, progress_fd)
+    progress.start(len(db.hash_db))
+    for file_path, status in verify_files(db):
+        result.append((file_path, status))
+        progress.file_finished(file_path, status)
 
-        actual_checksum = db.checksum(file_path)
-        if checksum == actual_checksum:
-            result.append((file_path, True))
-            log.progress()
-        else:
-            result.append((file_path, False))
-            log.progress('x')
-
-    log.progress('', True)
+    progress.finish()
+    exporter.stop()
     result.write()
 
 
+#: Number of files whose tags `update` writes at once.
+UPDATE_BATCH_SIZE = 1000
+
+
 def update_location(media, file_path, location_name):
     """Update location exif metadata of media.
     """
@@ -258,8 +737,10 @@ def update_location(media, file_path, location_name):
     return True
 
 
-def update_time(media, file_path, time_string):
-    """Update time exif metadata of media.
+def parse_update_time(file_path, time_string):
+    """Parse the time to update files with.
+
+    :returns: datetime
     """
     time_format = '%Y-%m-%d %H:%M:%S'
     if re.match(r'^\d{4}-\d{2}-\d{2}$', time_string):
@@ -270,11 +751,169 @@ def update_time(media, file_path, time_string):
         log.all('{"source":"%s", "error_msg":"%s"}' % (file_path, msg))
         sys.exit(1)
 
-    time = datetime.strptime(time_string, time_format)
+    return datetime.strptime(time_string, time_format)
+
+
+def update_time(media, file_path, time_string):
+    """Update time exif metadata of media.
+    """
+    time = parse_update_time(file_path, time_string)
     media.set_date_taken(time)
     return True
 
 
+def get_files_to_update(paths):
+    """Get the set of files passed in to be updated.
+
+    :returns: set(str)
+    """
+    files = set()
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            files.update(FILESYSTEM.get_all_files(path, None))
+        else:
+            files.add(path)
+    return files
+
+
+def update_file(current_file, media, album, location, time, title, db=None):
+    """Update a file's EXIF and move it to match its new metadata.
+
+    :param str current_file: Path of the file in the library.
+    :param media: Media object for the file.
+    :param db: Optional shared Db. The caller is responsible for writing it
+        to disk.
+    :returns: str destination path, None if the file could not be moved or
+        False if there was nothing to update.
+    """
+    return update_files([(current_file, media)], album, location, time,
+                        title, db=db)[0]
+
+
+def update_files(medias, album, location, time, title, db=None):
+    """Update the EXIF of several files and move them to match their new
+    metadata.
+
+    The tags of every file except text files are written with a single call
+    to :meth:`~elodie.media.media.Media.set_tags_batch`, so files which get
+    the same tags are written by one exiftool command instead of one each.
+
+    :param list medias: tuple(str, media) of the path of each file in the
+        library and its media object.
+    :param db: Optional shared Db. The caller is responsible for writing it
+        to disk.
+    :returns: list with what :func:`update_file` returns for each file in
+        the same order.
+    """
+    if not (location or time or album or title):
+        return [False] * len(medias)
+
+    coordinates = {}
+    if location:
+        location_coords = geolocation.coordinates_by_name(location)
+        if location_coords and 'latitude' in location_coords and \
+                'longitude' in location_coords:
+            coordinates = {'latitude': location_coords['latitude'],
+                           'longitude': location_coords['longitude']}
+    date_taken = None
+    if time and medias:
+        date_taken = parse_update_time(medias[0][0], time)
+
+    # Updating a title can be problematic when doing it 2+ times on a file.
+    # You would end up with img_001.jpg -> img_001-first-title.jpg ->
+    # img_001-first-title-second-title.jpg.
+    # To resolve that we have to track the prior title (if there was one.
+    # Then we massage the updated_media's metadata['base_name'] to remove
+    # the old title.
+    # Since FileSystem.get_file_name() relies on base_name it will properly
+    #  rename the file by updating the title instead of appending it.
+    # So we read the metadata before making any changes.
+    metadatas = [None] * len(medias)
+    if title:
+        Media.prefetch_metadata([media for _, media in medias])
+        metadatas = [media.get_metadata() for _, media in medias]
+
+    statuses = [None] * len(medias)
+    tags_by_media = []
+    positions = []
+    for i, (current_file, media) in enumerate(medias):
+        if isinstance(media, Media):
+            tags = {}
+            if media.is_valid():
+                tags = media.get_tags(album=album, title=title,
+                                      date_taken=date_taken, **coordinates)
+            if tags:
+                tags_by_media.append((media, tags))
+                positions.append(i)
+            continue
+
+        # Text files are written one at a time.
+        if location:
+            update_location(media, current_file, location)
+        if time:
+            update_time(media, current_file, time)
+        if album:
+            media.set_album(album)
+        if title:
+            statuses[i] = media.set_title(title)
+
+    for i, status in zip(positions, Media.set_tags_batch(tags_by_media)):
+        statuses[i] = status
+
+    updated_medias = [Media.get_class_by_file(current_file,
+                                              get_all_subclasses())
+                      for current_file, _ in medias]
+    Media.prefetch_metadata(updated_medias)
+
+    dest_paths = []
+    for (current_file, media), metadata, status, updated_media in zip(
+            medias, metadatas, statuses, updated_medias):
+        if isinstance(media, Media) and status is False:
+            log.error('Failed to update %s' % current_file)
+            log.all('{"source":"%s", "error_msg":"Failed to update tags"}' %
+                    current_file)
+            dest_paths.append(None)
+            continue
+
+        # See comments above on why we have to do this when titles
+        # get updated.
+        if title and status and metadata is not None and metadata['title']:
+            # @TODO: We should move this to a shared method since
+            # FileSystem.get_file_name() does it too.
+            original_title = re.sub(r'\W+', '-', metadata['title'].lower())
+            if len(original_title) > 0:
+                updated_media.get_metadata()
+                updated_media.set_metadata_basename(
+                    metadata['base_name'].replace('-%s' % original_title, ''))
+
+        # The destination folder structure could contain any number of
+        #  levels so we calculate that and traverse up the tree.
+        # '/path/to/file/photo.jpg' -> '/path/to/file' ->
+        #  ['path','to','file'] -> ['path','to'] -> '/path/to'
+        current_directory = os.path.dirname(current_file)
+        destination_depth = -1 * len(FILESYSTEM.get_folder_path_definition())
+        destination = os.sep.join(
+                          os.path.normpath(
+                              current_directory
+                          ).split(os.sep)[:destination_depth]
+                      )
+
+        dest_path = FILESYSTEM.process_file(current_file, destination,
+            updated_media, move=True, allowDuplicate=True, db=db)
+        log.info(u'%s -> %s' % (current_file, dest_path))
+        log.all('{"source":"%s", "destination":"%s"}' % (current_file,
+                                                           dest_path))
+        # If the folder we moved the file out of or its parent are empty
+        # we delete it.
+        FILESYSTEM.delete_directory_if_empty(os.path.dirname(current_file))
+        FILESYSTEM.delete_directory_if_empty(
+            os.path.dirname(os.path.dirname(current_file)))
+        dest_paths.append(dest_path)
+
+    return dest_paths
+
+
 @click.command('update')
 @click.option('--album', help='Update the image album.')
 @click.option('--location', help=('Update the image location. Location '
@@ -297,14 +936,9 @@ def _update(album, location, time, title, paths, debug, dry_run):
     has_errors = False
     result = Result()
 
-    files = set()
-    for path in paths:
-        path = os.path.expanduser(path)
-        if os.path.isdir(path):
-            files.update(FILESYSTEM.get_all_files(path, None))
-        else:
-            files.add(path)
+    files = get_files_to_update(paths)
 
+    medias = []
     for current_file in files:
         if not os.path.exists(current_file):
             has_errors = True
@@ -316,81 +950,24 @@ def _update(album, location, time, title, paths, debug, dry_run):
 
         current_file = os.path.expanduser(current_file)
 
-        # The destination folder structure could contain any number of levels
-        #  So we calculate that and traverse up the tree.
-        # '/path/to/file/photo.jpg' -> '/path/to/file' ->
-        #  ['path','to','file'] -> ['path','to'] -> '/path/to'
-        current_directory = os.path.dirname(current_file)
-        destination_depth = -1 * len(FILESYSTEM.get_folder_path_definition())
-        destination = os.sep.join(
-                          os.path.normpath(
-                              current_directory
-                          ).split(os.sep)[:destination_depth]
-                      )
-
         media = Media.get_class_by_file(current_file, get_all_subclasses())
         if not media:
             continue
 
-        updated = False
-        if location:
-            update_location(media, current_file, location)
-            updated = True
-        if time:
-            update_time(media, current_file, time)
-            updated = True
-        if album:
-            media.set_album(album)
-            updated = True
-
-        # Updating a title can be problematic when doing it 2+ times on a file.
-        # You would end up with img_001.jpg -> img_001-first-title.jpg ->
-        # img_001-first-title-second-title.jpg.
-        # To resolve that we have to track the prior title (if there was one.
-        # Then we massage the updated_media's metadata['base_name'] to remove
-        # the old title.
-        # Since FileSystem.get_file_name() relies on base_name it will properly
-        #  rename the file by updating the title instead of appending it.
-        remove_old_title_from_name = False
-        if title:
-            # We call get_metadata() to cache it before making any changes
-            metadata = media.get_metadata()
-            title_update_status = media.set_title(title)
-            original_title = metadata['title']
-            if title_update_status and original_title:
-                # @TODO: We should move this to a shared method since
-                # FileSystem.get_file_name() does it too.
-                original_title = re.sub(r'\W+', '-', original_title.lower())
-                original_base_name = metadata['base_name']
-                remove_old_title_from_name = True
-            updated = True
-
-        if updated:
-            updated_media = Media.get_class_by_file(current_file,
-                                                    get_all_subclasses())
-            # See comments above on why we have to do this when titles
-            # get updated.
-            if remove_old_title_from_name and len(original_title) > 0:
-                updated_media.get_metadata()
-                updated_media.set_metadata_basename(
-                    original_base_name.replace('-%s' % original_title, ''))
-
-            dest_path = FILESYSTEM.process_file(current_file, destination,
-                updated_media, move=True, allowDuplicate=True)
-            log.info(u'%s -> %s' % (current_file, dest_path))
-            log.all('{"source":"%s", "destination":"%s"}' % (current_file,
-                                                               dest_path))
-            # If the folder we moved the file out of or its parent are empty
-            # we delete it.
-            FILESYSTEM.delete_directory_if_empty(os.path.dirname(current_file))
-            FILESYSTEM.delete_directory_if_empty(
-                os.path.dirname(os.path.dirname(current_file)))
-            result.append((current_file, bool(dest_path)))
-            # Trip has_errors to False if it's already False or dest_path is.
-            has_errors = has_errors is True or not dest_path
-        else:
-            has_errors = False
-            result.append((current_file, False))
+        medias.append((current_file, media))
+
+    # Tags are written to a batch of files at a time.
+    for start in range(0, len(medias), UPDATE_BATCH_SIZE):
+        batch = medias[start:start + UPDATE_BATCH_SIZE]
+        dest_paths = update_files(batch, album, location, time, title)
+        for (current_file, media), dest_path in zip(batch, dest_paths):
+            if dest_path is not False:
+                result.append((current_file, bool(dest_path)))
+                # Trip has_errors to False if it's already False or dest_path is.
+                has_errors = has_errors is True or not dest_path
+            else:
+                has_errors = False
+                result.append((current_file, False))
 
     result.write()
     
@@ -398,12 +975,176 @@ def _update(album, location, time, title, paths, debug, dry_run):
         sys.exit(1)
 
 
+#: Status of each file in progress events sent by `elodie serve`.
+SERVE_STATUS = {True: 'success', False: 'error', None: 'duplicate'}
+
+def serve_import(args, emit, db):
+    """Run an import job for `elodie serve`.
+
+    :param dict args: destination and any of source, file, paths,
+        album_from_folder, trash, allow_duplicates, location, time,
+        exclude_regex and resume.
+    :param emit: Function which sends a progress event.
+    :param db: The Db shared across jobs.
+    :returns: dict summary of the import.
+    """
+    allow_duplicates = args.get('allow_duplicates', False)
+    destination = os.path.abspath(os.path.expanduser(
+        _decode(args['destination'])))
+    source = args.get('source')
+    paths = args.get('paths', [])
+    files = get_files_to_import(source, args.get('file'), paths,
+                                args.get('exclude_regex', []))
+
+    journal = Journal(destination=destination)
+    completed = set()
+    if args.get('resume', False):
+        completed = journal.replay(db)
+    journal.open(resume=args.get('resume', False))
+
+    source_indexes = []
+    if not (allow_duplicates or args.get('album_from_folder', False) or
+            args.get('location') or args.get('time')):
+        source_indexes = get_source_indexes(source, paths)
+
+    result = Result()
+    for current_file, status, dest_path in import_files(
+            files, destination, args.get('album_from_folder', False),
+            args.get('trash', False), allow_duplicates,
+            args.get('location'), args.get('time'), db=db, journal=journal,
+            source_indexes=source_indexes, completed=completed):
+        result.append((current_file, status))
+        emit({'source': current_file, 'destination': dest_path,
+              'status': SERVE_STATUS[status]})
+
+    journal.close(remove=True)
+    return {'success': result.success, 'error': result.error,
+            'duplicate': result.duplicate}
+
+def serve_update(args, emit, db):
+    """Run an update job for `elodie serve`.
+
+    :param dict args: paths and any of album, location, time and title.
+    :param emit: Function which sends a progress event.
+    :param db: The Db shared across jobs.
+    :returns: dict summary of the update.
+    """
+    result = Result()
+    medias = []
+    for current_file in get_files_to_update(args.get('paths', [])):
+        media = None
+        if os.path.exists(current_file):
+            media = Media.get_class_by_file(current_file,
+                                            get_all_subclasses())
+        if media:
+            medias.append((current_file, media))
+            continue
+        result.append((current_file, False))
+        emit({'source': current_file, 'destination': None,
+              'status': SERVE_STATUS[False]})
+
+    for start in range(0, len(medias), UPDATE_BATCH_SIZE):
+        batch = medias[start:start + UPDATE_BATCH_SIZE]
+        dest_paths = update_files(batch, args.get('album'),
+                                  args.get('location'), args.get('time'),
+                                  args.get('title'), db=db)
+        for (current_file, media), dest_path in zip(batch, dest_paths):
+            status = bool(dest_path)
+            result.append((current_file, status))
+            emit({'source': current_file, 'destination': dest_path or None,
+                  'status': SERVE_STATUS[status]})
+
+    db.update_hash_db()
+    return {'success': result.success, 'error': result.error}
+
+def serve_verify(args, emit, db):
+    """Run a verify job for `elodie serve`.
+
+    :param dict args: Not used.
+    :param emit: Function which sends a progress event.
+    :param db: The Db shared across jobs.
+    :returns: dict summary of the verification.
+    """
+    result = Result()
+    for file_path, status in verify_files(db):
+        result.append((file_path, status))
+        emit({'source': file_path, 'status': SERVE_STATUS[status]})
+    return {'success': result.success, 'error': result.error}
+
+@click.command('serve')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              default=None, help=('Accept jobs on this Unix domain socket. '
+                                  'Defaults to ~/.elodie/elodie.sock.'))
+@click.option('--debug', default=False, is_flag=True,
+              help='Show more verbose debug output.')
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='Keep Prometheus metrics up to date in this file.')
+def _serve(socket_path, debug, metrics_file):
+    """Run as a service which accepts import, update and verify jobs over a Unix domain socket.
+    """
+    from elodie.server import Server
+
+    constants.debug = debug
+
+    # The hash db is only read from disk again if another process wrote
+    #  to it since the last job.
+    state = {'db': None, 'mtime': None}
+    def get_db():
+        mtime = None
+        if os.path.isfile(constants.hash_db()):
+            mtime = os.stat(constants.hash_db()).st_mtime_ns
+        if state['db'] is None or mtime != state['mtime']:
+            state['db'] = Db()
+            geolocation.set_db(state['db'])
+        return state['db']
+
+    def handler(job):
+        def run(args, emit):
+            constants.dry_run = args.get('dry_run', False)
+            db = get_db()
+            try:
+                return job(args, emit, db)
+            finally:
+                if constants.dry_run:
+                    # Dry runs change the Db in memory only.
+                    state['db'] = None
+                constants.dry_run = False
+                if os.path.isfile(constants.hash_db()):
+                    state['mtime'] = os.stat(constants.hash_db()).st_mtime_ns
+        return run
+
+    server = Server(socket_path)
+    server.add_handler('import', handler(serve_import))
+    server.add_handler('update', handler(serve_update))
+    server.add_handler('verify', handler(serve_verify))
+
+    try:
+        server.bind()
+    except OSError as e:
+        log.error(str(e))
+        sys.exit(1)
+
+    exporter = metrics.Exporter(metrics_file).start()
+    log.all('Listening on %s' % server.socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        exporter.stop()
+
+
 @click.group()
 def main():
     pass
 
 
 main.add_command(_import)
+main.add_command(_plan)
+main.add_command(_apply)
+main.add_command(_watch)
+main.add_command(_serve)
 main.add_command(_update)
 main.add_command(_generate_db)
 main.add_command(_verify)
@@ -416,5 +1157,8 @@ if __name__ == '__main__':
        u'-config',
         u'"{}"'.format(constants.exiftool_config)
     ]
-    with ExifTool(executable_=get_exiftool(), addedargs=exiftool_addedargs) as et:
+    # ExifTool is started the first time it's needed so commands which never
+    #  read metadata, like verify or --help, don't wait for it.
+    with ExifTool(executable_=get_exiftool(), addedargs=exiftool_addedargs,
+                  start_on_demand=True) as et:
         main()
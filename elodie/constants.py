@@ -2,6 +2,7 @@
 Settings used by Elodie.
 """
 
+from hashlib import sha1
 from os import environ, path
 from sys import version_info
 
@@ -11,6 +12,9 @@ debug = False
 #: If True, dry run mode - no changes will be made to files or databases.
 dry_run = False
 
+#: If True, the time spent in each stage of an import is recorded.
+profile = False
+
 #: Directory in which to store Elodie settings.
 def application_directory():
     """Get the application directory, checking environment variable each time."""
@@ -32,6 +36,38 @@ def location_db():
     """Get the location database path."""
     return '{}/location.json'.format(application_directory())
 
+#: File in which to store the state of files imported from a source directory.
+def source_index(source):
+    """Get the source index path for a source directory."""
+    digest = sha1(source.encode('utf-8', 'surrogateescape')).hexdigest()
+    return '{}/sources/{}.json'.format(application_directory(), digest)
+
+#: File in which to cache the metadata read from files.
+def metadata_cache():
+    """Get the metadata cache path."""
+    return '{}/metadata.sqlite'.format(application_directory())
+
+#: File in which to journal imports so that they can be resumed.
+def import_journal(destination=None):
+    """Get the import journal path.
+
+    Imports into different destinations keep separate journals so they
+    don't overwrite each other's.
+
+    :param str destination: Directory files are imported into.
+    """
+    if destination is None:
+        return '{}/import-journal.jsonl'.format(application_directory())
+    digest = sha1(
+        path.abspath(destination).encode('utf-8', 'surrogateescape')
+    ).hexdigest()[:16]
+    return '{}/import-journal-{}.jsonl'.format(application_directory(), digest)
+
+#: Unix domain socket `elodie serve` accepts jobs on.
+def server_socket():
+    """Get the path of the server socket."""
+    return '{}/elodie.sock'.format(application_directory())
+
 #: Elodie installation directory.
 script_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
@@ -42,8 +42,10 @@ def verify_dependencies():
 
     :returns: bool
     """
+    # exiftool isn't needed if config.ini doesn't use it to read metadata.
+    from elodie.media.backend import get_backend_names
     exiftool = get_exiftool()
-    if exiftool is None:
+    if exiftool is None and 'exiftool' in get_backend_names():
         print(EXIFTOOL_ERROR, file=sys.stderr)
         return False
 
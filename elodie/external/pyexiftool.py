@@ -64,9 +64,14 @@ import json
 import warnings
 import logging
 import codecs
+import threading
+
+from time import perf_counter
 
 from future.utils import with_metaclass
 
+from elodie import metrics
+
 try:        # Py3k compatibility
     basestring
 except NameError:
@@ -173,12 +178,14 @@ class Singleton(type):
 class ExifTool(object, with_metaclass(Singleton)):
     """Run the `exiftool` command-line tool and communicate to it.
 
-    You can pass two arguments to the constructor:
+    You can pass three arguments to the constructor:
     - ``addedargs`` (list of strings): contains additional paramaters for
       the stay-open instance of exiftool
     - ``executable`` (string): file name of the ``exiftool`` executable.
       The default value ``exiftool`` will only work if the executable
       is in your ``PATH``
+    - ``start_on_demand`` (bool): start the subprocess the first time
+      :py:meth:`execute()` is called instead of raising ``ValueError``
 
     Most methods of this class are only available after calling
     :py:meth:`start()`, which will actually launch the subprocess.  To
@@ -209,7 +216,8 @@ class ExifTool(object, with_metaclass(Singleton)):
        associated with a running subprocess.
     """
 
-    def __init__(self, executable_=None, addedargs=None):
+    def __init__(self, executable_=None, addedargs=None,
+                 start_on_demand=False):
         
         if executable_ is None:
             self.executable = executable
@@ -224,6 +232,9 @@ class ExifTool(object, with_metaclass(Singleton)):
             raise TypeError("addedargs not a list of strings")
         
         self.running = False
+        self.start_on_demand = start_on_demand
+        # A single exiftool process can only serve one command at a time.
+        self._lock = threading.Lock()
 
     def start(self):
         """Start an ``exiftool`` process in batch mode for this instance.
@@ -261,7 +272,8 @@ class ExifTool(object, with_metaclass(Singleton)):
         self.running = False
 
     def __enter__(self):
-        self.start()
+        if not self.start_on_demand:
+            self.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -275,12 +287,14 @@ class ExifTool(object, with_metaclass(Singleton)):
 
         This method accepts any number of parameters and sends them to
         the attached ``exiftool`` process.  The process must be
-        running, otherwise ``ValueError`` is raised.  The final
+        running, otherwise ``ValueError`` is raised unless the instance
+        was created with ``start_on_demand``.  The final
         ``-execute`` necessary to actually run the batch is appended
         automatically; see the documentation of :py:meth:`start()` for
         the common options.  The ``exiftool`` output is read up to the
         end-of-output sentinel and returned as a raw ``bytes`` object,
-        excluding the sentinel.
+        excluding the sentinel.  Calls from multiple threads are
+        serialized since the process handles one command at a time.
 
         The parameters must also be raw ``bytes``, in whatever
         encoding exiftool accepts.  For filenames, this should be the
@@ -289,14 +303,20 @@ class ExifTool(object, with_metaclass(Singleton)):
         .. note:: This is considered a low-level method, and should
            rarely be needed by application developers.
         """
-        if not self.running:
-            raise ValueError("ExifTool instance not running.")
-        self._process.stdin.write(b"\n".join(params + (b"-execute\n",)))
-        self._process.stdin.flush()
-        output = b""
-        fd = self._process.stdout.fileno()
-        while not output[-32:].strip().endswith(sentinel):
-            output += os.read(fd, block_size)
+        with self._lock:
+            if not self.running:
+                if not self.start_on_demand:
+                    raise ValueError("ExifTool instance not running.")
+                self.start()
+            started = perf_counter()
+            self._process.stdin.write(b"\n".join(params + (b"-execute\n",)))
+            self._process.stdin.flush()
+            output = b""
+            fd = self._process.stdout.fileno()
+            while not output[-32:].strip().endswith(sentinel):
+                output += os.read(fd, block_size)
+            metrics.observe('elodie_exiftool_call_duration_seconds',
+                            perf_counter() - started)
         return output.strip()[:-len(sentinel)]
 
     def execute_json(self, *params):
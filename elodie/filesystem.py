@@ -10,17 +10,29 @@ import os
 import re
 import shutil
 import time
-from send2trash import send2trash
 
 from elodie import compatability
 from elodie import constants
 from elodie import geolocation
 from elodie import log
+from elodie import metrics
+from elodie import timing
 from elodie.config import load_config
 from elodie.localstorage import Db
+from elodie.media import sidecar
 from elodie.media.base import Base, get_all_subclasses
 from elodie.plugins.plugins import Plugins
 
+
+def send2trash(path):
+    """Move a file to the trash.
+
+    send2trash is imported the first time a file is trashed.
+    """
+    from send2trash import send2trash as _send2trash
+    _send2trash(path)
+
+
 class FileSystem(object):
     """A class for interacting with the file system."""
 
@@ -59,14 +71,18 @@ class FileSystem(object):
             return True  # Simulate success
         
         # Perform actual operation
-        if operation_type == 'move':
-            shutil.move(src, dst)
-        elif operation_type == 'copy':
-            compatability._copyfile(src, dst)
-        elif operation_type == 'remove':
-            os.remove(src)
-        elif operation_type == 'send2trash':
-            send2trash(src)
+        with timing.stage('file.%s' % operation_type):
+            if operation_type == 'move':
+                shutil.move(src, dst)
+            elif operation_type == 'copy':
+                compatability._copyfile(src, dst)
+            elif operation_type == 'remove':
+                os.remove(src)
+            elif operation_type == 'send2trash':
+                send2trash(src)
+        if operation_type in ('move', 'copy') and os.path.isfile(dst):
+            metrics.increment('elodie_bytes_copied_total',
+                              os.path.getsize(dst), operation=operation_type)
         return True
 
     def create_directory(self, directory_path):
@@ -506,7 +522,8 @@ class FileSystem(object):
 
         return folder_name
 
-    def process_checksum(self, _file, allow_duplicate, db=None):
+    def process_checksum(self, _file, allow_duplicate, db=None,
+                         source_index=None):
         if db is None:
             db = Db()
         checksum = db.checksum(_file)
@@ -526,6 +543,10 @@ class FileSystem(object):
                     _file,
                     checksum_file
                 ))
+                # Remember the duplicate so we don't have to checksum it
+                #  again the next time this source is imported.
+                if source_index is not None:
+                    source_index.add(_file, checksum, checksum_file)
                 return None
             else:
                 log.info('%s matched checksum but file not found at %s.' % (  # noqa
@@ -534,6 +555,7 @@ class FileSystem(object):
                 ))
         return checksum
 
+    @timing.timed('process_file')
     def process_file(self, _file, destination, media, **kwargs):
         move = False
         if('move' in kwargs):
@@ -551,19 +573,31 @@ class FileSystem(object):
         if db is None:
             db = Db()
 
-        stat_info_original = os.stat(_file)
-        metadata = media.get_metadata()
+        # An optional Journal records the file before anything is modified
+        #  and again once it's been imported so the import can be resumed.
+        journal = kwargs.get('journal', None)
+
+        # An optional SourceIndex for the directory _file is in. It records
+        #  the state of the file so unchanged files can be skipped next time.
+        source_index = kwargs.get('source_index', None)
 
+        stat_info_original = os.stat(_file)
         if(not media.is_valid()):
             print('%s is not a valid media file. Skipping...' % _file)
             return
 
-        checksum = self.process_checksum(_file, allow_duplicate, db=db)
+        # The checksum comes first so duplicates are skipped without reading
+        #  their metadata and the metadata cache can use a copy's metadata.
+        checksum = self.process_checksum(_file, allow_duplicate, db=db,
+                                         source_index=source_index)
         if(checksum is None):
             log.info('Original checksum returned None for %s. Skipping...' %
                      _file)
             return
 
+        with timing.stage('metadata.read'):
+            metadata = media.get_metadata(checksum=checksum)
+
         # Run `before()` for every loaded plugin and if any of them raise an exception
         #  then we skip importing the file and log a message.
         plugins_run_before_status = self.plugins.run_all_before(_file, destination)
@@ -571,19 +605,29 @@ class FileSystem(object):
             log.warn('At least one plugin pre-run failed for %s' % _file)
             return
 
-        directory_name = self.get_folder_path(metadata)
-        dest_directory = os.path.join(destination, directory_name)
-        file_name = self.get_file_name(metadata)
-        dest_path = os.path.join(dest_directory, file_name)        
-
-        media.set_original_name()
+        with timing.stage('destination'):
+            directory_name = self.get_folder_path(metadata)
+            dest_directory = os.path.join(destination, directory_name)
+            file_name = self.get_file_name(metadata)
+            dest_path = os.path.join(dest_directory, file_name)
 
         # If source and destination are identical then
         #  we should not write the file. gh-210
+        # This is checked before journaling so a resumed import never
+        #  cleans up the source as if it was a partial copy.
         if(_file == dest_path):
             print('Final source and destination path should not be identical')
             return
 
+        if journal is not None:
+            journal.plan(_file, checksum, dest_path)
+
+        source_sidecar = sidecar.get_sidecar_path(_file)
+        source_sidecar_existed = os.path.isfile(source_sidecar)
+
+        with timing.stage('metadata.write'):
+            media.set_original_name()
+
         self.create_directory(dest_directory)
 
         # exiftool renames the original file by appending '_original' to the
@@ -629,6 +673,16 @@ class FileSystem(object):
                 print(f"[DRY-RUN] Would set utime for: {_file}")
                 print(f"[DRY-RUN] Would set utime from metadata for: {dest_path}")
 
+        # Media which uses sidecars has its tags in the sidecar so the sidecar
+        #  goes wherever the file goes. A sidecar which was only created
+        #  while importing is moved even when copying.
+        if os.path.isfile(source_sidecar):
+            sidecar_operation = 'copy'
+            if move is True or not source_sidecar_existed:
+                sidecar_operation = 'move'
+            self._file_operation(sidecar_operation, source_sidecar,
+                                 sidecar.get_sidecar_path(dest_path))
+
         db.add_hash(checksum, dest_path)
         # Only flush to disk if we own the Db instance. When the caller passes
         # a shared instance they control when the write happens (allowing batch
@@ -636,6 +690,15 @@ class FileSystem(object):
         if _db_owned:
             db.update_hash_db()
 
+        if journal is not None:
+            journal.complete(_file, checksum, dest_path)
+
+        # The source file is left in place when copying. We record it after
+        #  its original file and times have been restored.
+        if source_index is not None and move is False and \
+                not constants.dry_run:
+            source_index.add(_file, checksum, dest_path)
+
         # Run `after()` for every loaded plugin and if any of them raise an exception
         #  then we skip importing the file and log a message.
         plugins_run_after_status = self.plugins.run_all_after(_file, destination, dest_path, metadata)
@@ -646,8 +709,16 @@ class FileSystem(object):
 
         return dest_path
 
-    def set_utime_from_metadata(self, metadata, file_path):
-        """ Set the modification time on the file based on the file name.
+    def get_utime_from_metadata(self, metadata):
+        """Get the modification time a file should have based on its metadata.
+
+        If the file name follows a time format of
+        YYYY-MM-DD_HH-MM-SS-IMG_0001.JPG then that takes precedence over the
+        date taken.
+
+        :param dict metadata: Metadata dictionary.
+        :returns: tuple(float, bool) of seconds since epoch and whether it
+            was parsed from the file name.
         """
 
         # Initialize date taken to what's returned from the metadata function.
@@ -665,19 +736,24 @@ class FileSystem(object):
                 '{}-{}-{} {}:{}:{}'.format(year, month, day, hour, minute, second),  # noqa
                 '%Y-%m-%d %H:%M:%S'
             )
+            return (time.mktime(date_taken), True)
 
-            if not constants.dry_run:
-                os.utime(file_path, (time.time(), time.mktime(date_taken)))
-            else:
-                print(f"[DRY-RUN] Would set utime from date pattern for: {file_path}")
+        # We don't make any assumptions about time zones and
+        # assume local time zone.
+        return (time.mktime(date_taken), False)
+
+    def set_utime_from_metadata(self, metadata, file_path):
+        """ Set the modification time on the file based on the file name.
+        """
+        date_taken_in_seconds, from_file_name = self.get_utime_from_metadata(
+            metadata
+        )
+        if not constants.dry_run:
+            os.utime(file_path, (time.time(), date_taken_in_seconds))
+        elif from_file_name:
+            print(f"[DRY-RUN] Would set utime from date pattern for: {file_path}")
         else:
-            # We don't make any assumptions about time zones and
-            # assume local time zone.
-            date_taken_in_seconds = time.mktime(date_taken)
-            if not constants.dry_run:
-                os.utime(file_path, (time.time(), (date_taken_in_seconds)))
-            else:
-                print(f"[DRY-RUN] Would set utime from metadata for: {file_path}")
+            print(f"[DRY-RUN] Would set utime from metadata for: {file_path}")
 
     def should_exclude(self, path, regex_list=set(), needs_compiled=False):
         if(len(regex_list) == 0):
@@ -4,14 +4,13 @@ from __future__ import division
 
 from os import path
 
-import requests
-import urllib.request
 import urllib.parse
-import urllib.error
 
 from elodie.config import load_config
 from elodie import constants
 from elodie import log
+from elodie import metrics
+from elodie import timing
 from elodie.localstorage import Db
 from elodie.external.pyexiftool import ExifTool
 
@@ -19,11 +18,35 @@ __KEY__ = None
 __DEFAULT_LOCATION__ = 'Unknown Location'
 __PREFER_ENGLISH_NAMES__ = None
 __EXIFTOOL_AVAILABLE__ = None
+__DB__ = None
+
+
+def get_db():
+    """Get the Db used to cache locations.
+
+    Unless a long running process called set_db() the cache is read from
+    disk each time.
+
+    :returns: :class:`~elodie.localstorage.Db`
+    """
+    if __DB__ is not None:
+        return __DB__
+    return Db()
+
+
+def set_db(db):
+    """Keep using the given Db to cache locations instead of reading the
+    cache from disk for every lookup.
+
+    :param db: Db to use or None to read from disk again.
+    """
+    global __DB__
+    __DB__ = db
 
 
 def coordinates_by_name(name):
     # Try to get cached location first
-    db = Db()
+    db = get_db()
     cached_coordinates = db.get_location_coordinates(name)
     if(cached_coordinates is not None):
         return {
@@ -217,6 +240,7 @@ def get_prefer_english_names():
     __PREFER_ENGLISH_NAMES__ = bool(config['MapQuest']['prefer_english_names'])
     return __PREFER_ENGLISH_NAMES__
 
+@timing.timed('geolocation.place_name')
 def place_name(lat, lon):
     lookup_place_name_default = {'default': __DEFAULT_LOCATION__}
     if(lat is None or lon is None):
@@ -229,13 +253,15 @@ def place_name(lat, lon):
         lon = float(lon)
 
     # Try to get cached location first
-    db = Db()
+    db = get_db()
     # 3km distace radious for a match
     cached_place_name = db.get_location_name(lat, lon, 3000)
     # We check that it's a dict to coerce an upgrade of the location
     #  db from a string location to a dictionary. See gh-160.
     if(isinstance(cached_place_name, dict)):
+        metrics.increment('elodie_geocoder_cache_requests_total', result='hit')
         return cached_place_name
+    metrics.increment('elodie_geocoder_cache_requests_total', result='miss')
 
     lookup_place_name = {}
     
@@ -290,6 +316,9 @@ def lookup(**kwargs):
     if(key is None):
         return None
 
+    # requests is slow to import and only needed when we call MapQuest.
+    import requests
+
     try:
         headers = {}
         params = {'format': 'json', 'key': key}
@@ -0,0 +1,217 @@
+"""
+Write-ahead journal which makes long running imports resumable.
+
+Every file which is imported is written to the journal twice. Once with a
+`planned` phase before anything on disk is modified and once with a
+`completed` phase after the file has been copied and added to the hash db.
+If an import is interrupted the journal is replayed by
+`./elodie.py import --resume` which cleans up partially imported files and
+skips the ones which were completed.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+from builtins import object
+
+import os
+
+from json import dumps, loads
+
+from elodie import constants
+from elodie import log
+
+
+class Journal(object):
+    """An append-only journal stored as JSON Lines.
+
+    Each line is a JSON object in the form of
+    {"source": ..., "checksum": ..., "destination": ..., "phase": ...}.
+    Planned entries also record whether the destination `existed` before.
+
+    :param str journal_file: Path of the journal.
+    :param str destination: Directory files are imported into, used to pick
+        the journal of that destination if no journal_file is passed in.
+    """
+
+    PLANNED = 'planned'
+    COMPLETED = 'completed'
+
+    def __init__(self, journal_file=None, destination=None):
+        if journal_file is None:
+            journal_file = constants.import_journal(destination)
+        self.journal_file = journal_file
+        self.handle = None
+
+    def exists(self):
+        """Check whether a journal was left behind by a previous import.
+
+        :returns: bool
+        """
+        return os.path.isfile(self.journal_file) and \
+            os.path.getsize(self.journal_file) > 0
+
+    def open(self, resume=False):
+        """Open the journal for appending.
+
+        Unless we are resuming any existing journal is truncated.
+
+        :param bool resume: Keep existing entries and append to them.
+        """
+        if constants.dry_run:
+            return
+
+        if not resume and self.exists():
+            log.warn('Discarding import journal from a previous run at %s' %
+                     self.journal_file)
+
+        self.handle = open(self.journal_file, 'a' if resume else 'w')
+
+    def close(self, remove=False):
+        """Close the journal.
+
+        :param bool remove: Delete the journal file. This is done once an
+            import runs to completion since there's nothing left to resume.
+        """
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+        if remove and not constants.dry_run and \
+                os.path.isfile(self.journal_file):
+            os.remove(self.journal_file)
+
+    def plan(self, source, checksum, destination):
+        """Record that source is about to be imported to destination.
+
+        :param str source: Path of the file being imported.
+        :param str checksum: Checksum of the source file.
+        :param str destination: Final path of the imported file.
+        """
+        self._write(source, checksum, destination, self.PLANNED,
+                    existed=os.path.lexists(destination))
+
+    def complete(self, source, checksum, destination):
+        """Record that source was imported to destination.
+
+        :param str source: Path of the file being imported.
+        :param str checksum: Checksum of the source file.
+        :param str destination: Final path of the imported file.
+        """
+        self._write(source, checksum, destination, self.COMPLETED)
+
+    def entries(self):
+        """Generator over all entries in the journal.
+
+        A partially written last line (i.e. from a killed process) is
+        ignored.
+
+        :returns: generator of dict
+        """
+        if not os.path.isfile(self.journal_file):
+            return
+
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                except ValueError:
+                    log.warn('Skipping malformed journal entry: %s' % line)
+                    continue
+                yield entry
+
+    def replay(self, db):
+        """Replay the journal against the hash db and clean up partial work.
+
+        Completed entries are added to the hash db since they might not
+        have been flushed to disk. Entries which were planned but never
+        completed have their leftover files cleaned up so that they can be
+        imported again.
+
+        :param db: The Db instance used for the import.
+        :type db: :class:`~elodie.localstorage.Db`
+        :returns: set of source paths which were already imported.
+        """
+        last_entry = {}
+        for entry in self.entries():
+            last_entry[entry['source']] = entry
+
+        completed = set()
+        incomplete = []
+        for source, entry in last_entry.items():
+            if entry['phase'] == self.COMPLETED or self.was_moved(entry):
+                db.add_hash(entry['checksum'], entry['destination'])
+                completed.add(source)
+            else:
+                incomplete.append(entry)
+
+        if incomplete:
+            # Paths which the hash db knows about belong to previously
+            #  completed imports and must never be removed.
+            known_paths = set(db.hash_db.values())
+            for entry in incomplete:
+                self.cleanup(entry, known_paths)
+
+        return completed
+
+    def was_moved(self, entry):
+        """Check whether a planned import finished moving its file.
+
+        Files are only removed from the source once they were fully written
+        to the destination, so the destination is the only copy left.
+
+        :param dict entry: A planned journal entry.
+        :returns: bool
+        """
+        return not entry.get('existed', False) and \
+            not os.path.lexists(entry['source']) and \
+            os.path.isfile(entry['destination'])
+
+    def cleanup(self, entry, known_paths=set()):
+        """Undo the side effects of an import which never completed.
+
+        exiftool writes tags into the source file and keeps the untouched
+        file as `<source>_original`. If the process was killed before
+        FileSystem.process_file() restored it we move it back here. Any
+        destination file which was written is removed, unless it's the
+        source itself or it existed before the import was planned.
+
+        :param dict entry: A planned journal entry.
+        :param set known_paths: Destination paths present in the hash db.
+        """
+        source = entry['source']
+        destination = entry['destination']
+        exif_original_file = source + '_original'
+
+        if constants.dry_run:
+            print(f"[DRY-RUN] Would clean up incomplete import of {source}")
+            return
+
+        if os.path.isfile(exif_original_file):
+            os.replace(exif_original_file, source)
+            log.info('Restored %s from %s' % (source, exif_original_file))
+
+        if destination in known_paths or entry.get('existed', False) or \
+                os.path.abspath(destination) == os.path.abspath(source):
+            return
+
+        if os.path.isfile(destination):
+            os.remove(destination)
+            log.info('Removed partially imported file %s' % destination)
+
+    def _write(self, source, checksum, destination, phase, existed=None):
+        if self.handle is None:
+            return
+
+        entry = {
+            'source': source,
+            'checksum': checksum,
+            'destination': destination,
+            'phase': phase
+        }
+        if existed is not None:
+            entry['existed'] = existed
+        self.handle.write(dumps(entry) + '\n')
+        # The journal is only useful if it survives the process being killed
+        #  so we make sure each entry makes it to disk.
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
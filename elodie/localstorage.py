@@ -4,16 +4,24 @@ Methods for interacting with information Elodie caches about stored media.
 from builtins import map
 from builtins import object
 
+import atexit
 import hashlib
 import json
 import os
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
 
 from math import radians, cos, sqrt
 from shutil import copyfile
 from time import strftime
 
 from elodie import constants
+from elodie import metrics
+from elodie import timing
+from elodie.media.record import MediaRecord
 
 
 class Db(object):
@@ -41,6 +49,7 @@ class Db(object):
                 self.hash_db = json.load(f)
             except ValueError:
                 pass
+        metrics.set_gauge('elodie_hash_db_entries', len(self.hash_db))
 
         # If the location db doesn't exist we create it.
         # Otherwise we only open for reading
@@ -109,6 +118,7 @@ class Db(object):
         """
         return key in self.hash_db
 
+    @timing.timed('checksum')
     def checksum(self, file_path, blocksize=65536):
         """Create a hash value for the given file.
 
@@ -197,15 +207,386 @@ class Db(object):
     def update_hash_db(self):
         """Write the hash db to disk."""
         if constants.dry_run:
-            print(f"[DRY-RUN] Would update hash database with {len(self.hash_db)} entries")
+            print(f"[DRY-RUN] Would update hash database with "
+                  f"{len(self.hash_db)} entries")
             return
         with open(constants.hash_db(), 'w') as f:
             json.dump(self.hash_db, f)
+        metrics.set_gauge('elodie_hash_db_entries', len(self.hash_db))
 
     def update_location_db(self):
         """Write the location db to disk."""
         if constants.dry_run:
-            print(f"[DRY-RUN] Would update location database with {len(self.location_db)} entries")
+            print(f"[DRY-RUN] Would update location database with "
+                  f"{len(self.location_db)} entries")
             return
         with open(constants.location_db(), 'w') as f:
             json.dump(self.location_db, f)
+
+
+class SourceIndex(object):
+
+    """A class for interacting with the state Elodie keeps about a source.
+
+    Each directory which files are imported from has an index which maps
+    the files in it to their size, modification time, inode, checksum and
+    where they were imported to. When a file hasn't changed since it was
+    last seen we know it was already imported without having to read it.
+
+    :param str source: The directory files are imported from.
+    """
+
+    def __init__(self, source):
+        self.source = os.path.abspath(source)
+        self.index_file = constants.source_index(self.source)
+        self.index = {}
+        self.seen = set()
+
+        if os.path.isfile(self.index_file):
+            with open(self.index_file, 'r') as f:
+                try:
+                    self.index = json.load(f)
+                except ValueError:
+                    pass
+
+    def add(self, file_path, checksum, destination):
+        """Record the current state of a file and where it was imported to.
+
+        :param str file_path: Path to the file in the source directory.
+        :param str checksum: Checksum of the file.
+        :param str destination: Path the file was imported to.
+        """
+        stat = os.stat(file_path)
+        key = self._key(file_path)
+        self.index[key] = [
+            stat.st_size,
+            stat.st_mtime_ns,
+            stat.st_ino,
+            checksum,
+            destination
+        ]
+        self.seen.add(key)
+
+    def contains(self, file_path):
+        """Check whether a path belongs to this source.
+
+        :param str file_path:
+        :returns: bool
+        """
+        return os.path.abspath(file_path).startswith(self.source + os.sep)
+
+    def get_unchanged(self, file_path):
+        """Get the entry for a file if it hasn't changed since it was added.
+
+        Only the file is stat'ed. Its contents are not read.
+
+        :param str file_path: Path to the file in the source directory.
+        :returns: tuple(str, str) of checksum and destination, or None if
+            the file is new or has changed.
+        """
+        key = self._key(file_path)
+        if key not in self.index:
+            return None
+
+        self.seen.add(key)
+        size, mtime_ns, inode, checksum, destination = self.index[key]
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        if(
+            stat.st_size != size or
+            stat.st_mtime_ns != mtime_ns or
+            stat.st_ino != inode
+        ):
+            return None
+
+        return (checksum, destination)
+
+    def write(self, prune=False):
+        """Write the index to disk.
+
+        :param bool prune: Remove entries for files which weren't seen since
+            the index was loaded. Only do this after walking the whole source.
+        """
+        if prune:
+            self.index = {k: v for k, v in self.index.items()
+                          if k in self.seen}
+
+        if constants.dry_run:
+            print(f"[DRY-RUN] Would update source index with "
+                  f"{len(self.index)} entries")
+            return
+
+        index_directory = os.path.dirname(self.index_file)
+        if not os.path.exists(index_directory):
+            os.makedirs(index_directory)
+
+        # The index is replaced atomically so an interrupted write doesn't
+        #  leave it truncated.
+        fd, temporary_path = tempfile.mkstemp(dir=index_directory,
+                                              prefix='.source-index-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.index, f)
+            os.replace(temporary_path, self.index_file)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def _key(self, file_path):
+        return os.path.relpath(os.path.abspath(file_path), self.source)
+
+
+class MetadataCache(object):
+
+    """A class for interacting with the metadata Elodie has read from files.
+
+    The result of :meth:`~elodie.media.base.Base.get_metadata` is stored in
+    a SQLite database keyed by path along with the file's size and
+    modification time, and by checksum when it's known. Entries are used
+    while the file is unchanged so its metadata doesn't have to be read
+    again.
+
+    An entry can also be used for a copy of the file with the same checksum
+    if it's known whether the date taken came from the file system. If it
+    did, the date is taken from the copy instead.
+
+    :param str cache_file: Path of the database. Defaults to
+        :func:`~elodie.constants.metadata_cache`.
+    """
+
+    #: Version of the stored metadata. Entries from other versions are
+    #:  discarded.
+    VERSION = 2
+
+    #: Keys of the metadata which depend on the path of the file and are
+    #:  computed again when an entry is used.
+    PATH_KEYS = ('base_name', 'extension', 'directory_path')
+
+    #: Number of added entries which are committed together.
+    commit_every = 100
+
+    def __init__(self, cache_file=None):
+        if cache_file is None:
+            cache_file = constants.metadata_cache()
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+
+        directory = os.path.dirname(cache_file)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Media objects are read from the plan command's worker threads.
+        self.connection = sqlite3.connect(cache_file,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS metadata')
+            self.connection.execute('PRAGMA user_version=%d' % self.VERSION)
+        # date_from_file is 1 if date_taken came from the file system, 0 if
+        #  it came from the file's metadata and NULL if that isn't known.
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+            'checksum TEXT, date_from_file INTEGER, metadata TEXT)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS metadata_checksum '
+            'ON metadata (checksum)'
+        )
+        self.connection.commit()
+
+    def get(self, file_path, checksum=None):
+        """Get the metadata of a file if it hasn't changed since it was
+        added.
+
+        :param str file_path: Path to the file.
+        :param str checksum: Checksum of the file, if known. An entry for
+            another file with the same checksum is used if there's none for
+            this path.
+        :returns: :class:`~elodie.media.record.MediaRecord` or None
+        """
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        date_from_file = False
+        with self.lock:
+            row = self.get_pending(file_path, stat, checksum)
+            if row is None:
+                row = self.connection.execute(
+                    'SELECT metadata, 0 FROM metadata '
+                    'WHERE path = ? AND size = ? AND mtime_ns = ?',
+                    (file_path, stat.st_size, stat.st_mtime_ns)
+                ).fetchone()
+            if row is None and checksum is not None:
+                row = self.connection.execute(
+                    'SELECT metadata, date_from_file FROM metadata '
+                    'WHERE checksum = ? AND date_from_file IS NOT NULL '
+                    'LIMIT 1',
+                    (checksum,)
+                ).fetchone()
+            if row is not None:
+                date_from_file = row[1] == 1
+
+        if row is None:
+            metrics.increment('elodie_metadata_cache_requests_total',
+                              result='miss')
+            return None
+
+        metrics.increment('elodie_metadata_cache_requests_total',
+                          result='hit')
+        metadata = MediaRecord(json.loads(row[0]))
+        if date_from_file:
+            # The entry is for a copy of the file, which has its own dates.
+            seconds_since_epoch = min(stat.st_mtime, stat.st_ctime)
+            metadata['date_taken'] = None
+            if seconds_since_epoch != 0:
+                metadata['date_taken'] = time.gmtime(seconds_since_epoch)
+        elif metadata['date_taken'] is not None:
+            metadata['date_taken'] = time.struct_time(metadata['date_taken'])
+        metadata['base_name'] = os.path.splitext(
+            os.path.basename(file_path))[0]
+        metadata['extension'] = os.path.splitext(file_path)[1][1:].lower()
+        metadata['directory_path'] = os.path.dirname(file_path)
+        return metadata
+
+    def get_pending(self, file_path, stat, checksum):
+        """Get the stored metadata of a file from the entries which haven't
+        been committed yet. Must be called with the lock held.
+
+        :returns: tuple(str, int) of the metadata and whether its date has
+            to be taken from the file system, or None
+        """
+        entry = self.pending.get(file_path)
+        if entry is not None and \
+                entry[1:3] == (stat.st_size, stat.st_mtime_ns):
+            return (entry[5], 0)
+        if checksum is not None:
+            for entry in self.pending.values():
+                if entry[3] == checksum and entry[4] is not None:
+                    return (entry[5], entry[4])
+        return None
+
+    def add(self, file_path, metadata, checksum=None, date_from_file=None):
+        """Store the metadata of a file.
+
+        Entries are committed to the database in batches of
+        :attr:`commit_every`, when :meth:`commit` is called and when the
+        process exits.
+
+        :param str file_path: Path to the file.
+        :param dict metadata: Metadata as returned by
+            :meth:`~elodie.media.base.Base.get_metadata`.
+        :param str checksum: Checksum of the file, if known.
+        :param bool date_from_file: Whether date_taken came from the file
+            system instead of the file's metadata, if known. Entries are
+            only used for copies of the file when it's known.
+        """
+        if constants.dry_run:
+            return
+
+        file_path = os.path.abspath(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+
+        stored = dict((k, v) for k, v in metadata.items()
+                      if k not in self.PATH_KEYS)
+        if stored.get('date_taken') is not None:
+            stored['date_taken'] = list(stored['date_taken'])
+        if date_from_file is not None:
+            date_from_file = int(date_from_file)
+        with self.lock:
+            if checksum is None:
+                entry = self.pending.get(file_path)
+                if entry is not None and \
+                        entry[1:3] == (stat.st_size, stat.st_mtime_ns):
+                    checksum = entry[3]
+                else:
+                    row = self.connection.execute(
+                        'SELECT checksum FROM metadata '
+                        'WHERE path = ? AND size = ? AND mtime_ns = ?',
+                        (file_path, stat.st_size, stat.st_mtime_ns)
+                    ).fetchone()
+                    if row is not None:
+                        checksum = row[0]
+            self.pending[file_path] = (file_path, stat.st_size,
+                                       stat.st_mtime_ns, checksum,
+                                       date_from_file, json.dumps(stored))
+            if len(self.pending) >= self.commit_every:
+                self._commit()
+
+    def commit(self):
+        """Write the entries which were added since the last commit."""
+        with self.lock:
+            self._commit()
+
+    def _commit(self):
+        # Rows are only written here so the database isn't kept locked
+        #  between adds.
+        if not self.pending or self.closed:
+            return
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO metadata '
+            '(path, size, mtime_ns, checksum, date_from_file, metadata) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            list(self.pending.values())
+        )
+        self.connection.commit()
+        self.pending = {}
+
+    def remove(self, file_path):
+        """Forget the metadata of a file. Called whenever it's written to.
+
+        :param str file_path: Path to the file.
+        """
+        file_path = os.path.abspath(file_path)
+        with self.lock:
+            self.pending.pop(file_path, None)
+            self.connection.execute(
+                'DELETE FROM metadata WHERE path = ?',
+                (file_path,)
+            )
+            self.connection.commit()
+
+    def close(self):
+        """Commit any remaining entries and close the database."""
+        with self.lock:
+            self._commit()
+            self.closed = True
+            self.connection.close()
+
+
+__METADATA_CACHE__ = None
+
+
+def get_metadata_cache():
+    """Get the metadata cache for the current application directory.
+
+    :returns: :class:`MetadataCache`
+    """
+    global __METADATA_CACHE__
+    cache_file = constants.metadata_cache()
+    if __METADATA_CACHE__ is None or \
+            __METADATA_CACHE__.cache_file != cache_file:
+        commit_metadata_cache()
+        __METADATA_CACHE__ = MetadataCache(cache_file)
+    return __METADATA_CACHE__
+
+
+@atexit.register
+def commit_metadata_cache():
+    """Write the entries added to the metadata cache which weren't
+    committed yet."""
+    if __METADATA_CACHE__ is not None:
+        __METADATA_CACHE__.commit()
@@ -0,0 +1,401 @@
+"""
+The backend module decides how the metadata of media files is read and
+written.
+
+A :class:`MetadataBackend` reads and writes tags for a file using the same
+`Group:Tag` keys exiftool uses with `-G -n`. Backends are composed into a
+chain where the first backend which can handle a file is used, which is how
+JPEGs and MP4/MOVs are read natively while everything else falls back to
+exiftool. The chain is configured in the `[Metadata]` section of
+`config.ini`::
+
+    [Metadata]
+    backends=cache,native,exiftool
+
+`cache` and `memory` apply to the backends listed after them.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from builtins import object
+
+import os
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+from elodie.config import load_config
+from elodie.external.pyexiftool import ExifTool
+from elodie.media import native
+
+#: Backends used when `config.ini` doesn't configure any.
+DEFAULT_BACKENDS = 'native,exiftool'
+
+__BACKEND__ = None
+
+
+class MetadataBackend(object):
+    """Read and write the metadata of media files.
+
+    :meth:`read` and :meth:`write` return None for files the backend can't
+    handle so the next backend in a chain is tried.
+    """
+
+    #: Name of the backend in `config.ini`.
+    name = None
+
+    def read(self, source):
+        """Read the metadata of a file.
+
+        :param str source: Path of the file.
+        :returns: dict with exiftool's keys, or None if the backend can't
+            read the file.
+        """
+        return None
+
+    def read_batch(self, sources):
+        """Read the metadata of several files.
+
+        :param list sources: Paths of the files.
+        :returns: list with a dict or None for each source in the same order.
+        """
+        return [self.read(source) for source in sources]
+
+    def write(self, tags, source):
+        """Write tags to a file.
+
+        :param dict tags: Values keyed by exiftool's tag names.
+        :param str source: Path of the file.
+        :returns: True or False if the tags were or weren't written, or None
+            if the backend can't write the file.
+        """
+        return None
+
+    def write_batch(self, tags_by_source):
+        """Write tags to several files.
+
+        :param dict tags_by_source: Tags to write keyed by the path of the
+            file.
+        :returns: dict with the status of each file as returned by
+            :meth:`write`.
+        """
+        return dict((source, self.write(tags, source))
+                    for source, tags in tags_by_source.items())
+
+
+class ExifToolBackend(MetadataBackend):
+    """Read and write every file with the shared exiftool process."""
+
+    name = 'exiftool'
+
+    def read(self, source):
+        return ExifTool().get_metadata(source)
+
+    def read_batch(self, sources):
+        if not sources:
+            return []
+        by_source = {}
+        for metadata in ExifTool().get_metadata_batch(sources):
+            by_source[metadata.get('SourceFile')] = metadata
+        return [by_source.get(source) for source in sources]
+
+    def write(self, tags, source):
+        return ExifTool().set_tags(tags, source) != ''
+
+    def write_batch(self, tags_by_source):
+        results = {}
+        for tags, sources in group_by_tags(tags_by_source):
+            if len(sources) == 1:
+                results[sources[0]] = self.write(tags, sources[0])
+            else:
+                results.update(self.write_group(tags, sources))
+        return results
+
+    def write_group(self, tags, sources):
+        """Write the same tags to several files with one exiftool command.
+
+        exiftool only reports how many files it couldn't write so it's asked
+        to list them in a file with `-efile`.
+
+        :param dict tags: Tags to write to every file.
+        :param list sources: Paths of the files.
+        :returns: dict with the status of each file.
+        """
+        fd, error_file = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            output = ExifTool().set_tags_batch(
+                tags, ['-efile', error_file] + list(sources))
+            with open(error_file, 'rb') as f:
+                failed = set(line.strip().decode('utf-8', 'replace')
+                             for line in f if line.strip())
+        finally:
+            os.remove(error_file)
+
+        return dict((source, bool(output) and source not in failed)
+                    for source in sources)
+
+
+class NativeBackend(MetadataBackend):
+    """Read JPEGs and MP4/MOVs without exiftool.
+
+    See :mod:`elodie.media.native`. Nothing is written.
+    """
+
+    name = 'native'
+
+    def read(self, source):
+        return native.get_metadata(source)
+
+
+class ChainBackend(MetadataBackend):
+    """Use the first of several backends which can handle a file.
+
+    :param list backends: Backends in the order they're tried.
+    """
+
+    name = 'chain'
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    def read(self, source):
+        for backend in self.backends:
+            metadata = backend.read(source)
+            if metadata is not None:
+                return metadata
+        return None
+
+    def read_batch(self, sources):
+        results = [None] * len(sources)
+        pending = list(range(len(sources)))
+        for backend in self.backends:
+            if not pending:
+                break
+            batch = backend.read_batch([sources[i] for i in pending])
+            for i, metadata in zip(pending, batch):
+                results[i] = metadata
+            pending = [i for i in pending if results[i] is None]
+        return results
+
+    def write(self, tags, source):
+        for backend in self.backends:
+            status = backend.write(tags, source)
+            if status is not None:
+                return status
+        return None
+
+    def write_batch(self, tags_by_source):
+        results = dict((source, None) for source in tags_by_source)
+        pending = dict(tags_by_source)
+        for backend in self.backends:
+            if not pending:
+                break
+            for source, status in backend.write_batch(pending).items():
+                results[source] = status
+            pending = dict((source, tags) for source, tags in pending.items()
+                           if results[source] is None)
+        return results
+
+
+class CachedBackend(MetadataBackend):
+    """Remember what another backend read until the file changes.
+
+    Files are considered unchanged while their size and modification time
+    are. Writing to a file forgets it.
+
+    :param backend: Backend to read files with.
+    :type backend: :class:`MetadataBackend`
+    :param int max_size: Number of files to remember.
+    """
+
+    name = 'cache'
+
+    def __init__(self, backend, max_size=10000):
+        self.backend = backend
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def read(self, source):
+        return self.read_batch([source])[0]
+
+    def read_batch(self, sources):
+        results = [None] * len(sources)
+        pending = []
+        for i, source in enumerate(sources):
+            metadata = self.get(source)
+            if metadata is None:
+                pending.append(i)
+            else:
+                results[i] = metadata
+
+        if pending:
+            batch = self.backend.read_batch([sources[i] for i in pending])
+            for i, metadata in zip(pending, batch):
+                results[i] = metadata
+                if metadata is not None:
+                    self.set(sources[i], metadata)
+        return results
+
+    def write(self, tags, source):
+        self.forget(source)
+        return self.backend.write(tags, source)
+
+    def write_batch(self, tags_by_source):
+        for source in tags_by_source:
+            self.forget(source)
+        return self.backend.write_batch(tags_by_source)
+
+    def get(self, source):
+        key = get_stat_key(source)
+        with self.lock:
+            cached = self.cache.get(source)
+            if cached is None or cached[0] != key:
+                return None
+            self.cache.move_to_end(source)
+            return dict(cached[1])
+
+    def set(self, source, metadata):
+        key = get_stat_key(source)
+        if key is None:
+            return
+        with self.lock:
+            self.cache[source] = (key, dict(metadata))
+            self.cache.move_to_end(source)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def forget(self, source):
+        with self.lock:
+            self.cache.pop(source, None)
+
+
+class MemoryBackend(MetadataBackend):
+    """Keep written tags in memory instead of writing them to files.
+
+    Reads return what was written on top of what the wrapped backend reads,
+    if there is one. Useful for tests and for running without exiftool.
+
+    :param backend: Backend to read files with.
+    :type backend: :class:`MetadataBackend`
+    :param dict metadata: Tags to start with keyed by the path of the file.
+    """
+
+    name = 'memory'
+
+    def __init__(self, backend=None, metadata=None):
+        self.backend = backend
+        self.metadata = {}
+        for source, tags in (metadata or {}).items():
+            self.metadata[source] = dict(tags)
+
+    def read(self, source):
+        return self.read_batch([source])[0]
+
+    def read_batch(self, sources):
+        results = [None] * len(sources)
+        if self.backend is not None:
+            results = self.backend.read_batch(sources)
+
+        for i, source in enumerate(sources):
+            if source not in self.metadata:
+                continue
+            metadata = dict(results[i] or {'SourceFile': source})
+            metadata.update(self.metadata[source])
+            results[i] = metadata
+        return results
+
+    def write(self, tags, source):
+        self.metadata.setdefault(source, {}).update(tags)
+        return True
+
+
+#: Backends which can be listed in `config.ini`.
+BACKENDS = dict((backend.name, backend) for backend in
+                (ExifToolBackend, NativeBackend))
+
+#: Backends in `config.ini` which wrap the backends listed after them.
+WRAPPERS = dict((backend.name, backend) for backend in
+                (CachedBackend, MemoryBackend))
+
+
+def create_backend(names):
+    """Create a backend from a list of backend names.
+
+    :param list names: Names from :data:`BACKENDS` and :data:`WRAPPERS` in
+        the order they're tried.
+    :returns: :class:`MetadataBackend`
+    """
+    names = [name.strip().lower() for name in names if name.strip()]
+    backends = []
+    for position, name in enumerate(names):
+        if name in WRAPPERS:
+            rest = create_backend(names[position + 1:])
+            backends.append(WRAPPERS[name](rest))
+            break
+        if name not in BACKENDS:
+            raise ValueError('Unknown metadata backend %s' % name)
+        backends.append(BACKENDS[name]())
+
+    if len(backends) == 1:
+        return backends[0]
+    return ChainBackend(backends)
+
+
+def get_backend_names():
+    """Get the names of the backends configured in `config.ini`.
+
+    :returns: list of str
+    """
+    names = DEFAULT_BACKENDS
+    config = load_config()
+    if 'Metadata' in config and 'backends' in config['Metadata']:
+        names = config['Metadata']['backends']
+    return [name.strip().lower() for name in names.split(',') if name.strip()]
+
+
+def get_backend():
+    """Get the backend configured in `config.ini`.
+
+    :returns: :class:`MetadataBackend`
+    """
+    global __BACKEND__
+    if __BACKEND__ is None:
+        __BACKEND__ = create_backend(get_backend_names())
+    return __BACKEND__
+
+
+def set_backend(backend):
+    """Use a backend instead of the one configured in `config.ini`.
+
+    :param backend: Backend to use, or None to load the configured one again
+        the next time it's needed.
+    :type backend: :class:`MetadataBackend`
+    """
+    global __BACKEND__
+    __BACKEND__ = backend
+
+
+def group_by_tags(tags_by_source):
+    """Group files which get the same tags.
+
+    :param dict tags_by_source: Tags to write keyed by the path of the file.
+    :returns: list of tuple(dict, list) of the tags and the files which get
+        them, in the order the tags were first seen.
+    """
+    groups = OrderedDict()
+    for source, tags in tags_by_source.items():
+        key = tuple(sorted(tags.items()))
+        if key not in groups:
+            groups[key] = (tags, [])
+        groups[key][1].append(source)
+    return list(groups.values())
+
+
+def get_stat_key(source):
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
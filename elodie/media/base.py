@@ -13,6 +13,9 @@ are used to represent the actual files.
 import mimetypes
 import os
 
+from elodie.localstorage import get_metadata_cache
+from elodie.media.record import MediaRecord
+
 try:        # Py3k compatibility
     basestring
 except NameError:
@@ -74,38 +77,73 @@ class Base(object):
     def get_camera_model(self):
         return None
 
-    def get_metadata(self, update_cache=False):
+    def get_metadata(self, update_cache=False, checksum=None):
         """Get a dictionary of metadata for any file.
 
         All keys will be present and have a value of None if not obtained.
-
-        :returns: dict or None for non-text files
+        The metadata of a file which hasn't changed since it was last read
+        comes from the :class:`~elodie.localstorage.MetadataCache`.
+
+        :param bool update_cache: Read the metadata from the file even if
+            it's cached.
+        :param str checksum: Checksum of the file, if known, so the cached
+            metadata of a copy of the file can be used.
+        :returns: :class:`~elodie.media.record.MediaRecord` or None for
+            unsupported files
         """
         if(not self.is_valid()):
             return None
 
-        if(isinstance(self.metadata, dict) and update_cache is False):
+        if(self.metadata is not None and update_cache is False):
             return self.metadata
 
         source = self.source
 
-        self.metadata = {
-            'date_taken': self.get_date_taken(),
-            'camera_make': self.get_camera_make(),
-            'camera_model': self.get_camera_model(),
-            'latitude': self.get_coordinate('latitude'),
-            'longitude': self.get_coordinate('longitude'),
-            'album': self.get_album(),
-            'title': self.get_title(),
-            'mime_type': self.get_mimetype(),
-            'original_name': self.get_original_name(),
+        metadata_cache = get_metadata_cache()
+        if(update_cache is False):
+            self.metadata = metadata_cache.get(source, checksum)
+            if(self.metadata is not None):
+                return self.metadata
+
+        self.metadata = self.read_metadata()
+        metadata_cache.add(source, self.metadata, checksum,
+                           self.date_from_file)
+
+        return self.metadata
+
+    def read_metadata(self):
+        """Read the metadata of a valid file from its getters.
+
+        Sub-classes can override this to read every field at once.
+
+        :returns: :class:`~elodie.media.record.MediaRecord`
+        """
+        metadata = MediaRecord(
+            date_taken=self.get_date_taken(),
+            camera_make=self.get_camera_make(),
+            camera_model=self.get_camera_model(),
+            latitude=self.get_coordinate('latitude'),
+            longitude=self.get_coordinate('longitude'),
+            album=self.get_album(),
+            title=self.get_title(),
+            original_name=self.get_original_name(),
+        )
+        metadata.update(self.get_path_metadata())
+        return metadata
+
+    def get_path_metadata(self):
+        """Get the fields of the metadata which come from the file's path.
+
+        :returns: dict
+        """
+        source = self.source
+        return {
+            'mime_type': mimetypes.guess_type(source)[0],
             'base_name': os.path.splitext(os.path.basename(source))[0],
-            'extension': self.get_extension(),
+            'extension': os.path.splitext(source)[1][1:].lower(),
             'directory_path': os.path.dirname(source)
         }
 
-        return self.metadata
-
     def get_mimetype(self):
         """Get the mimetype of the file.
 
@@ -151,6 +189,9 @@ class Base(object):
         """Resets any internal cache
         """
         self.metadata = None
+        # Whether the date taken was read from the file system instead of
+        #  the file's metadata. None until the date taken was read.
+        self.date_from_file = None
 
     def set_album(self, name):
         """Base method for setting the album of a file
@@ -167,7 +208,7 @@ class Base(object):
         metadata = self.get_metadata()
 
         # If this file has an album already set we do not overwrite EXIF
-        if(not isinstance(metadata, dict) or metadata['album'] is not None):
+        if(metadata is None or metadata['album'] is not None):
             return False
 
         folder = os.path.basename(metadata['directory_path'])
@@ -12,10 +12,14 @@ from __future__ import print_function
 
 import os
 import six
+import time
 
 # load modules
-from elodie.external.pyexiftool import ExifTool
+from elodie.localstorage import get_metadata_cache
+from elodie.media import sidecar
+from elodie.media.backend import get_backend
 from elodie.media.base import Base
+from elodie.media.record import MediaRecord
 
 class Media(Base):
 
@@ -31,6 +35,10 @@ class Media(Base):
         'longitude': 'longitude_ref'
     }
 
+    #: :class:`ExtractionPlan` of each class. See
+    #:  :meth:`get_extraction_plan`.
+    extraction_plans = {}
+
     def __init__(self, source=None):
         super(Media, self).__init__(source)
         self.exif_map = {
@@ -61,14 +69,10 @@ class Media(Base):
             return None
 
         exiftool_attributes = self.get_exiftool_attributes()
-        if exiftool_attributes is None:
+        if not exiftool_attributes:
             return None
 
-        for album_key in self.album_keys:
-            if album_key in exiftool_attributes:
-                return exiftool_attributes[album_key]
-
-        return None
+        return get_first_tag(exiftool_attributes, self.album_keys)
 
     def get_coordinate(self, type='latitude'):
         """Get latitude or longitude of media from EXIF
@@ -82,56 +86,199 @@ class Media(Base):
         if not exif:
             return None
 
-        # The lat/lon _keys array has an order of precedence.
-        # The first key is writable and we will give the writable
-        #   key precence when reading.
-        direction_multiplier = 1.0
-        for key in self.latitude_keys + self.longitude_keys:
-            if key not in exif:
-                continue
-            if isinstance(exif[key], six.string_types) and len(exif[key]) == 0:
-                # If exiftool GPS output is empty, the data returned will be a str
-                # with 0 length.
-                # https://github.com/jmathai/elodie/issues/354
-                continue
-
-            # Cast coordinate to a float due to a bug in exiftool's
-            #   -json output format.
-            # https://github.com/jmathai/elodie/issues/171
-            # http://u88.n24.queensu.ca/exiftool/forum/index.php/topic,7952.0.html  # noqa
-            this_coordinate = float(exif[key])
-
-            # TODO: verify that we need to check ref key
-            #   when self.set_gps_ref != True
-            if type == 'latitude' and key in self.latitude_keys:
-                if self.latitude_ref_key in exif and \
-                        exif[self.latitude_ref_key] == 'S':
-                    direction_multiplier = -1.0
-                return this_coordinate * direction_multiplier
-            elif type == 'longitude' and key in self.longitude_keys:
-                if self.longitude_ref_key in exif and \
-                        exif[self.longitude_ref_key] == 'W':
-                    direction_multiplier = -1.0
-                return this_coordinate * direction_multiplier
+        if type == 'latitude':
+            return get_coordinate_tag(exif, self.latitude_keys,
+                                      self.latitude_ref_key, 'S')
+        elif type == 'longitude':
+            return get_coordinate_tag(exif, self.longitude_keys,
+                                      self.longitude_ref_key, 'W')
 
         return None
 
+    def get_date_taken(self):
+        """Get the date which the photo or video was taken.
+
+        If no date can be parsed from EXIF the min() of mtime and ctime is
+        used.
+
+        :returns: time object or None for invalid files or 0 timestamp
+        """
+        if(not self.is_valid()):
+            return None
+
+        exif = self.get_exiftool_attributes() or {}
+        date_taken = self.parse_date_taken(exif, self.exif_map['date_taken'])
+        self.date_from_file = date_taken is None
+        if date_taken is None:
+            date_taken = self.get_date_from_file()
+
+        return date_taken
+
+    def get_date_from_file(self):
+        """Get the date of the file from the min() of mtime and ctime.
+
+        :returns: time object or None for a 0 timestamp
+        """
+        source = self.source
+        seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
+        if(seconds_since_epoch == 0):
+            return None
+
+        return time.gmtime(seconds_since_epoch)
+
+    @staticmethod
+    def parse_date_taken(exif, keys):
+        """Parse the date taken from the first of several EXIF keys.
+
+        Overridden by sub-classes which know how their dates are formatted.
+
+        :param dict exif: EXIF of the file.
+        :param keys: Keys in order of precedence.
+        :returns: time object or None if no date could be parsed
+        """
+        return None
+
     def get_exiftool_attributes(self):
-        """Get attributes for the media object from exiftool.
+        """Get attributes for the media object from the metadata backend.
+
+        Values in the file's XMP sidecar take precedence over the ones
+        embedded in the file.
 
-        :returns: dict, or False if exiftool was not available.
+        :returns: dict, or False if no backend could read the file.
         """
         source = self.source
 
         #Cache exif metadata results and use if already exists for media
         if(self.exif_metadata is None):
-            self.exif_metadata = ExifTool().get_metadata(source)
+            self.exif_metadata = self.merge_sidecar(get_backend().read(source))
 
         if not self.exif_metadata:
             return False
 
         return self.exif_metadata
 
+    def get_sidecar_keys(self):
+        """Get the EXIF key each field of an XMP sidecar is read as.
+
+        Sidecar values are merged into the EXIF under the key with the
+        highest precedence for their field, which is also the key the
+        setters write to.
+
+        :returns: dict
+        """
+        return {
+            'album': self.album_keys[0],
+            'title': self.title_key,
+            'original_name': self.original_name_key,
+            'latitude': self.latitude_keys[0],
+            'longitude': self.longitude_keys[0],
+            'date_taken': self.exif_map['date_taken'][0],
+        }
+
+    def merge_sidecar(self, exif):
+        """Merge the values in the file's XMP sidecar over its EXIF.
+
+        :param dict exif: EXIF read from the file, or None if it couldn't
+            be read.
+        :returns: dict or None
+        """
+        if exif is None:
+            return None
+
+        values = sidecar.read(self.source)
+        if not values:
+            return exif
+
+        exif = dict(exif)
+        keys = self.get_sidecar_keys()
+        refs = {
+            'latitude': (self.latitude_ref_key, 'N', 'S'),
+            'longitude': (self.longitude_ref_key, 'E', 'W'),
+        }
+        for field, value in values.items():
+            if field in refs:
+                # Coordinates are stored unsigned with a reference the same
+                #  way exiftool returns EXIF GPS tags.
+                ref_key, positive, negative = refs[field]
+                exif[ref_key] = negative if value < 0 else positive
+                value = abs(value)
+            exif[keys[field]] = value
+        return exif
+
+    def uses_sidecar(self):
+        """Check if tags are written to an XMP sidecar instead of the file.
+
+        The `sidecars` option in the `[Metadata]` section of `config.ini`
+        lists the media classes and extensions which use sidecars.
+
+        :returns: bool
+        """
+        names = sidecar.get_sidecar_names()
+        if not names:
+            return False
+        extension = os.path.splitext(self.source)[1][1:].lower()
+        return self.__name__.lower() in names or extension in names
+
+    def get_extraction_plan(self):
+        """Get the plan which turns EXIF into metadata for this class.
+
+        The plan is built from the first instance of each class and reused.
+
+        :returns: :class:`ExtractionPlan`
+        """
+        plan = Media.extraction_plans.get(self.__class__)
+        if plan is None:
+            plan = ExtractionPlan(self)
+            Media.extraction_plans[self.__class__] = plan
+        return plan
+
+    def read_metadata(self):
+        """Read the metadata of a valid file in one pass over its EXIF.
+
+        The EXIF isn't kept once the record is built.
+
+        :returns: :class:`~elodie.media.record.MediaRecord`
+        """
+        exif = self.get_exiftool_attributes() or {}
+        self.exif_metadata = None
+        metadata = self.get_extraction_plan().apply(exif)
+        self.date_from_file = metadata['date_taken'] is None
+        if metadata['date_taken'] is None:
+            metadata['date_taken'] = self.get_date_from_file()
+        metadata.update(self.get_path_metadata())
+        return metadata
+
+    @staticmethod
+    def read_metadata_batch(medias):
+        """Read the metadata of many media objects at once.
+
+        Each object's exif_metadata should already be loaded, for example
+        with :meth:`~elodie.media.backend.MetadataBackend.read_batch`. The
+        files aren't validated and their EXIF isn't kept once the records
+        are built.
+
+        :param list medias: Media objects.
+        :returns: list of :class:`~elodie.media.record.MediaRecord` in the
+            same order. The metadata of each object is also stored on it.
+        """
+        by_class = {}
+        for media in medias:
+            by_class.setdefault(media.__class__, []).append(media)
+
+        for group in by_class.values():
+            plan = group[0].get_extraction_plan()
+            records = plan.apply_batch(
+                [media.exif_metadata or {} for media in group])
+            for media, metadata in zip(group, records):
+                media.date_from_file = metadata['date_taken'] is None
+                if metadata['date_taken'] is None:
+                    metadata['date_taken'] = media.get_date_from_file()
+                metadata.update(media.get_path_metadata())
+                media.metadata = metadata
+                media.exif_metadata = None
+
+        return [media.metadata for media in medias]
+
     def get_camera_make(self):
         """Get the camera make stored in EXIF.
 
@@ -142,14 +289,10 @@ class Media(Base):
 
         exiftool_attributes = self.get_exiftool_attributes()
 
-        if exiftool_attributes is None:
+        if not exiftool_attributes:
             return None
 
-        for camera_make_key in self.camera_make_keys:
-            if camera_make_key in exiftool_attributes:
-                return exiftool_attributes[camera_make_key]
-
-        return None
+        return get_first_tag(exiftool_attributes, self.camera_make_keys)
 
     def get_camera_model(self):
         """Get the camera make stored in EXIF.
@@ -161,14 +304,10 @@ class Media(Base):
 
         exiftool_attributes = self.get_exiftool_attributes()
 
-        if exiftool_attributes is None:
+        if not exiftool_attributes:
             return None
 
-        for camera_model_key in self.camera_model_keys:
-            if camera_model_key in exiftool_attributes:
-                return exiftool_attributes[camera_model_key]
-
-        return None
+        return get_first_tag(exiftool_attributes, self.camera_model_keys)
 
     def get_original_name(self):
         """Get the original name stored in EXIF.
@@ -180,13 +319,10 @@ class Media(Base):
 
         exiftool_attributes = self.get_exiftool_attributes()
 
-        if exiftool_attributes is None:
-            return None
-
-        if(self.original_name_key not in exiftool_attributes):
+        if not exiftool_attributes:
             return None
 
-        return exiftool_attributes[self.original_name_key]
+        return exiftool_attributes.get(self.original_name_key)
 
     def get_title(self):
         """Get the title for a photo of video
@@ -198,13 +334,10 @@ class Media(Base):
 
         exiftool_attributes = self.get_exiftool_attributes()
 
-        if exiftool_attributes is None:
+        if not exiftool_attributes:
             return None
 
-        if(self.title_key not in exiftool_attributes):
-            return None
-
-        return exiftool_attributes[self.title_key]
+        return exiftool_attributes.get(self.title_key)
 
     def reset_cache(self):
         """Resets any internal cache
@@ -222,8 +355,7 @@ class Media(Base):
         if(not self.is_valid()):
             return None
 
-        tags = {self.album_keys[0]: album}
-        status = self.__set_tags(tags)
+        status = self.__set_tags(self.get_tags(album=album))
         self.reset_cache()
 
         return status
@@ -237,12 +369,7 @@ class Media(Base):
         if(time is None):
             return False
 
-        tags = {}
-        formatted_time = time.strftime('%Y:%m:%d %H:%M:%S')
-        for key in self.exif_map['date_taken']:
-            tags[key] = formatted_time
-
-        status = self.__set_tags(tags)
+        status = self.__set_tags(self.get_tags(date_taken=time))
         self.reset_cache()
         return status
 
@@ -250,25 +377,8 @@ class Media(Base):
         if(not self.is_valid()):
             return None
 
-        # The lat/lon _keys array has an order of precedence.
-        # The first key is writable and we will give the writable
-        #   key precence when reading.
-        tags = {
-            self.latitude_keys[0]: latitude,
-            self.longitude_keys[0]: longitude,
-        }
-
-        # If self.set_gps_ref == True then it means we are writing an EXIF
-        #   GPS tag which requires us to set the reference key.
-        # That's because the lat/lon are absolute values.
-        if self.set_gps_ref:
-            if latitude < 0:
-                tags[self.latitude_ref_key] = 'S'
-
-            if longitude < 0:
-                tags[self.longitude_ref_key] = 'W'
-
-        status = self.__set_tags(tags)
+        status = self.__set_tags(
+            self.get_tags(latitude=latitude, longitude=longitude))
         self.reset_cache()
 
         return status
@@ -282,7 +392,10 @@ class Media(Base):
             return None
 
         # If EXIF original name tag is set then we return.
-        if self.get_original_name() is not None:
+        # The metadata is used rather than get_original_name() so the EXIF,
+        #  which isn't kept once the metadata is read, isn't read again.
+        metadata = self.get_metadata()
+        if metadata is not None and metadata['original_name'] is not None:
             return None
 
         source = self.source
@@ -290,8 +403,7 @@ class Media(Base):
         if not name:
             name = os.path.basename(source)
 
-        tags = {self.original_name_key: name}
-        status = self.__set_tags(tags)
+        status = self.__set_tags(self.get_tags(original_name=name))
         self.reset_cache()
         return status
 
@@ -307,19 +419,229 @@ class Media(Base):
         if(title is None):
             return None
 
-        tags = {self.title_key: title}
-        status = self.__set_tags(tags)
+        status = self.__set_tags(self.get_tags(title=title))
         self.reset_cache()
 
         return status
 
+    def get_tags(self, album=None, title=None, latitude=None,
+                 longitude=None, date_taken=None, original_name=None):
+        """Get the tags the setters write for several fields at once.
+
+        Fields which are None are left out.
+
+        :param datetime date_taken: When the photo or video was taken.
+        :returns: dict
+        """
+        tags = {}
+        if album is not None:
+            tags[self.album_keys[0]] = album
+        if title is not None:
+            tags[self.title_key] = title
+        if original_name is not None:
+            tags[self.original_name_key] = original_name
+        if date_taken is not None:
+            formatted_time = date_taken.strftime('%Y:%m:%d %H:%M:%S')
+            for key in self.exif_map['date_taken']:
+                tags[key] = formatted_time
+        if latitude is not None and longitude is not None:
+            # The lat/lon _keys array has an order of precedence.
+            # The first key is writable and we will give the writable
+            #   key precence when reading.
+            tags[self.latitude_keys[0]] = latitude
+            tags[self.longitude_keys[0]] = longitude
+
+            # If self.set_gps_ref == True then it means we are writing an EXIF
+            #   GPS tag which requires us to set the reference key.
+            # That's because the lat/lon are absolute values.
+            if self.set_gps_ref:
+                if latitude < 0:
+                    tags[self.latitude_ref_key] = 'S'
+
+                if longitude < 0:
+                    tags[self.longitude_ref_key] = 'W'
+        return tags
+
+    @staticmethod
+    def set_tags_batch(tags_by_media):
+        """Write tags to many media objects at once.
+
+        Tags of objects which use sidecars are written to them. The rest are
+        written with a single call to the backend, which writes the files
+        which get the same tags together. The objects aren't validated.
+
+        :param list tags_by_media: tuple(media, dict) of each object and the
+            tags to write to it as returned by :meth:`get_tags`.
+        :returns: list of bool in the same order.
+        """
+        statuses = [None] * len(tags_by_media)
+        tags_by_source = {}
+        for i, (media, tags) in enumerate(tags_by_media):
+            if media.uses_sidecar():
+                statuses[i] = media.write_sidecar(tags)
+            else:
+                tags_by_source.setdefault(media.source, {}).update(tags)
+
+        written = {}
+        if tags_by_source:
+            written = get_backend().write_batch(tags_by_source)
+
+        metadata_cache = get_metadata_cache()
+        for i, (media, tags) in enumerate(tags_by_media):
+            if statuses[i] is None:
+                statuses[i] = written.get(media.source) is True
+            metadata_cache.remove(media.source)
+            media.reset_cache()
+        return statuses
+
+    @staticmethod
+    def prefetch_metadata(medias):
+        """Read the metadata of many media objects with one backend call.
+
+        Objects whose metadata is cached in the
+        :class:`~elodie.localstorage.MetadataCache` aren't read. The rest
+        are read with
+        :meth:`~elodie.media.backend.MetadataBackend.read_batch` and added
+        to the cache.
+
+        :param list medias: Media objects. Anything else is skipped.
+        """
+        metadata_cache = get_metadata_cache()
+        batch = []
+        for media in medias:
+            if isinstance(media, Media):
+                # Files whose metadata is cached don't need to be read.
+                media.metadata = metadata_cache.get(media.source)
+                if media.metadata is None:
+                    batch.append(media)
+        if not batch:
+            return
+
+        metadata = get_backend().read_batch([m.source for m in batch])
+        for media, exif in zip(batch, metadata):
+            media.exif_metadata = media.merge_sidecar(exif)
+        for media, record in zip(batch, Media.read_metadata_batch(batch)):
+            metadata_cache.add(media.source, record,
+                               date_from_file=media.date_from_file)
+
     def __set_tags(self, tags):
         if(not self.is_valid()):
             return None
 
         source = self.source
 
-        status = ''
-        status = ExifTool().set_tags(tags,source)
+        if self.uses_sidecar():
+            status = self.write_sidecar(tags)
+        else:
+            status = get_backend().write(tags, source)
+        get_metadata_cache().remove(source)
+
+        return status is True
+
+    def write_sidecar(self, tags):
+        """Write tags to the file's XMP sidecar.
+
+        :param dict tags: Tags as returned by :meth:`get_tags`.
+        :returns: bool
+        """
+        keys = self.get_sidecar_keys()
+        values = dict((field, tags[key]) for field, key in keys.items()
+                      if key in tags)
+        return sidecar.write(self.source, values)
+
+
+class ExtractionPlan(object):
+    """Turn the EXIF of a file into its metadata in a single pass.
+
+    The keys each field is read from are looked up once when the plan is
+    built instead of every time a file is read.
+
+    :param media: Instance of the class the plan is for.
+    :type media: :class:`Media`
+    """
+
+    def __init__(self, media):
+        self.tags = (
+            ('camera_make', tuple(media.camera_make_keys)),
+            ('camera_model', tuple(media.camera_model_keys)),
+            ('album', tuple(media.album_keys)),
+            ('title', (media.title_key,)),
+            ('original_name', (media.original_name_key,)),
+        )
+        self.coordinates = (
+            ('latitude', tuple(media.latitude_keys),
+             media.latitude_ref_key, 'S'),
+            ('longitude', tuple(media.longitude_keys),
+             media.longitude_ref_key, 'W'),
+        )
+        self.date_keys = tuple(media.exif_map['date_taken'])
+        self.parse_date_taken = media.parse_date_taken
+
+    def apply(self, exif):
+        """Get the metadata from the EXIF of a file.
+
+        :param dict exif: EXIF of the file.
+        :returns: :class:`~elodie.media.record.MediaRecord` with every field
+            which comes from EXIF. date_taken is None if it couldn't be
+            parsed.
+        """
+        metadata = MediaRecord()
+        metadata.date_taken = self.parse_date_taken(exif, self.date_keys)
+        for name, keys in self.tags:
+            metadata[name] = get_first_tag(exif, keys)
+        for name, keys, ref_key, negative_ref in self.coordinates:
+            metadata[name] = get_coordinate_tag(exif, keys, ref_key,
+                                                negative_ref)
+        return metadata
+
+    def apply_batch(self, exifs):
+        """Get the metadata from the EXIF of many files.
+
+        :param list exifs: EXIF of each file.
+        :returns: list of :class:`~elodie.media.record.MediaRecord` in the
+            same order.
+        """
+        apply = self.apply
+        return [apply(exif) for exif in exifs]
+
+
+def get_first_tag(exif, keys):
+    """Get the value of the first of several keys which is present.
 
-        return status != ''
+    :returns: value or None
+    """
+    for key in keys:
+        if key in exif:
+            return exif[key]
+    return None
+
+
+def get_coordinate_tag(exif, keys, ref_key, negative_ref):
+    """Get a coordinate from the first of several keys which has one.
+
+    The keys have an order of precedence. The first key is writable and we
+    give the writable key precedence when reading.
+
+    :param str ref_key: Key of the direction of the coordinate.
+    :param str negative_ref: Direction which makes the coordinate negative.
+    :returns: float or None
+    """
+    for key in keys:
+        if key not in exif:
+            continue
+        if isinstance(exif[key], six.string_types) and len(exif[key]) == 0:
+            # If exiftool GPS output is empty, the data returned will be a str
+            # with 0 length.
+            # https://github.com/jmathai/elodie/issues/354
+            continue
+
+        # Cast coordinate to a float due to a bug in exiftool's
+        #   -json output format.
+        # https://github.com/jmathai/elodie/issues/171
+        # http://u88.n24.queensu.ca/exiftool/forum/index.php/topic,7952.0.html  # noqa
+        coordinate = float(exif[key])
+        if ref_key in exif and exif[ref_key] == negative_ref:
+            return coordinate * -1.0
+        return coordinate
+
+    return None
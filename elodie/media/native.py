@@ -0,0 +1,592 @@
+"""
+The native module reads the metadata Elodie uses from JPEG and MP4/MOV files
+without starting exiftool.
+
+Only the headers are read: the APP1 EXIF and XMP segments of a JPEG and the
+moov atom of an MP4 or MOV. :func:`get_metadata` returns a dict with the
+same `Group:Tag` keys and values exiftool returns with `-G -n`, or None when
+the file has anything it can't read the same way exiftool does, in which
+case the caller should ask exiftool instead.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import division
+
+import os
+import re
+import struct
+import time
+
+from xml.etree import ElementTree
+
+#: Extensions of files which are read as JPEGs.
+JPEG_EXTENSIONS = ('jpg', 'jpeg')
+
+#: Extensions of files which are read as QuickTime/ISO base media files.
+QUICKTIME_EXTENSIONS = ('m4v', 'mov', 'mp4')
+
+#: Seconds between the QuickTime epoch of 1904-01-01 and the Unix epoch.
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+#: EXIF tags in IFD0 and the keys exiftool returns them as.
+IFD0_TAGS = {
+    0x010F: 'EXIF:Make',
+    0x0110: 'EXIF:Model',
+    0x0132: 'EXIF:ModifyDate',
+}
+
+#: EXIF tags in the EXIF IFD and the keys exiftool returns them as.
+EXIF_IFD_TAGS = {
+    0x9003: 'EXIF:DateTimeOriginal',
+    0x9004: 'EXIF:CreateDate',
+}
+
+#: EXIF tags in the GPS IFD and the keys exiftool returns them as.
+GPS_IFD_TAGS = {
+    0x0001: 'EXIF:GPSLatitudeRef',
+    0x0002: 'EXIF:GPSLatitude',
+    0x0003: 'EXIF:GPSLongitudeRef',
+    0x0004: 'EXIF:GPSLongitude',
+}
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+#: Size in bytes of each EXIF value type.
+EXIF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+XMP_SIGNATURE = b'http://ns.adobe.com/xap/1.0/\x00'
+XMP_EXTENSION_SIGNATURE = b'http://ns.adobe.com/xmp/extension/\x00'
+XMP_UUID = b'\xbe\x7a\xcf\xcb\x97\xa9\x42\xe8\x9c\x71\x99\x94\x91\xe3\xaf\xac'
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+#: XMP properties and the keys exiftool returns them as.
+XMP_TAGS = {
+    ('http://purl.org/dc/elements/1.1/', 'title'): 'XMP:Title',
+    ('http://ns.adobe.com/xmp/1.0/DynamicMedia/', 'album'): 'XMP:Album',
+    ('https://github.com/jmathai/elodie/', 'Album'): 'XMP:Album',
+    ('http://xmp.gettyimages.com/gift/1.0/', 'OriginalFilename'):
+        'XMP:OriginalFileName',
+    ('http://ns.adobe.com/exif/1.0/', 'GPSLatitude'): 'XMP:GPSLatitude',
+    ('http://ns.adobe.com/exif/1.0/', 'GPSLongitude'): 'XMP:GPSLongitude',
+}
+
+#: Names of XMP properties Elodie reads. If one of these is found in a
+#:  namespace which isn't in XMP_TAGS we can't tell what exiftool would
+#:  call it so the file is left to exiftool.
+XMP_READ_NAMES = set(['title', 'album', 'originalfilename', 'displayname',
+                      'gpslatitude', 'gpslongitude'])
+
+#: QuickTime metadata keys and the keys exiftool returns them as.
+QUICKTIME_KEYS = {
+    'com.apple.quicktime.make': 'QuickTime:Make',
+    'com.apple.quicktime.model': 'QuickTime:Model',
+    'com.apple.quicktime.creationdate': 'QuickTime:CreationDate',
+    'com.apple.quicktime.location.ISO6709': 'QuickTime:GPSCoordinates',
+}
+
+#: QuickTime user data atoms and the keys exiftool returns them as.
+QUICKTIME_USER_DATA = {
+    b'\xa9mak': 'QuickTime:Make',
+    b'\xa9mod': 'QuickTime:Model',
+    b'\xa9xyz': 'QuickTime:GPSCoordinates',
+}
+
+#: Values matching this are written as numbers by exiftool's JSON output.
+JSON_NUMBER = re.compile(
+    r'^-?(\d|[1-9]\d{1,14})(\.\d{1,16})?(e[-+]?\d{1,3})?$', re.I
+)
+
+ISO6709 = re.compile(
+    r'^([+-]\d{1,2}(?:\.\d+)?)([+-]\d{1,3}(?:\.\d+)?)([+-]\d+(?:\.\d+)?)?/?$'
+)
+
+ISO8601 = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.\d+)?'
+    r'(Z|[+-]\d{2}:?\d{2})?$'
+)
+
+XMP_COORDINATE = re.compile(
+    r'^(\d+),(\d+(?:\.\d+)?)(?:,(\d+(?:\.\d+)?))?([NSEW])$'
+)
+
+
+class UnsupportedError(Exception):
+    """Raised when a file has something we can't read like exiftool."""
+    pass
+
+
+def get_metadata(source):
+    """Read the metadata of a JPEG or MP4/MOV file.
+
+    :param str source: Path of the file.
+    :returns: dict with the same keys exiftool returns, or None if the file
+        should be read with exiftool.
+    """
+    extension = os.path.splitext(source)[1][1:].lower()
+    try:
+        with open(source, 'rb') as f:
+            if extension in JPEG_EXTENSIONS:
+                metadata = read_jpeg(f)
+            elif extension in QUICKTIME_EXTENSIONS:
+                metadata = read_quicktime(f, os.fstat(f.fileno()).st_size)
+            else:
+                return None
+    except (UnsupportedError, EnvironmentError, ValueError, IndexError,
+            struct.error, ElementTree.ParseError):
+        return None
+
+    # exiftool always returns the source so the dict is never empty.
+    metadata['SourceFile'] = source
+    return metadata
+
+
+def read_jpeg(f):
+    """Read the EXIF and XMP segments of a JPEG.
+
+    :param f: File object positioned at the start of the file.
+    :returns: dict
+    """
+    if f.read(2) != b'\xff\xd8':
+        raise UnsupportedError('Not a JPEG')
+
+    metadata = {}
+    exif_read = xmp_read = False
+    while True:
+        marker = f.read(2)
+        if len(marker) != 2 or marker[0:1] != b'\xff' or \
+                marker[1:2] == b'\xff':
+            raise UnsupportedError('Invalid JPEG marker')
+        # Start of scan or end of image. No metadata segments follow.
+        if marker in (b'\xff\xda', b'\xff\xd9'):
+            break
+        # Markers without a length.
+        if marker[1:2] in (b'\x01',) or b'\xd0' <= marker[1:2] <= b'\xd7':
+            continue
+
+        length = struct.unpack('>H', f.read(2))[0] - 2
+        if marker != b'\xff\xe1':
+            f.seek(length, os.SEEK_CUR)
+            continue
+
+        segment = f.read(length)
+        if segment.startswith(b'Exif\x00\x00'):
+            if exif_read:
+                raise UnsupportedError('More than one EXIF segment')
+            metadata.update(read_exif(segment[6:]))
+            exif_read = True
+        elif segment.startswith(XMP_SIGNATURE):
+            if xmp_read:
+                raise UnsupportedError('More than one XMP segment')
+            metadata.update(read_xmp(segment[len(XMP_SIGNATURE):]))
+            xmp_read = True
+        elif segment.startswith(XMP_EXTENSION_SIGNATURE):
+            raise UnsupportedError('Extended XMP')
+
+    return metadata
+
+
+def read_exif(tiff):
+    """Read the tags Elodie uses from a TIFF structure.
+
+    :param bytes tiff: The TIFF header and everything after it.
+    :returns: dict
+    """
+    if tiff[0:2] == b'II':
+        endian = '<'
+    elif tiff[0:2] == b'MM':
+        endian = '>'
+    else:
+        raise UnsupportedError('Invalid TIFF header')
+
+    metadata = {}
+    ifd0_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+    ifd0 = read_ifd(tiff, ifd0_offset, endian)
+    for tag, key in IFD0_TAGS.items():
+        if tag in ifd0:
+            metadata[key] = format_value(ifd0[tag])
+
+    if EXIF_IFD_POINTER in ifd0:
+        exif_ifd = read_ifd(tiff, ifd0[EXIF_IFD_POINTER][0], endian)
+        for tag, key in EXIF_IFD_TAGS.items():
+            if tag in exif_ifd:
+                metadata[key] = format_value(exif_ifd[tag])
+
+    if GPS_IFD_POINTER in ifd0:
+        gps_ifd = read_ifd(tiff, ifd0[GPS_IFD_POINTER][0], endian)
+        for tag, key in GPS_IFD_TAGS.items():
+            if tag not in gps_ifd:
+                continue
+            if key in ('EXIF:GPSLatitude', 'EXIF:GPSLongitude'):
+                metadata[key] = format_coordinate(gps_ifd[tag])
+            else:
+                metadata[key] = format_value(gps_ifd[tag])
+
+    return metadata
+
+
+def read_ifd(tiff, offset, endian):
+    """Read the entries of an IFD.
+
+    :returns: dict of tag to its value. ASCII values are str and all other
+        values are lists.
+    """
+    entries = {}
+    count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        tag, value_type, value_count = struct.unpack(
+            endian + 'HHI', tiff[entry:entry + 8])
+        if value_type not in EXIF_TYPE_SIZES:
+            continue
+
+        size = EXIF_TYPE_SIZES[value_type] * value_count
+        if size <= 4:
+            data = tiff[entry + 8:entry + 8 + size]
+        else:
+            data_offset = struct.unpack(endian + 'I',
+                                        tiff[entry + 8:entry + 12])[0]
+            data = tiff[data_offset:data_offset + size]
+        if len(data) != size:
+            raise UnsupportedError('EXIF value outside of segment')
+
+        if value_type == 2:
+            entries[tag] = decode_string(data.split(b'\x00', 1)[0])
+        elif value_type in (1, 7):
+            entries[tag] = list(bytearray(data))
+        elif value_type in (5, 10):
+            fmt = endian + ('I' if value_type == 5 else 'i') * 2 * value_count
+            values = struct.unpack(fmt, data)
+            entries[tag] = list(zip(values[0::2], values[1::2]))
+        else:
+            fmt = {3: 'H', 4: 'I', 9: 'i'}[value_type]
+            entries[tag] = list(struct.unpack(endian + fmt * value_count,
+                                              data))
+    return entries
+
+
+def format_value(value):
+    """Format an EXIF value the way exiftool's JSON output does."""
+    if isinstance(value, list):
+        if len(value) != 1 or isinstance(value[0], tuple):
+            raise UnsupportedError('Unexpected EXIF value')
+        return value[0]
+    return json_value(value)
+
+
+def format_coordinate(rationals):
+    """Convert degrees, minutes and seconds to decimal degrees.
+
+    exiftool returns an empty string when a coordinate can't be computed.
+
+    :returns: float or str
+    """
+    if not isinstance(rationals, list) or not rationals:
+        raise UnsupportedError('Unexpected GPS value')
+    if any(denominator == 0 for _, denominator in rationals):
+        return ''
+
+    coordinate = 0.0
+    for i, (numerator, denominator) in enumerate(rationals):
+        coordinate += numerator / denominator / (60 ** i)
+    return coordinate
+
+
+def read_xmp(packet):
+    """Read the properties Elodie uses from an XMP packet.
+
+    :param bytes packet: The XMP packet.
+    :returns: dict
+    """
+    root = ElementTree.fromstring(packet.strip(b'\x00 \r\n\t'))
+
+    metadata = {}
+    for description in root.iter(RDF + 'Description'):
+        properties = [(name, value) for name, value
+                      in description.attrib.items()
+                      if not name.startswith(RDF)]
+        properties += [(child.tag, get_xmp_value(child))
+                       for child in description]
+        for name, value in properties:
+            if not name.startswith('{'):
+                continue
+            namespace, local_name = name[1:].split('}', 1)
+            if local_name.lower() not in XMP_READ_NAMES:
+                continue
+            if (namespace, local_name) not in XMP_TAGS or value is None:
+                raise UnsupportedError('Unknown XMP property %s' % name)
+
+            key = XMP_TAGS[(namespace, local_name)]
+            if key in ('XMP:GPSLatitude', 'XMP:GPSLongitude'):
+                value = parse_xmp_coordinate(value)
+            else:
+                value = json_value(value)
+            if key in metadata and metadata[key] != value:
+                raise UnsupportedError('Conflicting XMP property %s' % key)
+            metadata[key] = value
+
+    return metadata
+
+
+def get_xmp_value(element):
+    """Get the value of an XMP property element.
+
+    :returns: str, or None for values exiftool would return as a list or a
+        structure.
+    """
+    children = list(element)
+    if not children:
+        if element.get(RDF + 'resource') is not None:
+            return element.get(RDF + 'resource')
+        return element.text or ''
+    if len(children) != 1 or \
+            children[0].tag not in (RDF + 'Alt', RDF + 'Bag', RDF + 'Seq'):
+        return None
+
+    items = [i for i in children[0] if i.tag == RDF + 'li']
+    if children[0].tag == RDF + 'Alt':
+        for item in items:
+            if item.get(XML_LANG) == 'x-default':
+                return item.text or ''
+    if len(items) != 1 or len(items[0]):
+        return None
+    return items[0].text or ''
+
+
+def parse_xmp_coordinate(value):
+    """Convert an XMP coordinate like 37,22.1298N to decimal degrees.
+
+    :returns: float
+    """
+    match = XMP_COORDINATE.match(value.strip())
+    if match is None:
+        raise UnsupportedError('Unexpected XMP coordinate %s' % value)
+
+    degrees, minutes, seconds, direction = match.groups()
+    coordinate = int(degrees) + float(minutes) / 60
+    if seconds is not None:
+        coordinate += float(seconds) / 3600
+    if direction in ('S', 'W'):
+        coordinate = -coordinate
+    return coordinate
+
+
+def read_quicktime(f, file_size):
+    """Read the metadata Elodie uses from a QuickTime or ISO base media file.
+
+    Atoms are read by seeking from header to header so the media data is
+    never read.
+
+    :param f: File object.
+    :param int file_size: Size of the file.
+    :returns: dict
+    """
+    metadata = {}
+    moov_read = False
+    for atom_type, start, end in read_atoms(f, 0, file_size):
+        if atom_type == b'moov':
+            if moov_read:
+                raise UnsupportedError('More than one moov atom')
+            read_moov(f, start, end, metadata)
+            moov_read = True
+        elif atom_type == b'uuid':
+            f.seek(start)
+            if f.read(16) == XMP_UUID:
+                merge(metadata, read_xmp(f.read(end - start - 16)))
+
+    if not moov_read:
+        raise UnsupportedError('No moov atom')
+
+    if 'QuickTime:GPSCoordinates' in metadata:
+        coordinates = metadata['QuickTime:GPSCoordinates']
+        metadata['Composite:GPSLatitude'] = coordinates[0]
+        metadata['Composite:GPSLongitude'] = coordinates[1]
+        metadata['QuickTime:GPSCoordinates'] = ' '.join(
+            repr(c) for c in coordinates)
+
+    return metadata
+
+
+def read_atoms(f, start, end):
+    """Read the atoms between two offsets.
+
+    :returns: generator of tuple(bytes, int, int) of each atom's type and the
+        offsets its contents start and end at.
+    """
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, atom_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            raise UnsupportedError('Invalid atom size')
+
+        yield (atom_type, position + header, position + size)
+        position += size
+
+
+def read_moov(f, start, end, metadata):
+    """Read the movie header, first media header and user data of a moov."""
+    media_header_read = False
+    for atom_type, atom_start, atom_end in read_atoms(f, start, end):
+        if atom_type == b'mvhd':
+            f.seek(atom_start)
+            metadata['QuickTime:CreateDate'], _ = read_header_dates(f)
+        elif atom_type == b'trak' and not media_header_read:
+            for mdia_type, mdia_start, mdia_end in read_atoms(f, atom_start,
+                                                              atom_end):
+                if mdia_type != b'mdia':
+                    continue
+                for mdhd_type, mdhd_start, _ in read_atoms(f, mdia_start,
+                                                           mdia_end):
+                    if mdhd_type == b'mdhd':
+                        f.seek(mdhd_start)
+                        metadata['QuickTime:MediaCreateDate'], _ = \
+                            read_header_dates(f)
+                        media_header_read = True
+        elif atom_type == b'udta':
+            read_user_data(f, atom_start, atom_end, metadata)
+        elif atom_type == b'meta':
+            read_meta(f, atom_start, atom_end, metadata)
+
+
+def read_header_dates(f):
+    """Read the creation and modification dates of a mvhd or mdhd atom.
+
+    :returns: tuple(str, str) formatted like exiftool does.
+    """
+    version = f.read(4)[0:1]
+    if version == b'\x01':
+        created, modified = struct.unpack('>QQ', f.read(16))
+    else:
+        created, modified = struct.unpack('>II', f.read(8))
+    return (format_quicktime_date(created), format_quicktime_date(modified))
+
+
+def format_quicktime_date(seconds):
+    if seconds == 0:
+        return '0000:00:00 00:00:00'
+    return time.strftime('%Y:%m:%d %H:%M:%S',
+                         time.gmtime(seconds - QUICKTIME_EPOCH_OFFSET))
+
+
+def read_user_data(f, start, end, metadata):
+    """Read the user data atoms Elodie uses."""
+    for atom_type, atom_start, atom_end in read_atoms(f, start, end):
+        if atom_type in QUICKTIME_USER_DATA:
+            f.seek(atom_start)
+            length = struct.unpack('>H', f.read(4)[0:2])[0]
+            value = decode_string(f.read(min(length, atom_end - atom_start)))
+            set_quicktime_value(metadata, QUICKTIME_USER_DATA[atom_type],
+                                value)
+        elif atom_type == b'XMP_':
+            f.seek(atom_start)
+            merge(metadata, read_xmp(f.read(atom_end - atom_start)))
+        elif atom_type == b'meta':
+            read_meta(f, atom_start, atom_end, metadata)
+
+
+def read_meta(f, start, end, metadata):
+    """Read QuickTime metadata keys.
+
+    In QuickTime files meta is a plain atom and in MP4 files it's a full atom
+    with a version and flags before its children.
+    """
+    f.seek(start)
+    if f.read(8)[4:8] != b'hdlr':
+        start += 4
+
+    handler = None
+    keys = []
+    items = None
+    for atom_type, atom_start, atom_end in read_atoms(f, start, end):
+        if atom_type == b'hdlr':
+            f.seek(atom_start + 8)
+            handler = f.read(4)
+        elif atom_type == b'keys':
+            f.seek(atom_start + 4)
+            count = struct.unpack('>I', f.read(4))[0]
+            for i in range(count):
+                size, namespace = struct.unpack('>I4s', f.read(8))
+                keys.append(decode_string(f.read(size - 8)))
+        elif atom_type == b'ilst':
+            items = (atom_start, atom_end)
+
+    # iTunes style metadata has nothing Elodie uses.
+    if handler != b'mdta' or items is None:
+        return
+
+    for index, item_start, item_end in read_atoms(f, *items):
+        index = struct.unpack('>I', index)[0]
+        if index < 1 or index > len(keys) or keys[index - 1] not in \
+                QUICKTIME_KEYS:
+            continue
+        for data_type, data_start, data_end in read_atoms(f, item_start,
+                                                          item_end):
+            if data_type != b'data':
+                continue
+            f.seek(data_start)
+            value_type = struct.unpack('>I', f.read(4))[0] & 0xffffff
+            if value_type != 1:
+                raise UnsupportedError('Unexpected metadata value type')
+            f.seek(data_start + 8)
+            value = decode_string(f.read(data_end - data_start - 8))
+            set_quicktime_value(metadata, QUICKTIME_KEYS[keys[index - 1]],
+                                value)
+            break
+
+
+def set_quicktime_value(metadata, key, value):
+    """Convert a QuickTime string value the way exiftool does and set it."""
+    if key == 'QuickTime:GPSCoordinates':
+        match = ISO6709.match(value.strip())
+        if match is None:
+            raise UnsupportedError('Unexpected ISO 6709 location %s' % value)
+        value = tuple(float(c) for c in match.groups() if c is not None)
+    elif key == 'QuickTime:CreationDate':
+        match = ISO8601.match(value.strip())
+        if match is None:
+            raise UnsupportedError('Unexpected creation date %s' % value)
+        year, month, day, hour, minute, second, zone = match.groups()
+        value = '%s:%s:%s %s:%s:%s' % (year, month, day, hour, minute,
+                                       second)
+        if zone == 'Z':
+            value += 'Z'
+        elif zone is not None:
+            zone = zone.replace(':', '')
+            value += '%s:%s' % (zone[0:3], zone[3:5])
+    else:
+        value = json_value(value)
+
+    merge(metadata, {key: value})
+
+
+def merge(metadata, values):
+    """Merge values into metadata, refusing to pick between two values."""
+    for key, value in values.items():
+        if key in metadata and metadata[key] != value:
+            raise UnsupportedError('Conflicting values for %s' % key)
+        metadata[key] = value
+
+
+def decode_string(data):
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def json_value(value):
+    """Convert a string to a number if exiftool's JSON output would."""
+    if JSON_NUMBER.match(value):
+        if re.match(r'^-?\d+$', value):
+            return int(value)
+        return float(value)
+    return value
@@ -13,8 +13,6 @@ import time
 from datetime import datetime
 from re import compile
 
-from PIL import Image
-
 from elodie import log
 from .media import Media
 
@@ -37,26 +35,23 @@ class Photo(Media):
         # We only want to parse EXIF once so we store it here
         self.exif = None
 
-        # Use Pillow (required dependency)
-        self.pillow = Image
-
-    def get_date_taken(self):
-        """Get the date which the photo was taken.
+    @property
+    def pillow(self):
+        """Pillow's Image module (required dependency).
 
-        The date value returned is defined by the min() of mtime and ctime.
-
-        :returns: time object or None for non-photo files or 0 timestamp
+        Pillow is slow to import so we wait until a photo is validated.
         """
-        if(not self.is_valid()):
-            return None
+        from PIL import Image
+        return Image
 
-        source = self.source
-        seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
-
-        exif = self.get_exiftool_attributes()
-        if not exif:
-            return seconds_since_epoch
+    @staticmethod
+    def parse_date_taken(exif, keys):
+        """Parse the date the photo was taken from EXIF.
 
+        :param dict exif: EXIF of the photo.
+        :param keys: Keys in order of precedence.
+        :returns: time object or None if no date could be parsed
+        """
         # We need to parse a string from EXIF into a timestamp.
         # EXIF DateTimeOriginal and EXIF DateTime are both stored
         #   in %Y:%m:%d %H:%M:%S format
@@ -64,7 +59,7 @@ class Photo(Media):
         #   the conversion in the local timezone
         # EXIF DateTime is already stored as a timestamp
         # Sourced from https://github.com/photo/frontend/blob/master/src/libraries/models/Photo.php#L500  # noqa
-        for key in self.exif_map['date_taken']:
+        for key in keys:
             try:
                 if(key in exif):
                     if(re.match(r'\d{4}(-|:)\d{2}(-|:)\d{2}', exif[key]) is not None):  # noqa
@@ -82,10 +77,7 @@ class Photo(Media):
                 log.error(e)
                 pass
 
-        if(seconds_since_epoch == 0):
-            return None
-
-        return time.gmtime(seconds_since_epoch)
+        return None
 
     def is_valid(self):
         """Check the file extension against valid file extensions.
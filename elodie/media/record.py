@@ -0,0 +1,131 @@
+"""
+The record module provides the :class:`MediaRecord` class which holds the
+metadata of a file as returned by
+:meth:`~elodie.media.base.Base.get_metadata`.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+class MediaRecord(MutableMapping):
+    """The metadata of a file.
+
+    Every field is stored in a slot instead of in a dict so a record takes a
+    fraction of the memory of the equivalent dict. Records can be used like
+    a dict with the keys in :attr:`FIELDS`, which is how the folder and file
+    name templates read them. Every field is always present and defaults to
+    None. Other keys can be set too, like with a dict, and are kept in a
+    dict which is only created when the first one is set. Plugins are given
+    the record as a plain dict from :meth:`to_dict`.
+
+    :param dict metadata: Values of the fields to start with.
+    """
+
+    #: Names of the fields of a record.
+    FIELDS = (
+        'date_taken',
+        'camera_make',
+        'camera_model',
+        'latitude',
+        'longitude',
+        'album',
+        'title',
+        'original_name',
+        'mime_type',
+        'base_name',
+        'extension',
+        'directory_path',
+    )
+
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, metadata=None, **kwargs):
+        for field in self.FIELDS:
+            object.__setattr__(self, field, None)
+        self._extra = None
+        if metadata is not None:
+            self.update(metadata)
+        if kwargs:
+            self.update(kwargs)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS:
+            raise TypeError('Fields of a MediaRecord can not be deleted')
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __contains__(self, key):
+        return key in self.FIELDS or \
+            (self._extra is not None and key in self._extra)
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            yield field
+        if self._extra is not None:
+            for key in list(self._extra):
+                yield key
+
+    def __len__(self):
+        if self._extra is None:
+            return len(self.FIELDS)
+        return len(self.FIELDS) + len(self._extra)
+
+    def __eq__(self, other):
+        if not isinstance(other, (MediaRecord, dict)):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'MediaRecord(%r)' % (self.to_dict(),)
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def copy(self):
+        """Get a copy of the record.
+
+        :returns: :class:`MediaRecord`
+        """
+        return MediaRecord(self)
+
+    def to_dict(self):
+        """Get the fields and any other keys of the record as a dict.
+
+        :returns: dict
+        """
+        metadata = dict((field, getattr(self, field)) for field in self.FIELDS)
+        if self._extra is not None:
+            metadata.update(self._extra)
+        return metadata
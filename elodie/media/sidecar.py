@@ -0,0 +1,212 @@
+"""
+The sidecar module reads and writes the XMP sidecars of media files.
+
+Writing an album or a title into a large video or RAW file makes exiftool
+rewrite the whole file. Media classes configured to use sidecars write those
+tags to an `.xmp` file next to the media file instead, which is read back
+over the tags embedded in the file. The classes, or extensions, which use
+sidecars are configured in the `[Metadata]` section of `config.ini`::
+
+    [Metadata]
+    sidecars=video,arw,cr2,nef
+
+Properties other tools keep in a sidecar are left as they are.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+
+import os
+import tempfile
+
+from xml.etree import ElementTree
+
+from elodie import log
+from elodie.config import load_config
+from elodie.media import native
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+#: Prefixes of the namespaces written to sidecars.
+NAMESPACES = {
+    'x': 'adobe:ns:meta/',
+    'rdf': RDF,
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'exif': 'http://ns.adobe.com/exif/1.0/',
+    'xmpDM': 'http://ns.adobe.com/xmp/1.0/DynamicMedia/',
+    'GettyImagesGIFT': 'http://xmp.gettyimages.com/gift/1.0/',
+}
+
+#: XMP property each field of the metadata is written to.
+PROPERTIES = (
+    ('album', 'xmpDM', 'album'),
+    ('title', 'dc', 'title'),
+    ('original_name', 'GettyImagesGIFT', 'OriginalFilename'),
+    ('latitude', 'exif', 'GPSLatitude'),
+    ('longitude', 'exif', 'GPSLongitude'),
+    ('date_taken', 'exif', 'DateTimeOriginal'),
+)
+
+#: Directions of positive and negative coordinates.
+DIRECTIONS = {'latitude': ('N', 'S'), 'longitude': ('E', 'W')}
+
+for prefix, namespace in NAMESPACES.items():
+    ElementTree.register_namespace(prefix, namespace)
+
+
+def get_sidecar_path(source):
+    """Get the path of the sidecar of a file.
+
+    The extension of the file is kept so files which only differ by their
+    extension don't share a sidecar.
+
+    :param str source: Path of the media file.
+    :returns: str
+    """
+    return '%s.xmp' % source
+
+
+def get_sidecar_names():
+    """Get the media classes and extensions configured to use sidecars.
+
+    :returns: list of lowercased str
+    """
+    config = load_config()
+    if 'Metadata' not in config or 'sidecars' not in config['Metadata']:
+        return []
+    names = config['Metadata']['sidecars']
+    return [name.strip().lower() for name in names.split(',') if name.strip()]
+
+
+def read(source):
+    """Read the fields Elodie uses from the sidecar of a file.
+
+    Dates are returned as `YYYY:MM:DD HH:MM:SS` and coordinates as signed
+    decimal degrees, the same as exiftool returns them with `-n`.
+
+    :param str source: Path of the media file.
+    :returns: dict keyed by field, or None if the file has no sidecar.
+    """
+    sidecar_path = get_sidecar_path(source)
+    if not os.path.isfile(sidecar_path):
+        return None
+
+    try:
+        root = ElementTree.parse(sidecar_path).getroot()
+    except (ElementTree.ParseError, OSError) as e:
+        log.error('Could not read sidecar %s: %s' % (sidecar_path, e))
+        return None
+
+    names = dict(('{%s}%s' % (NAMESPACES[prefix], name), field)
+                 for field, prefix, name in PROPERTIES)
+    values = {}
+    for description in root.iter('{%s}Description' % RDF):
+        properties = list(description.attrib.items())
+        properties += [(child.tag, native.get_xmp_value(child))
+                       for child in description]
+        for name, value in properties:
+            if name not in names or value is None:
+                continue
+            field = names[name]
+            try:
+                values[field] = parse_value(field, value)
+            except ValueError as e:
+                log.error('Could not read %s from sidecar %s: %s' %
+                          (field, sidecar_path, e))
+    return values
+
+
+def write(source, values):
+    """Write fields to the sidecar of a file.
+
+    The sidecar is created if it doesn't exist. Other properties in an
+    existing sidecar are kept.
+
+    :param str source: Path of the media file.
+    :param dict values: Values keyed by field in the format returned by
+        :func:`read`.
+    :returns: bool
+    """
+    sidecar_path = get_sidecar_path(source)
+    try:
+        if os.path.isfile(sidecar_path):
+            root = ElementTree.parse(sidecar_path).getroot()
+        else:
+            root = ElementTree.Element('{%s}xmpmeta' % NAMESPACES['x'])
+    except (ElementTree.ParseError, OSError) as e:
+        log.error('Could not read sidecar %s: %s' % (sidecar_path, e))
+        return False
+
+    rdf = root if root.tag == '{%s}RDF' % RDF else \
+        root.find('{%s}RDF' % RDF)
+    if rdf is None:
+        rdf = ElementTree.SubElement(root, '{%s}RDF' % RDF)
+    descriptions = list(rdf.iter('{%s}Description' % RDF))
+    if not descriptions:
+        descriptions = [ElementTree.SubElement(
+            rdf, '{%s}Description' % RDF, {'{%s}about' % RDF: ''})]
+
+    for field, prefix, name in PROPERTIES:
+        if field not in values:
+            continue
+        tag = '{%s}%s' % (NAMESPACES[prefix], name)
+        # Drop the property wherever it is so there's only one value.
+        for description in descriptions:
+            description.attrib.pop(tag, None)
+            for child in description.findall(tag):
+                description.remove(child)
+        if values[field] is None:
+            continue
+        element = ElementTree.SubElement(descriptions[0], tag)
+        value = format_value(field, values[field])
+        if field == 'title':
+            alternative = ElementTree.SubElement(element, '{%s}Alt' % RDF)
+            item = ElementTree.SubElement(alternative, '{%s}li' % RDF,
+                                          {XML_LANG: 'x-default'})
+            item.text = value
+        else:
+            element.text = value
+
+    directory = os.path.dirname(os.path.abspath(sidecar_path))
+    try:
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix='.xmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(ElementTree.tostring(root, encoding='utf-8'))
+        os.replace(temporary_path, sidecar_path)
+    except OSError as e:
+        log.error('Could not write sidecar %s: %s' % (sidecar_path, e))
+        return False
+
+    return True
+
+
+def parse_value(field, value):
+    """Convert an XMP value to the format exiftool returns with `-n`.
+
+    :raises ValueError: If the value can't be converted.
+    """
+    if field in DIRECTIONS:
+        try:
+            return native.parse_xmp_coordinate(value)
+        except native.UnsupportedError as e:
+            raise ValueError(str(e))
+    if field == 'date_taken':
+        match = native.ISO8601.match(value.strip())
+        if match is None:
+            raise ValueError('Unexpected XMP date %s' % value)
+        return '%s:%s:%s %s:%s:%s' % match.groups()[:6]
+    return value
+
+
+def format_value(field, value):
+    """Convert a value in the format exiftool uses with `-n` to XMP."""
+    if field in DIRECTIONS:
+        value = float(value)
+        direction = DIRECTIONS[field][1 if value < 0 else 0]
+        degrees = int(abs(value))
+        minutes = (abs(value) - degrees) * 60
+        return '%d,%.8f%s' % (degrees, minutes, direction)
+    if field == 'date_taken':
+        date, _, clock = value.partition(' ')
+        return '%sT%s' % (date.replace(':', '-'), clock)
+    return u'%s' % value
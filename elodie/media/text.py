@@ -7,11 +7,13 @@ are tracked by Elodie.
 
 from json import dumps, loads
 import os
-from shutil import copy2
+import shutil
+import tempfile
 import time
 
 # load modules
 from elodie import log
+from elodie.localstorage import get_metadata_cache
 from elodie.media.base import Base
 
 
@@ -26,6 +28,12 @@ class Text(Base):
     #: Valid extensions for text files.
     extensions = ("txt",)
 
+    #: Longest first line, in bytes, which is read looking for metadata.
+    max_metadata_line = 65536
+
+    #: Encodings tried, in order, to decode the first line.
+    encodings = ("utf-8", "cp1252", "latin-1")
+
     def __init__(self, source=None):
         super(Text, self).__init__(source)
         self.reset_cache()
@@ -58,17 +66,15 @@ class Text(Base):
 
         # We return the value if found in metadata
         if isinstance(self.metadata_line, dict) and "date_taken" in self.metadata_line:
+            self.date_from_file = False
             return time.gmtime(self.metadata_line["date_taken"])
 
         # If there's no date_taken in the metadata we return
         #   from the filesystem
+        self.date_from_file = True
         seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))
         return time.gmtime(seconds_since_epoch)
 
-    def get_metadata(self):
-        self.parse_metadata_line()
-        return super(Text, self).get_metadata()
-
     def get_original_name(self):
         self.parse_metadata_line()
 
@@ -97,19 +103,22 @@ class Text(Base):
         self.metadata_line = None
         super(Text, self).reset_cache()
 
-    def _read_with_fallback_encoding(self):
-        source = self.source
-        encodings = ("utf-8", "cp1252", "latin-1")
+    def _read_first_line(self):
+        """Read the first line of the file without reading the rest of it.
+
+        :returns: bytes including the line ending
+        """
+        with open(self.source, "rb") as f:
+            return f.readline(self.max_metadata_line)
 
-        for encoding in encodings:
+    def _decode(self, line):
+        for encoding in self.encodings:
             try:
-                with open(source, "r", encoding=encoding) as f:
-                    return f.read(), encoding
+                return line.decode(encoding)
             except UnicodeDecodeError:
                 continue
 
-        with open(source, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read(), "utf-8"
+        return line.decode("utf-8", errors="ignore")
 
     def set_album(self, name):
         status = self.write_metadata(album=name)
@@ -159,8 +168,7 @@ class Text(Base):
         if source is None:
             return None
 
-        file_contents, _ = self._read_with_fallback_encoding()
-        first_line = file_contents.splitlines()[0].strip() if file_contents else ""
+        first_line = self._decode(self._read_first_line()).strip()
 
         try:
             parsed_json = loads(first_line)
@@ -191,21 +199,28 @@ class Text(Base):
 
         metadata_as_json = dumps(metadata_line)
 
-        # Create an _original copy just as we do with exiftool
-        # This is to keep all file processing logic in line with exiftool
-        copy2(source, source + "_original")
-
-        original_contents, detected_encoding = self._read_with_fallback_encoding()
-
-        if has_metadata:
-            lines = original_contents.splitlines(True)
-            original_body = "".join(lines[1:])
-            rewritten_contents = "{}\n{}".format(metadata_as_json, original_body)
-        else:
-            rewritten_contents = "{}\n{}".format(metadata_as_json, original_contents)
-
-        with open(source, "w", encoding=detected_encoding, errors="ignore") as f_write:
-            f_write.write(rewritten_contents)
-
+        # The new file is written next to the original with the new first
+        #  line followed by the body copied as bytes so it's never decoded.
+        #  The metadata line is ASCII so it matches the body's encoding.
+        directory = os.path.dirname(os.path.abspath(source))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".elodie-")
+        try:
+            with open(source, "rb") as f_read, os.fdopen(fd, "wb") as f_write:
+                if has_metadata:
+                    f_read.readline(self.max_metadata_line)
+                f_write.write(metadata_as_json.encode("ascii") + b"\n")
+                shutil.copyfileobj(f_read, f_write)
+            shutil.copymode(source, temporary_path)
+
+            # Keep the file as it was as _original just as we do with exiftool
+            # This is to keep all file processing logic in line with exiftool
+            os.replace(source, source + "_original")
+            os.replace(temporary_path, source)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        get_metadata_cache().remove(source)
         self.reset_cache()
         return True
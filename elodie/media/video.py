@@ -11,7 +11,6 @@ from __future__ import division
 # load modules
 from datetime import datetime
 
-import os
 import re
 import time
 
@@ -54,21 +53,15 @@ class Video(Media):
         self.longitude_ref_key = 'EXIF:GPSLongitudeRef'
         self.set_gps_ref = False
 
-    def get_date_taken(self):
-        """Get the date which the photo was taken.
+    @staticmethod
+    def parse_date_taken(exif, keys):
+        """Parse the date the video was taken from EXIF.
 
-        The date value returned is defined by the min() of mtime and ctime.
-
-        :returns: time object or None for non-photo files or 0 timestamp
+        :param dict exif: EXIF of the video.
+        :param keys: Keys in order of precedence.
+        :returns: time object or None if no date could be parsed
         """
-        if(not self.is_valid()):
-            return None
-
-        source = self.source
-        seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
-
-        exif = self.get_exiftool_attributes()
-        for date_key in self.exif_map['date_taken']:
+        for date_key in keys:
             if date_key in exif:
                 # Example date strings we want to parse
                 # 2015:01:19 12:45:11-08:00
@@ -91,7 +84,4 @@ class Video(Media):
                     except:
                         pass
 
-        if(seconds_since_epoch == 0):
-            return None
-
-        return time.gmtime(seconds_since_epoch)
+        return None
@@ -0,0 +1,193 @@
+"""
+Count what Elodie does and write it as metrics for Prometheus.
+
+Counters, gauges and histograms are kept in memory for the life of the
+process. :class:`Exporter` writes them to a file at an interval and when it's
+stopped so that node exporter's textfile collector can pick them up. The file
+is replaced atomically so it's never read half written.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from builtins import object
+
+import os
+import tempfile
+import threading
+
+from bisect import bisect_left
+
+#: Type and help text of every metric.
+METRICS = {
+    'elodie_files_total': (
+        'counter', 'Files processed by status.'),
+    'elodie_bytes_copied_total': (
+        'counter', 'Bytes copied or moved into the destination.'),
+    'elodie_exiftool_call_duration_seconds': (
+        'histogram', 'Time spent waiting for each exiftool call.'),
+    'elodie_geocoder_cache_requests_total': (
+        'counter', 'Location lookups by whether the location cache had them.'),
+    'elodie_metadata_cache_requests_total': (
+        'counter', 'Metadata reads by whether the metadata cache had them.'),
+    'elodie_hash_db_entries': (
+        'gauge', 'Number of files in the hash db.'),
+}
+
+#: Upper bounds of the buckets of every histogram, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+__VALUES__ = {}
+__HISTOGRAMS__ = {}
+__LOCK__ = threading.Lock()
+
+
+def increment(name, value=1, **labels):
+    """Increment a counter.
+
+    :param str name: Name of the counter.
+    :param value: Amount to add.
+    :param labels: Labels of the series to increment.
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with __LOCK__:
+        __VALUES__[key] = __VALUES__.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge.
+
+    :param str name: Name of the gauge.
+    :param value: Current value.
+    :param labels: Labels of the series to set.
+    """
+    with __LOCK__:
+        __VALUES__[(name, tuple(sorted(labels.items())))] = value
+
+
+def observe(name, value):
+    """Add an observation to a histogram.
+
+    :param str name: Name of the histogram.
+    :param float value: Observed value.
+    """
+    with __LOCK__:
+        if name not in __HISTOGRAMS__:
+            __HISTOGRAMS__[name] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram = __HISTOGRAMS__[name]
+        histogram[0][bisect_left(BUCKETS, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def reset():
+    """Forget every metric recorded so far."""
+    with __LOCK__:
+        __VALUES__.clear()
+        __HISTOGRAMS__.clear()
+
+
+def render():
+    """Get every metric in the text exposition format.
+
+    :returns: str
+    """
+    with __LOCK__:
+        values = dict(__VALUES__)
+        histograms = dict((k, ([c for c in v[0]], v[1], v[2]))
+                          for k, v in __HISTOGRAMS__.items())
+
+    lines = []
+    for name in sorted(METRICS):
+        metric_type, help_text = METRICS[name]
+        series = sorted((labels, value) for (this_name, labels), value
+                        in values.items() if this_name == name)
+        if not series and name not in histograms:
+            continue
+
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels, value in series:
+            lines.append('%s%s %s' % (name, format_labels(labels),
+                                      format_value(value)))
+        if name in histograms:
+            buckets, total, count = histograms[name]
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append('%s_bucket{le="%s"} %d' % (name, bound,
+                                                        cumulative))
+            lines.append('%s_sum %s' % (name, format_value(total)))
+            lines.append('%s_count %d' % (name, count))
+
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def write(file_path):
+    """Atomically replace a file with every metric.
+
+    :param str file_path: Path of the file to write.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(render())
+        # mkstemp creates files only the owner can read.
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')
+                     .replace('\n', '\\n'))
+        for k, v in labels)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Exporter(object):
+    """Write metrics to a file at an interval while a command runs.
+
+    :param str file_path: Path of the file to write. Nothing is written if
+        it's None.
+    :param float interval: Seconds between writes.
+    """
+
+    def __init__(self, file_path, interval=15.0):
+        self.file_path = file_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Write the metrics now and then every interval in a thread."""
+        if self.file_path is None:
+            return self
+        write(self.file_path)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread and write the metrics one last time."""
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        write(self.file_path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            write(self.file_path)
@@ -0,0 +1,345 @@
+"""
+Two phase imports where the expensive analysis is done ahead of time.
+
+Planning reads metadata, computes checksums, checks for duplicates and
+determines the destination of every file. The result is written as JSON Lines
+so it can be reviewed before anything is modified. Applying a plan only copies
+files and writes the tags which were determined while planning. It never reads
+metadata with exiftool.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+from builtins import object
+
+import os
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from elodie import compatability
+from elodie import constants
+from elodie import log
+from elodie.compatability import _decode
+from elodie.media import sidecar
+from elodie.media.backend import get_backend
+from elodie.media.base import get_all_subclasses
+from elodie.media.media import Media
+from elodie.media.record import MediaRecord
+from elodie.media.text import Text
+
+#: Number of files to read metadata for with a single backend call.
+PREFETCH_SIZE = 100
+
+
+class Plan(object):
+    """Create and apply import plans.
+
+    :param filesystem: FileSystem used to determine destination paths.
+    :type filesystem: :class:`~elodie.filesystem.FileSystem`
+    :param db: Db used to check for duplicates and store imported hashes.
+    :type db: :class:`~elodie.localstorage.Db`
+    :param int workers: Number of worker threads. Defaults to the
+        ThreadPoolExecutor default.
+    """
+
+    IMPORT = 'import'
+    DUPLICATE = 'duplicate'
+    ERROR = 'error'
+
+    def __init__(self, filesystem, db, workers=None):
+        self.filesystem = filesystem
+        self.db = db
+        self.workers = workers
+        self.subclasses = get_all_subclasses()
+
+    def plan(self, files, destination, album_from_folder=False,
+             allow_duplicates=False):
+        """Generator which yields a plan record for each file.
+
+        Metadata is read in batches from the metadata backend while
+        checksums and metadata parsing run on a thread pool. Duplicate
+        detection and destination paths are determined in the calling thread
+        since they depend on the order of files and may need to geocode.
+
+        :param iterable files: Paths of the files to plan.
+        :param str destination: Directory files are imported into.
+        :param bool album_from_folder: Use a file's folder as its album.
+        :param bool allow_duplicates: Import files already in the hash db.
+        :returns: generator of dict
+        """
+        seen_checksums = set()
+        files = iter(files)
+        with ThreadPoolExecutor(self.workers) as executor:
+            while True:
+                chunk = [_decode(f) for f in islice(files, PREFETCH_SIZE)]
+                if not chunk:
+                    break
+
+                medias = self.prefetch(chunk)
+                for record, metadata in executor.map(self.analyze, chunk,
+                                                     medias):
+                    if record['status'] == self.IMPORT:
+                        self.resolve(record, metadata, destination,
+                                     album_from_folder, allow_duplicates,
+                                     seen_checksums)
+                    yield record
+
+    def prefetch(self, files):
+        """Get media objects for files with their metadata already read.
+
+        :param list files: Paths of files.
+        :returns: list of media objects or None for unsupported files.
+        """
+        medias = [Media.get_class_by_file(f, self.subclasses) for f in files]
+        try:
+            Media.prefetch_metadata(medias)
+        except Exception as e:
+            # Each media object falls back to reading its own metadata.
+            log.error('Could not prefetch metadata: %s' % e)
+        return medias
+
+    def analyze(self, _file, media):
+        """Read metadata and compute the checksum of a file.
+
+        This runs on the worker threads.
+
+        :returns: tuple(dict, dict) of the plan record and the metadata.
+        """
+        record = {'source': _file, 'status': self.IMPORT}
+        if media is None:
+            return (self.error(record, 'Not a supported file'), None)
+
+        if not media.is_valid():
+            return (self.error(record, 'Not a valid media file'), None)
+
+        stat = os.stat(_file)
+        record['media_class'] = media.__name__
+        record['size'] = stat.st_size
+        record['mtime'] = stat.st_mtime
+        record['checksum'] = self.db.checksum(_file)
+        if record['checksum'] is None:
+            return (self.error(record, 'Could not get checksum'), None)
+
+        metadata = media.get_metadata(checksum=record['checksum'])
+        if metadata is None:
+            return (self.error(record, 'Not a valid media file'), None)
+
+        return (record, metadata)
+
+    def resolve(self, record, metadata, destination, album_from_folder,
+                allow_duplicates, seen_checksums):
+        """Check for duplicates and determine the destination of a file.
+
+        The record is updated in place.
+        """
+        checksum = record['checksum']
+        checksum_file = self.db.get_hash(checksum)
+        if not allow_duplicates:
+            if checksum in seen_checksums:
+                record['status'] = self.DUPLICATE
+                return
+            if checksum_file is not None and os.path.isfile(checksum_file):
+                record['status'] = self.DUPLICATE
+                record['duplicate_of'] = checksum_file
+                return
+        seen_checksums.add(checksum)
+
+        # These are written to the destination file when the plan is applied.
+        # The original name is set after the destination is determined,
+        #  the same way FileSystem.process_file() does it.
+        tags = {}
+        if album_from_folder and metadata['album'] is None:
+            folder = os.path.basename(metadata['directory_path'])
+            if len(folder) > 0:
+                tags['album'] = folder
+                metadata['album'] = folder
+
+        directory_name = self.filesystem.get_folder_path(metadata)
+        file_name = self.filesystem.get_file_name(metadata)
+        dest_path = os.path.join(destination, directory_name, file_name)
+        if dest_path == record['source']:
+            self.error(record,
+                       'Final source and destination path should not be '
+                       'identical')
+            return
+
+        if metadata['original_name'] is None:
+            tags['original_name'] = os.path.basename(record['source'])
+
+        utime, _ = self.filesystem.get_utime_from_metadata(metadata)
+
+        record['destination_folder'] = destination
+        record['destination'] = dest_path
+        record['allow_duplicate'] = allow_duplicates
+        record['tags'] = tags
+        record['utime'] = utime
+        record['metadata'] = metadata.to_dict()
+        record['metadata']['date_taken'] = list(metadata['date_taken'])
+
+    def apply(self, records, trash=False):
+        """Generator which applies plan records.
+
+        File operations run on a thread pool. Plugins and the hash db are
+        only touched from the calling thread.
+
+        :param iterable records: Plan records.
+        :param bool trash: Move source files to the trash once imported.
+        :returns: generator of tuple(dict, str or None) with the record and
+            its destination path if it was imported.
+        """
+        pending = deque()
+        window = (self.workers or 8) * 4
+        with ThreadPoolExecutor(self.workers) as executor:
+            for record in records:
+                if not self.is_importable(record):
+                    pending.append((record, None))
+                else:
+                    pending.append((record, executor.submit(
+                        self.apply_record, record
+                    )))
+
+                while len(pending) > window or \
+                        (pending and pending[0][1] is None):
+                    yield self.finish(*pending.popleft(), trash=trash)
+
+            while pending:
+                yield self.finish(*pending.popleft(), trash=trash)
+
+    def is_importable(self, record):
+        """Check whether a record should be imported when applying a plan.
+
+        Files which were imported since the plan was created are marked as
+        duplicates.
+        """
+        if record['status'] != self.IMPORT:
+            return False
+
+        checksum_file = self.db.get_hash(record['checksum'])
+        if not record['allow_duplicate'] and checksum_file is not None and \
+                os.path.isfile(checksum_file):
+            record['status'] = self.DUPLICATE
+            record['duplicate_of'] = checksum_file
+            return False
+
+        plugins_run_before_status = self.filesystem.plugins.run_all_before(
+            record['source'],
+            record['destination_folder']
+        )
+        if plugins_run_before_status is False:
+            log.warn('At least one plugin pre-run failed for %s' %
+                     record['source'])
+            self.error(record, 'Plugin pre-run failed')
+            return False
+
+        return True
+
+    def apply_record(self, record):
+        """Copy a file to its destination and write its planned tags.
+
+        This runs on the worker threads.
+
+        :returns: str destination path
+        """
+        source = record['source']
+        dest_path = record['destination']
+
+        stat = os.stat(source)
+        if stat.st_size != record['size'] or stat.st_mtime != record['mtime']:
+            raise ValueError('%s changed since the plan was created' % source)
+
+        self.filesystem.create_directory(os.path.dirname(dest_path))
+        compatability._copyfile(source, dest_path)
+        source_sidecar = sidecar.get_sidecar_path(source)
+        if os.path.isfile(source_sidecar):
+            compatability._copyfile(source_sidecar,
+                                    sidecar.get_sidecar_path(dest_path))
+        if constants.dry_run:
+            if record['tags']:
+                print(f"[DRY-RUN] Would write tags {record['tags']} to: {dest_path}")  # noqa
+            print(f"[DRY-RUN] Would set utime for: {dest_path}")
+            return dest_path
+
+        if record['tags']:
+            self.write_tags(record, dest_path)
+
+        os.utime(dest_path, (time.time(), record['utime']))
+        return dest_path
+
+    def write_tags(self, record, dest_path):
+        """Write the tags of a plan record to the destination file.
+
+        :raises ValueError: If the tags could not be written.
+        """
+        media_class = None
+        for cls in self.subclasses:
+            if cls.__name__ == record['media_class']:
+                media_class = cls
+                break
+
+        media = media_class(dest_path)
+        tags = record['tags']
+        if isinstance(media, Text):
+            status = media.write_metadata(**tags)
+        elif media.uses_sidecar():
+            status = sidecar.write(dest_path, tags)
+        else:
+            keys = {
+                'album': media.album_keys[0],
+                'original_name': media.original_name_key,
+            }
+            exif_tags = {}
+            for name in tags:
+                exif_tags[keys[name]] = tags[name]
+            status = get_backend().write(exif_tags, dest_path) is True
+
+        # Writing tags leaves a copy of the file as it was before.
+        exif_original_file = dest_path + '_original'
+        if os.path.exists(exif_original_file):
+            os.remove(exif_original_file)
+
+        if not status:
+            raise ValueError('Could not write tags to %s' % dest_path)
+
+    def finish(self, record, future, trash=False):
+        """Record the result of applying a plan record.
+
+        :returns: tuple(dict, str or None)
+        """
+        if future is None:
+            return (record, None)
+
+        try:
+            dest_path = future.result()
+        except Exception as e:
+            log.error('Could not apply plan for %s: %s' %
+                      (record['source'], e))
+            self.error(record, str(e))
+            return (record, None)
+
+        self.db.add_hash(record['checksum'], dest_path)
+
+        metadata = MediaRecord(record['metadata'])
+        metadata['date_taken'] = time.struct_time(metadata['date_taken'])
+        plugins_run_after_status = self.filesystem.plugins.run_all_after(
+            record['source'],
+            record['destination_folder'],
+            dest_path,
+            metadata
+        )
+        if plugins_run_after_status is False:
+            log.warn('At least one plugin post-run failed for %s' %
+                     record['source'])
+            return (record, None)
+
+        if trash:
+            self.filesystem._file_operation('send2trash', record['source'])
+
+        return (record, dest_path)
+
+    def error(self, record, message):
+        record['status'] = self.ERROR
+        record['error'] = message
+        return record
@@ -0,0 +1,19 @@
+"""
+AfterError plugin object used for tests.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+
+from elodie.plugins.plugins import PluginBase, ElodiePluginError
+
+class AfterError(PluginBase):
+
+    __name__ = 'AfterError'
+
+    """A dummy class which only fails in after() for tests."""
+    def __init__(self):
+        pass
+
+    def after(self, file_path, destination_folder, final_file_path, metadata):
+        raise ElodiePluginError('Sample plugin error for after')
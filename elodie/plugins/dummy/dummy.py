@@ -13,8 +13,19 @@ class Dummy(PluginBase):
 
     """A dummy class to execute plugin actions for tests."""
     def __init__(self):
+        self.after_ran = False
         self.before_ran = False
+        self.batches = []
+
+    def after(self, file_path, destination_folder, final_file_path, metadata):
+        self.after_ran = True
+
+    def after_batch(self, records):
+        self.batches.append(('after', [record['file_path'] for record in records]))
 
     def before(self, file_path, destination_folder):
         self.before_ran = True
 
+    def before_batch(self, files):
+        self.batches.append(('before', files))
+
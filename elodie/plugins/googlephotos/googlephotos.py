@@ -15,6 +15,14 @@ This plugin's batch() function reads all files from the database file and attemp
 This plugin does not aim to keep Google Photos in sync.
 Once a photo is uploaded it's removed from the database and no records are kept thereafter.
 
+Uploads run on a thread pool which shares one authorized session.
+File bodies are streamed from disk and large videos are sent in chunks
+    using the resumable upload protocol.
+Throttled and failed requests are retried with exponential backoff.
+Media items for up to 50 uploaded files are created with one request, which
+    is only retried if it was throttled or never sent so media items aren't
+    created twice.
+
 Upload code adapted from https://github.com/eshmu/gphotos-upload
 
 .. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
@@ -22,9 +30,16 @@ Upload code adapted from https://github.com/eshmu/gphotos-upload
 from __future__ import print_function
 
 import json
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename, getsize, isfile
+from threading import Lock
 
-from os.path import basename, isfile
+import requests
 
+from urllib3.exceptions import NewConnectionError
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import AuthorizedSession
 from google.oauth2.credentials import Credentials
@@ -42,16 +57,30 @@ class GooglePhotos(PluginBase):
             The full file path where to find the downloaded secrets.
        auth_file:
             The full file path where to store authenticated tokens.
+
+       Optional configurations.
+       workers:
+            The number of files to upload at the same time. Defaults to 4.
     
     """
 
     __name__ = 'GooglePhotos'
 
+    #: Status codes of requests which are worth retrying.
+    retry_status_codes = (408, 429, 500, 502, 503, 504)
+
+    #: Most media items the API creates with one batchCreate request.
+    media_create_limit = 50
+
     def __init__(self):
         super(GooglePhotos, self).__init__()
         self.upload_url = 'https://photoslibrary.googleapis.com/v1/uploads'
-        self.media_create_url = 'https://photoslibrary.googleapis.com/v1/mediaItems:batchCreate'
-        self.scopes = ['https://www.googleapis.com/auth/photoslibrary.appendonly']
+        self.media_create_url = (
+            'https://photoslibrary.googleapis.com/v1/mediaItems:batchCreate'
+        )
+        self.scopes = [
+            'https://www.googleapis.com/auth/photoslibrary.appendonly'
+        ]
         
         self.secrets_file = None
         if('secrets_file' in self.config_for_plugin):
@@ -60,7 +89,19 @@ class GooglePhotos(PluginBase):
         self.auth_file = None
         if('auth_file' in self.config_for_plugin):
             self.auth_file = self.config_for_plugin['auth_file']
+        self.workers = 4
+        if ('workers' in self.config_for_plugin):
+            self.workers = max(1, int(self.config_for_plugin['workers']))
+
+        # Files larger than this are uploaded in chunks which can be resumed.
+        self.resumable_threshold = 32 * 1024 * 1024
+        self.chunk_size = 8 * 1024 * 1024
+        # Failed requests are retried after 1, 2, 4... seconds.
+        self.retries = 5
+        self.backoff = 1
+
         self.session = None
+        self.session_lock = Lock()
 
     def after(self, file_path, destination_folder, final_file_path, metadata):
         extension = metadata['extension']
@@ -68,36 +109,157 @@ class GooglePhotos(PluginBase):
             self.log(u'Added {} to db.'.format(final_file_path))
             self.db.set(final_file_path, metadata['original_name'])
         else:
-            self.log(u'Skipping {} which is not a supported media type.'.format(final_file_path))
+            self.log(u'Skipping {} which is not a supported media type.'
+                     .format(final_file_path))
 
     def batch(self):
         queue = self.db.get_all()
-        status = True
         count = 0
-        for key in queue:
-            this_status = self.upload(key)
-            if(this_status):
-                # Remove from queue if successful then increment count
+        if (not constants.dry_run and queue and self.get_session() is None):
+            self.log('Could not initialize session')
+            for key in queue:
+                self.display('{} failed to upload.'.format(key))
+            return (False, count)
+
+        # Uploads run on the pool while media items are created and the db
+        #  is updated from here.
+        pending = deque()
+        uploaded = []
+        window = self.workers * 4
+        with ThreadPoolExecutor(self.workers) as executor:
+            for key in queue:
+                pending.append((key, executor.submit(self.upload_media, key)))
+                while (len(pending) > window or
+                       (pending and pending[0][1].done())):
+                    count += self.finish(uploaded, *pending.popleft())
+
+            while (pending):
+                count += self.finish(uploaded, *pending.popleft())
+
+        count += self.create(uploaded)
+        self.db.flush()
+        return (count == len(queue), count)
+
+    def before(self, file_path, destination_folder):
+        pass
+
+    def create(self, uploaded):
+        """Create media items for uploaded files and remove them from the
+        queue.
+
+        Files whose media item could not be created stay in the queue.
+
+        :param list uploaded: tuple(str, str) with the path and upload token
+            of each file.
+        :returns: int, the number of files removed from the queue.
+        """
+        count = 0
+        results = self.create_media_items(
+            [upload_token for key, upload_token in uploaded])
+        for (key, upload_token), result in zip(uploaded, results):
+            if (result):
+                # Remove from queue if successful
                 self.db.delete(key)
                 count = count + 1
                 self.display('{} uploaded successfully.'.format(key))
             else:
-                status = False
                 self.display('{} failed to upload.'.format(key))
-        return (status, count)
+        return count
 
-    def before(self, file_path, destination_folder):
-        pass
+    def create_media_items(self, upload_tokens):
+        """Create media items for upload tokens with one request.
+
+        :param list upload_tokens: At most media_create_limit upload tokens.
+        :returns: list with the result for each upload token, or None where
+            the media item could not be created.
+        """
+        if (not upload_tokens):
+            return []
+        if constants.dry_run:
+            return [True] * len(upload_tokens)
+
+        create_body = json.dumps({'newMediaItems':[
+            {'description':'','simpleMediaItem':{'uploadToken':upload_token}}
+            for upload_token in upload_tokens
+        ]}, indent=4)
+        try:
+            resp = self.post(self.media_create_url, create_body,
+                             idempotent=False).json()
+        except (ValueError, requests.exceptions.RequestException) as e:
+            self.log('Creating new media items failed: {}'.format(e))
+            return [None] * len(upload_tokens)
+        if ('newMediaItemResults' not in resp):
+            self.log('Creating new media items failed: {}'.format(
+                json.dumps(resp)))
+            return [None] * len(upload_tokens)
+
+        # Each result names its upload token.
+        results_by_token = dict(
+            (result.get('uploadToken'), result)
+            for result in resp['newMediaItemResults']
+        )
+        results = []
+        for upload_token in upload_tokens:
+            result = results_by_token.get(upload_token)
+            if (
+                result is None or
+                'status' not in result or
+                'message' not in result['status'] or
+                (
+                    result['status']['message'] != 'Success' and # photos
+                    result['status']['message'] != 'OK' # videos
+                )
+            ):
+                self.log('Creating new media item failed: {}'.format(
+                    json.dumps(result)))
+                result = None
+            results.append(result)
+        return results
+
+    def finish(self, uploaded, key, future):
+        """Collect the upload token of a file and create media items once
+        media_create_limit tokens are collected.
+
+        :param list uploaded: Paths and upload tokens collected so far.
+        :param str key: Path of the file.
+        :param future: Future of the upload of the file.
+        :returns: int, the number of files removed from the queue.
+        """
+        upload_token = future.result()
+        if (upload_token is None):
+            self.display('{} failed to upload.'.format(key))
+            return 0
+
+        uploaded.append((key, upload_token))
+        if (len(uploaded) < self.media_create_limit):
+            return 0
+
+        count = self.create(uploaded)
+        del uploaded[:]
+        return count
+
+    def get_session(self):
+        """Get the authorized session, creating it the first time.
+
+        The session is shared by all uploads so credentials are only read
+        once.
+        """
+        with self.session_lock:
+            if (self.session is None):
+                self.set_session()
+            return self.session
 
     def set_session(self):
         # Try to load credentials from an auth file.
         # If it doesn't exist or is not valid then catch the 
         #  exception and reauthenticate.
         try:
-            creds = Credentials.from_authorized_user_file(self.auth_file, self.scopes)
+            creds = Credentials.from_authorized_user_file(self.auth_file,
+                                                          self.scopes)
         except:
             try:
-                flow = InstalledAppFlow.from_client_secrets_file(self.secrets_file, self.scopes)
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.secrets_file, self.scopes)
                 creds = flow.run_local_server()
                 cred_dict = {
                     'token': creds.token,
@@ -115,46 +277,195 @@ class GooglePhotos(PluginBase):
             except:
                 return
 
+        # Headers which differ between requests are passed per request
+        #  since the session is shared between threads.
         self.session = AuthorizedSession(creds)
         self.session.headers["Content-type"] = "application/octet-stream"
-        self.session.headers["X-Goog-Upload-Protocol"] = "raw"
+
+    def post(self, url, data=None, headers=None, idempotent=True):
+        """Send a POST request and retry it with exponential backoff if it
+        fails or is throttled.
+
+        :param str url: The url to post to.
+        :param data: bytes or a file object. File objects are streamed and
+            rewound before a retry.
+        :param dict headers: Headers for this request.
+        :param bool idempotent: False if sending the request twice could do
+            something twice. It's then only retried if it was throttled or
+            failed before it was sent, since the server may have handled it
+            after an error or a timeout.
+        :returns: requests.Response of the last attempt.
+        :raises requests.exceptions.RequestException: If the last attempt
+            could not connect.
+        """
+        retry_status_codes = self.retry_status_codes
+        if (not idempotent):
+            retry_status_codes = (429,)
+        position = data.tell() if hasattr(data, 'seek') else None
+        attempt = 0
+        while (True):
+            if (position is not None):
+                data.seek(position)
+            try:
+                response = self.session.post(url, data=data, headers=headers)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                if (attempt >= self.retries or
+                        (not idempotent and was_sent(e))):
+                    raise
+                self.log('Request to {} failed, retrying: {}'.format(url, e))
+                delay = self.backoff * 2 ** attempt
+            else:
+                if (response.status_code not in retry_status_codes or
+                        attempt >= self.retries):
+                    return response
+                self.log('Request to {} failed, retrying: ({})'.format(
+                    url, response.status_code))
+                delay = self.backoff * 2 ** attempt
+                retry_after = response.headers.get('Retry-After', '')
+                if (retry_after.isdigit()):
+                    delay = max(delay, int(retry_after))
+            attempt += 1
+            time.sleep(delay)
 
     def upload(self, path_to_photo):
+        upload_token = self.upload_media(path_to_photo)
+        if (upload_token is None):
+            return None
+        return self.create_media_items([upload_token])[0]
+
+    def upload_media(self, path_to_photo):
+        """Upload the bytes of a file.
+
+        :param str path_to_photo: Path of the file.
+        :returns: str, the upload token to create a media item with, or None
+            if the upload failed.
+        """
         if constants.dry_run:
-            print(f"[DRY-RUN][GooglePhotos] Would upload photo: {path_to_photo}")
-            return True
+            print(f"[DRY-RUN][GooglePhotos] Would upload photo: "
+                  f"{path_to_photo}")
+            # The path stands in for the upload token.
+            return path_to_photo
             
-        self.set_session()
-        if(self.session is None):
+        if (self.get_session() is None):
             self.log('Could not initialize session')
             return None
 
-        self.session.headers["X-Goog-Upload-File-Name"] = basename(path_to_photo)
         if(not isfile(path_to_photo)):
             self.log('Could not find file: {}'.format(path_to_photo))
             return None
 
-        with open(path_to_photo, 'rb') as f:
-            photo_bytes = f.read()
+        try:
+            if (getsize(path_to_photo) > self.resumable_threshold):
+                upload_token = self.upload_resumable(path_to_photo)
+            else:
+                upload_token = self.upload_raw(path_to_photo)
+        except (IOError, OSError, requests.exceptions.RequestException) as e:
+            self.log('Uploading media failed: {}'.format(e))
+            return None
 
-        upload_token = self.session.post(self.upload_url, photo_bytes)
+        if (upload_token is None):
+            return None
         if(upload_token.status_code != 200 or not upload_token.content):
-            self.log('Uploading media failed: ({}) {}'.format(upload_token.status_code, upload_token.content))
+            self.log('Uploading media failed: ({}) {}'.format(
+                upload_token.status_code, upload_token.content))
             return None
 
-        create_body = json.dumps({'newMediaItems':[{'description':'','simpleMediaItem':{'uploadToken':upload_token.content.decode()}}]}, indent=4)
-        resp = self.session.post(self.media_create_url, create_body).json()
-        if(
-            'newMediaItemResults' not in resp or
-            'status' not in resp['newMediaItemResults'][0] or
-            'message' not in resp['newMediaItemResults'][0]['status'] or
-            (
-                resp['newMediaItemResults'][0]['status']['message'] != 'Success' and # photos
-                resp['newMediaItemResults'][0]['status']['message'] != 'OK' # videos
-            )
+        return upload_token.content.decode()
+
+    def upload_raw(self, path_to_photo):
+        """Upload a file in a single request.
 
+        The body is streamed from disk instead of being read into memory.
+
+        :returns: requests.Response with the upload token as its content.
+        """
+        with open(path_to_photo, 'rb') as f:
+            return self.post(self.upload_url, f, {
+                'X-Goog-Upload-File-Name': basename(path_to_photo),
+                'X-Goog-Upload-Protocol': 'raw'
+            })
+
+    def upload_resumable(self, path_to_photo):
+        """Upload a file in chunks using the resumable upload protocol.
+
+        Only one chunk is held in memory at a time. If a chunk fails the
+        server is asked how much it received and the upload continues from
+        there.
+
+        :returns: requests.Response with the upload token as its content, or
+            None if the upload could not be started.
+        """
+        size = getsize(path_to_photo)
+        response = self.post(self.upload_url, b'', {
+            'X-Goog-Upload-Command': 'start',
+            'X-Goog-Upload-File-Name': basename(path_to_photo),
+            'X-Goog-Upload-Protocol': 'resumable',
+            'X-Goog-Upload-Raw-Size': str(size)
+        })
+        upload_url = response.headers.get('X-Goog-Upload-URL')
+        if (response.status_code != 200 or not upload_url):
+            self.log('Starting resumable upload failed: ({}) {}'.format(
+                response.status_code, response.content))
+            return None
+
+        # Chunks have to be a multiple of the granularity of the server.
+        chunk_size = self.chunk_size
+        granularity = response.headers.get(
+            'X-Goog-Upload-Chunk-Granularity', '')
+        if (granularity.isdigit() and int(granularity) > 0):
+            granularity = int(granularity)
+            chunk_size = max(granularity,
+                             chunk_size - chunk_size % granularity)
+
+        offset = 0
+        with open(path_to_photo, 'rb') as f:
+            while (True):
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                command = 'upload'
+                if (offset + len(chunk) >= size):
+                    command = 'upload, finalize'
+                response = self.post(upload_url, chunk, {
+                    'X-Goog-Upload-Command': command,
+                    'X-Goog-Upload-Offset': str(offset)
+                })
+                if (response.status_code == 200):
+                    if (command != 'upload'):
+                        return response
+                    offset += len(chunk)
+                    continue
+
+                received = self.query_upload(upload_url)
+                if (received is None or received <= offset):
+                    return response
+                offset = received
+
+    def query_upload(self, upload_url):
+        """Ask the server how many bytes of a resumable upload it received.
+
+        :returns: int, or None if the upload can't be resumed.
+        """
+        response = self.post(upload_url, b'', {
+            'X-Goog-Upload-Command': 'query'
+        })
+        received = response.headers.get('X-Goog-Upload-Size-Received', '')
+        if (
+            response.status_code != 200 or
+            response.headers.get('X-Goog-Upload-Status') != 'active' or
+            not received.isdigit()
         ):
-            self.log('Creating new media item failed: {}'.format(json.dumps(resp)))
             return None
-        
-        return resp['newMediaItemResults'][0]
+        return int(received)
+
+
+def was_sent(error):
+    """Check whether a request which failed may have reached the server.
+
+    :param requests.exceptions.RequestException error: Why it failed.
+    :returns: bool, False only if the connection couldn't be established.
+    """
+    if (isinstance(error, requests.exceptions.ConnectTimeout)):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return not isinstance(reason, NewConnectionError)
@@ -6,22 +6,38 @@ Plugin object.
 from __future__ import print_function
 from builtins import object
 
+import atexit
 import io
+import os
+import tempfile
+import threading
+import weakref
 
 from json import dumps, loads
 from importlib import import_module
+from queue import Empty, Queue
 
 from elodie import constants
 from os.path import dirname, dirname, isdir, isfile
 from os import mkdir
 from sys import exc_info
+from time import monotonic
 from traceback import format_exc
 
-from elodie.compatability import _bytes
-from elodie.config import load_config_for_plugin, load_plugin_config
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl so writes of different processes aren't
+    #  serialized there.
+    fcntl = None
+
+from elodie.config import load_config, load_config_for_plugin, \
+    load_plugin_config
 from elodie.constants import application_directory
 from elodie import constants
 from elodie import log
+from elodie import timing
+from elodie.media.record import MediaRecord
 
 
 class ElodiePluginError(Exception):
@@ -30,12 +46,23 @@ class ElodiePluginError(Exception):
     pass
 
 
+class PluginTimeoutError(Exception):
+    """Exception raised when a plugin's method doesn't return within the
+    configured timeout.
+    """
+    pass
+
+
 class PluginBase(object):
     """Base class which all plugins should inherit from.
        Defines stubs for all methods and exposes logging and database functionality
     """
     __name__ = 'PluginBase'
 
+    #: Set to True if `after()` has to finish before a file counts as
+    #:  imported. Otherwise it may run on the after queue.
+    synchronous_after = False
+
     def __init__(self):
         # Loads the config for the plugin from config.ini
         self.config_for_plugin = load_config_for_plugin(self.__name__)
@@ -44,12 +71,30 @@ class PluginBase(object):
     def after(self, file_path, destination_folder, final_file_path, metadata):
         pass
 
+    def after_batch(self, records):
+        """Called once the files of a chunk passed to `before_batch()` were
+        imported.
+
+        :param list records: dict with the `file_path`, `destination_folder`,
+            `final_file_path` and `metadata` passed to `after()` for each
+            file of the chunk which was imported.
+        """
+        pass
+
     def batch(self):
         pass
 
     def before(self, file_path, destination_folder):
         pass
 
+    def before_batch(self, files):
+        """Called before a chunk of files is imported. `before()` and
+        `after()` are still called for each file.
+
+        :param list files: Paths of the files in the chunk.
+        """
+        pass
+
     def log(self, msg):
         # Writes an info log not shown unless being run in --debug mode.
         log.info(dumps(
@@ -62,16 +107,45 @@ class PluginBase(object):
             {self.__name__: msg}
         ))
 
+
+#: Marks keys which were deleted in :attr:`PluginDb.changes`.
+_DELETED = object()
+
+
 class PluginDb(object):
     """A database module which provides a simple key/value database.
-       The database is a JSON file located at %application_directory%/plugins/%pluginname.lower()%.json
+       The database is a JSON file located at
+       %application_directory%/plugins/%pluginname.lower()%.json
+
+       The file is read once and changes are kept in memory. They're written
+       to the file every `flush_every` changes or `flush_interval` seconds,
+       whichever comes first, when :meth:`flush` is called and when the
+       process exits. The file is replaced atomically so it's never left
+       half written.
+
+       Other processes, like `elodie batch` while `elodie serve` is running,
+       may change the file in the meantime. Before writing, the file is read
+       again under a lock file and only the keys this instance set or
+       deleted are changed in it, so their changes aren't overwritten.
     """
+
+    #: Number of changes after which the file is written.
+    flush_every = 100
+
+    #: Seconds after which changes are written.
+    flush_interval = 5
+
     def __init__(self, plugin_name):
         self.plugin_name = plugin_name
         self.db_file = '{}/plugins/{}.json'.format(
             application_directory(),
             plugin_name.lower()
         )
+        self.lock = threading.RLock()
+        self.pending = 0
+        self.flushed_at = monotonic()
+        # Keys changed since the last write, deleted keys map to _DELETED.
+        self.changes = {}
 
         # If the plugin db directory does not exist, create it
         if(not isdir(dirname(self.db_file))):
@@ -79,51 +153,175 @@ class PluginDb(object):
 
         # If the db file does not exist we initialize it
         if(not isfile(self.db_file)):
-            with io.open(self.db_file, 'wb') as f:
-                f.write(_bytes(dumps({})))
+            self.db = {}
+            self.write()
+        else:
+            with io.open(self.db_file, 'r') as f:
+                self.db = loads(f.read())
 
+        _open_dbs.add(self)
 
     def get(self, key):
-        with io.open(self.db_file, 'r') as f:
-            db = loads(f.read())
+        with self.lock:
+            if key not in self.db:
+                return None
 
-        if(key not in db):
-            return None
-
-        return db[key]
+            return self.db[key]
 
     def set(self, key, value):
         if constants.dry_run:
-            print(f"[DRY-RUN][{self.plugin_name}] Would save to database '{key}': {value}")
+            print(f"[DRY-RUN][{self.plugin_name}] "
+                  f"Would save to database '{key}': {value}")
             return
-        
-        with io.open(self.db_file, 'r') as f:
-            data = f.read()
-            db = loads(data)
 
-        db[key] = value
-        new_content = dumps(db, ensure_ascii=False).encode('utf8')
-        with io.open(self.db_file, 'wb') as f:
-            f.write(new_content)
+        with self.lock:
+            self.db[key] = value
+            self.changes[key] = value
+            self.changed()
 
     def get_all(self):
-        with io.open(self.db_file, 'r') as f:
-            db = loads(f.read())
-        return db
+        with self.lock:
+            return dict(self.db)
 
     def delete(self, key):
         if constants.dry_run:
-            print(f"[DRY-RUN][{self.plugin_name}] Would delete from plugin database: {key}")
+            print(f"[DRY-RUN][{self.plugin_name}] "
+                  f"Would delete from plugin database: {key}")
             return
-            
-        with io.open(self.db_file, 'r') as f:
-            db = loads(f.read())
 
-        # delete key without throwing an exception
-        db.pop(key, None)
-        new_content = dumps(db, ensure_ascii=False).encode('utf8')
-        with io.open(self.db_file, 'wb') as f:
-            f.write(new_content)
+        with self.lock:
+            # delete key without throwing an exception
+            self.changes[key] = _DELETED
+            if self.db.pop(key, None) is not None:
+                self.changed()
+
+    def changed(self):
+        """Count a change and write the file if it's time to."""
+        self.pending += 1
+        if self.pending >= self.flush_every or \
+                monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write any changes which haven't been written to the file."""
+        with self.lock:
+            if self.pending == 0:
+                return
+            self.write()
+
+    def write(self):
+        """Merge the changes into the file and atomically replace it."""
+        with self.lock, io.open(self.db_file + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+            db = {}
+            if isfile(self.db_file):
+                with io.open(self.db_file, 'r') as f:
+                    db = loads(f.read())
+            for key, value in self.changes.items():
+                if value is _DELETED:
+                    db.pop(key, None)
+                else:
+                    db[key] = value
+
+            new_content = dumps(db, ensure_ascii=False).encode('utf8')
+            fd, temporary_path = tempfile.mkstemp(
+                dir=dirname(self.db_file), prefix='.plugindb-')
+            try:
+                with io.open(fd, 'wb') as f:
+                    f.write(new_content)
+                # mkstemp creates files only the owner can read.
+                os.chmod(temporary_path, 0o644)
+                os.replace(temporary_path, self.db_file)
+            except BaseException:
+                os.remove(temporary_path)
+                raise
+            # The lock is released when the lock file is closed.
+            self.db = db
+            self.changes = {}
+            self.pending = 0
+            self.flushed_at = monotonic()
+
+
+#: Every PluginDb so changes can be written when the process exits.
+_open_dbs = weakref.WeakSet()
+
+
+@atexit.register
+def flush_plugin_dbs():
+    """Write the changes of every PluginDb."""
+    for db in list(_open_dbs):
+        try:
+            db.flush()
+        except Exception:
+            log.error(format_exc())
+
+
+def get_timeout(config, key):
+    """Get a timeout in seconds from the config.
+
+    :returns: float, or None if it's not set or not positive.
+    """
+    timeout = config.getfloat(key, fallback=None)
+    if timeout is None or timeout <= 0:
+        return None
+    return timeout
+
+
+class AfterQueue(object):
+    """Runs the `after()` methods of plugins on a background thread.
+
+    Calls run one at a time in the order they were queued. Queuing a call
+    blocks while `size` calls are waiting so slow plugins slow the import
+    down instead of piling up files in memory.
+
+    :param int size: Number of calls which can wait to run.
+    """
+
+    def __init__(self, size):
+        self.calls = Queue(max(1, size))
+        self.results = Queue()
+        self.thread = threading.Thread(target=self.run, name='plugins-after')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, function, *args):
+        """Queue a call. What the function returns is collected unless it's
+        None.
+        """
+        self.calls.put((function, args))
+
+    def run(self):
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            function, args = call
+            result = function(*args)
+            if result is not None:
+                self.results.put(result)
+
+    def get_results(self):
+        """Get the results of calls which finished since the last time.
+
+        :returns: list
+        """
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except Empty:
+                return results
+
+    def close(self):
+        """Wait for the queued calls to finish and stop the thread.
+
+        :returns: list as :meth:`get_results`.
+        """
+        self.calls.put(None)
+        self.thread.join()
+        return self.get_results()
 
 
 class Plugins(object):
@@ -135,6 +333,20 @@ class Plugins(object):
         self.plugins = []
         self.classes = {}
         self.loaded = False
+        self.after_queue = None
+        # Number of files imported between before_batch() and after_batch().
+        self.batch_size = 500
+        self.batch_records = None
+        # Seconds a method may take, by default and for each method.
+        self.timeout = None
+        self.timeouts = {}
+        # Consecutive errors or timeouts after which a plugin is disabled.
+        self.max_failures = 5
+        self.failures = {}
+        self.disabled = set()
+        self.running = {}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
 
     def load(self):
         """Load plugins from config file.
@@ -153,80 +365,344 @@ class Plugins(object):
                 #  3. Add the plugin to the list of plugins.
                 #  
                 #  #3 should only happen if #2 doesn't throw an error
-                this_module = import_module('elodie.plugins.{}.{}'.format(plugin_lower, plugin_lower))
+                this_module = import_module('elodie.plugins.{}.{}'.format(
+                    plugin_lower, plugin_lower))
                 self.classes[plugin] = getattr(this_module, plugin)()
-                # We only append to self.plugins if we're able to load the class
+                # We only append to self.plugins if we're able to load the
+                #  class
                 self.plugins.append(plugin)
             except:
-                log.error('An error occurred initiating plugin {}'.format(plugin))
+                log.error('An error occurred initiating plugin {}'.format(
+                    plugin))
                 log.error(format_exc())
 
+        config = load_config()
+        if 'Plugins' in config:
+            plugins_config = config['Plugins']
+            self.batch_size = max(1, plugins_config.getint(
+                'batch_size', fallback=self.batch_size))
+            self.max_failures = plugins_config.getint(
+                'max_failures', fallback=self.max_failures)
+            self.timeout = get_timeout(plugins_config, 'timeout')
+            for method in ('after', 'after_batch', 'batch', 'before',
+                           'before_batch'):
+                key = '{}_timeout'.format(method)
+                if key in plugins_config:
+                    self.timeouts[method] = get_timeout(plugins_config, key)
+
         self.loaded = True
 
-    def run_all_after(self, file_path, destination_folder, final_file_path, metadata):
-        """Process `before` methods of each plugin that was loaded.
+    def run_all_after(self, file_path, destination_folder, final_file_path,
+                      metadata):
+        """Process `after` methods of each plugin that was loaded.
+
+        While the after queue is running only plugins with
+        `synchronous_after` set are called right away. The file is queued
+        for the others and None is returned unless one of the synchronous
+        plugins failed.
+
+        Plugins are given the metadata as a plain dict.
         """
         self.load()
+        if isinstance(metadata, MediaRecord):
+            metadata = metadata.to_dict()
+        if self.after_queue is None:
+            synchronous = list(self.classes)
+        else:
+            synchronous = [cls for cls in self.classes
+                           if self.classes[cls].synchronous_after]
+        pass_status = self.run_after(synchronous, file_path,
+                                     destination_folder, final_file_path,
+                                     metadata)
+        if pass_status is False:
+            return False
+
+        if self.batch_records is not None:
+            self.batch_records.append({
+                'file_path': file_path,
+                'destination_folder': destination_folder,
+                'final_file_path': final_file_path,
+                'metadata': metadata
+            })
+
+        if self.after_queue is None:
+            return pass_status
+
+        # Files are queued even if no plugin is left so their results are
+        #  reported in the order they finish.
+        self.after_queue.put(
+            self.run_queued_after,
+            [cls for cls in self.classes if cls not in synchronous],
+            file_path, destination_folder, final_file_path, metadata
+        )
+        return None
+
+    @timing.timed('plugins.after')
+    def run_after(self, names, file_path, destination_folder,
+                  final_file_path, metadata):
+        """Process `after` methods of the named plugins.
+        """
+        return self.run_method(names, 'after', file_path, destination_folder,
+                               final_file_path, metadata)
+
+    def run_queued_after(self, names, file_path, destination_folder,
+                         final_file_path, metadata):
+        """Process `after` methods of the named plugins on the after queue.
+
+        :returns: tuple(str, str, bool) with the file path, its final path
+            and whether no plugin failed.
+        """
+        status = self.run_after(names, file_path, destination_folder,
+                                final_file_path, metadata)
+        return (file_path, final_file_path, status)
+
+    def run_method(self, names, method, *args):
+        """Call a method of the named plugins.
+
+        :returns: bool, False if a plugin raised an ElodiePluginError.
+        """
         pass_status = True
-        for cls in self.classes:
-            this_method = getattr(self.classes[cls], 'after')
-            # We try to call the plugin's `before()` method.
-            # If the method explicitly raises an ElodiePluginError we'll fail the import
-            #  by setting pass_status to False.
-            # If any other error occurs we log the message and proceed as usual.
-            # By default, plugins don't change behavior.
-            try:
-                this_method(file_path, destination_folder, final_file_path, metadata)
-                log.info('Called after() for {}'.format(cls))
-            except ElodiePluginError as err:
-                log.warn('Plugin {} raised an exception in run_all_before: {}'.format(cls, err))
-                log.error(format_exc())
-                log.error('false')
+        for cls in names:
+            if self.call(cls, method, *args) is False:
                 pass_status = False
-            except:
-                log.error(format_exc())
         return pass_status
 
-    def run_batch(self):
-        self.load()
+    def call(self, cls, method, *args):
+        """Call a method of a plugin and record how long it took.
+
+        If the method raises an ElodiePluginError we fail whatever the
+        method was called for by returning False. If any other error occurs,
+        or the method doesn't return within the timeout of the method, we
+        log the message and proceed as usual. Either way the call counts as
+        failed and a plugin is disabled for the rest of the run once its
+        calls failed max_failures times in a row.
+
+        :returns: bool, or None if the plugin is disabled.
+        """
+        if cls in self.disabled:
+            return None
+
         pass_status = True
-        for cls in self.classes:
-            this_method = getattr(self.classes[cls], 'batch')
-            # We try to call the plugin's `before()` method.
-            # If the method explicitly raises an ElodiePluginError we'll fail the import
-            #  by setting pass_status to False.
-            # If any other error occurs we log the message and proceed as usual.
-            # By default, plugins don't change behavior.
-            try:
-                this_method()
-                log.info('Called batch() for {}'.format(cls))
-            except ElodiePluginError as err:
-                log.warn('Plugin {} raised an exception in run_batch: {}'.format(cls, err))
-                log.error(format_exc())
-                pass_status = False
-            except:
-                log.error(format_exc())
+        failed = False
+        timeout = self.timeouts.get(method, self.timeout)
+        started = monotonic()
+        try:
+            if timeout is None:
+                getattr(self.classes[cls], method)(*args)
+            else:
+                self.call_with_timeout(cls, method, args, timeout)
+            log.info('Called {}() for {}'.format(method, cls))
+        except ElodiePluginError as err:
+            log.warn('Plugin {} raised an exception in {}: {}'.format(
+                cls, method, err))
+            log.error(format_exc())
+            pass_status = False
+            failed = 'errors'
+        except PluginTimeoutError as err:
+            log.warn('Plugin {} timed out in {}: {}'.format(cls, method, err))
+            failed = 'timeouts'
+        except:
+            log.error(format_exc())
+            failed = 'errors'
+
+        self.record(cls, method, monotonic() - started, failed)
         return pass_status
 
+    def call_with_timeout(self, cls, method, args, timeout):
+        """Call a method of a plugin on a separate thread and wait for it to
+        return for at most timeout seconds.
+
+        The thread can't be stopped so a call which timed out keeps running.
+        Until it returns, calls to the same plugin time out right away.
+
+        :raises PluginTimeoutError: If the call didn't return in time.
+        """
+        running = self.running.get(cls)
+        if running is not None and running.is_alive():
+            raise PluginTimeoutError('A call which timed out is still running')
+
+        outcome = {}
+
+        def target():
+            try:
+                getattr(self.classes[cls], method)(*args)
+            except BaseException as err:
+                outcome['error'] = err
+
+        thread = threading.Thread(target=target, name='plugin-{}'.format(cls))
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            self.running[cls] = thread
+            raise PluginTimeoutError(
+                'No result after {} seconds'.format(timeout))
+        if 'error' in outcome:
+            raise outcome['error']
+
+    def record(self, cls, method, seconds, failed):
+        """Record a call of a plugin's method and disable the plugin if it
+        failed too many times in a row.
+
+        :param str failed: 'errors' or 'timeouts' if the call failed.
+        """
+        if constants.profile:
+            timing.record('plugin.{}.{}'.format(cls, method), seconds)
+
+        with self.stats_lock:
+            stats = self.stats.setdefault((cls, method), {
+                'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0,
+                'timeouts': 0
+            })
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if not failed:
+                self.failures[cls] = 0
+                return
+
+            stats[failed] += 1
+            self.failures[cls] = self.failures.get(cls, 0) + 1
+            if self.max_failures and \
+                    self.failures[cls] >= self.max_failures and \
+                    cls not in self.disabled:
+                self.disabled.add(cls)
+                log.all('Plugin {} failed {} times in a row and is disabled '
+                        'for the rest of the run'.format(
+                            cls, self.failures[cls]))
+
+    def write_summary(self):
+        """Print a table of how long each plugin's methods took."""
+        from tabulate import tabulate
+
+        if not self.stats:
+            return
+
+        headers = ['Plugin', 'Method', 'Calls', 'Total (s)', 'Avg (ms)',
+                   'Max (ms)', 'Errors', 'Timeouts']
+        result = []
+        for (cls, method), stats in sorted(self.stats.items()):
+            name = cls
+            if cls in self.disabled:
+                name = '{} (disabled)'.format(cls)
+            result.append([
+                name,
+                method,
+                stats['count'],
+                stats['total'],
+                stats['total'] / stats['count'] * 1000,
+                stats['max'] * 1000,
+                stats['errors'],
+                stats['timeouts'],
+            ])
+
+        print("\n")
+        print("****** PLUGINS ******")
+        print(tabulate(result, headers=headers,
+                       floatfmt=('', '', '', '.3f', '.1f', '.1f', '', '')))
+
+    @timing.timed('plugins.before_batch')
+    def start_batch(self, files):
+        """Process `before_batch` methods of each plugin that was loaded.
+
+        The records of files which are imported are collected for
+        :meth:`finish_batch` until it's called.
+
+        :param list files: Paths of the files in the chunk.
+        :returns: bool, False if the files should not be imported.
+        """
+        self.load()
+        self.batch_records = []
+        return self.run_method(list(self.classes), 'before_batch', files)
+
+    @timing.timed('plugins.after_batch')
+    def finish_batch(self):
+        """Process `after_batch` methods of each plugin that was loaded with
+        the records of the files imported since :meth:`start_batch`.
+
+        While the after queue is running the methods of plugins without
+        `synchronous_after` are queued behind the `after()` calls of the
+        chunk.
+
+        :returns: bool, False if a synchronous plugin failed.
+        """
+        records = self.batch_records
+        self.batch_records = None
+        if not records:
+            return True
+
+        synchronous = list(self.classes)
+        if self.after_queue is not None:
+            synchronous = [cls for cls in self.classes
+                           if self.classes[cls].synchronous_after]
+            self.after_queue.put(
+                self.run_queued_after_batch,
+                [cls for cls in self.classes if cls not in synchronous],
+                records
+            )
+        return self.run_method(synchronous, 'after_batch', records)
+
+    def run_queued_after_batch(self, names, records):
+        """Process `after_batch` methods of the named plugins on the after
+        queue.
+        """
+        if self.run_method(names, 'after_batch', records) is False:
+            log.warn('At least one plugin batch post-run failed for {} '
+                     'files'.format(len(records)))
+
+    def start_after_queue(self):
+        """Start running `after()` of plugins on a background thread if
+        `async_after` is set in the `[Plugins]` section of config.ini.
+
+        `after_queue_size` sets how many files can wait for their plugins.
+        Results are collected with :meth:`get_after_results` and
+        :meth:`stop_after_queue`.
+
+        :returns: bool, whether the queue was started.
+        """
+        self.load()
+        config = load_config()
+        if self.after_queue is not None or 'Plugins' not in config or \
+                not config['Plugins'].getboolean('async_after',
+                                                 fallback=False):
+            return False
+
+        self.after_queue = AfterQueue(
+            config['Plugins'].getint('after_queue_size', fallback=100))
+        return True
+
+    def get_after_results(self):
+        """Get the results of files whose queued `after()` methods ran since
+        the last time.
+
+        :returns: list of tuple(str, str, bool) with the file path, its final
+            path and whether no plugin failed.
+        """
+        if self.after_queue is None:
+            return []
+        return self.after_queue.get_results()
+
+    def stop_after_queue(self):
+        """Wait for every queued `after()` method to run and go back to
+        running them right away.
+
+        :returns: list as :meth:`get_after_results`.
+        """
+        if self.after_queue is None:
+            return []
+        after_queue = self.after_queue
+        self.after_queue = None
+        return after_queue.close()
+
+    @timing.timed('plugins.batch')
+    def run_batch(self):
+        self.load()
+        return self.run_method(list(self.classes), 'batch')
+
+    @timing.timed('plugins.before')
     def run_all_before(self, file_path, destination_folder):
         """Process `before` methods of each plugin that was loaded.
         """
         self.load()
-        pass_status = True
-        for cls in self.classes:
-            this_method = getattr(self.classes[cls], 'before')
-            # We try to call the plugin's `before()` method.
-            # If the method explicitly raises an ElodiePluginError we'll fail the import
-            #  by setting pass_status to False.
-            # If any other error occurs we log the message and proceed as usual.
-            # By default, plugins don't change behavior.
-            try:
-                this_method(file_path, destination_folder)
-                log.info('Called before() for {}'.format(cls))
-            except ElodiePluginError as err:
-                log.warn('Plugin {} raised an exception in run_all_after: {}'.format(cls, err))
-                log.error(format_exc())
-                pass_status = False
-            except:
-                log.error(format_exc())
-        return pass_status
+        return self.run_method(list(self.classes), 'before', file_path,
+                               destination_folder)
@@ -18,8 +18,14 @@ class ThrowError(PluginBase):
     def after(self, file_path, destination_folder, final_file_path, metadata):
         raise ElodiePluginError('Sample plugin error for after')
 
+    def after_batch(self, records):
+        raise ElodiePluginError('Sample plugin error for after_batch')
+
     def batch(self):
         raise ElodiePluginError('Sample plugin error for batch')
 
     def before(self, file_path, destination_folder):
         raise ElodiePluginError('Sample plugin error for before')
+
+    def before_batch(self, files):
+        raise ElodiePluginError('Sample plugin error for before_batch')
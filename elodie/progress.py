@@ -0,0 +1,316 @@
+"""
+Report the progress of commands which process many files.
+
+:class:`Progress` keeps track of how many files and bytes were processed and
+derives the throughput and an estimate of the time remaining. Subclasses
+decide how that's shown: :class:`DotProgress` prints a dot per file,
+:class:`BarProgress` draws a progress bar for terminals and
+:class:`JsonProgress` writes an event per line as JSON for other programs to
+read.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import division
+from builtins import object
+
+import os
+import sys
+import threading
+import time
+
+from json import dumps
+
+from elodie import log
+from elodie import timing
+from elodie.result import STATUS
+
+#: Modes which can be passed to :func:`get_progress`.
+MODES = ('dots', 'bar', 'json')
+
+
+class Progress(object):
+    """Keep track of the files a command has processed.
+
+    The base class doesn't show anything.
+
+    :param stream: File object progress is written to.
+    :param clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, stream=None, clock=time.monotonic):
+        self.stream = stream
+        self.clock = clock
+        self.total = None
+        self.completed = 0
+        self.bytes = 0
+        self.started = None
+        self.current = {}
+        self.counter = None
+        self.counting = False
+
+    def start(self, total=None):
+        """Start processing files.
+
+        :param int total: Number of files which will be processed, if known,
+            or an estimate which :meth:`count` corrects.
+        """
+        self.total = total
+        self.started = self.clock()
+        self.on_start()
+
+    def count(self, files):
+        """Count the files which will be processed in a background thread.
+
+        Files can be processed while they're still being found. The total is
+        raised as files are counted and set to the exact number once they
+        were all counted.
+
+        :param files: Iterable of the files which will be processed.
+        """
+        self.counting = True
+
+        def run():
+            counted = 0
+            for counted, _ in enumerate(files, 1):
+                if not self.counting:
+                    return
+                if counted % 100 == 0 and counted > (self.total or 0):
+                    self.total = counted
+            if self.counting:
+                self.total = counted
+                self.counting = False
+
+        self.counter = threading.Thread(target=run)
+        self.counter.daemon = True
+        self.counter.start()
+
+    def file_started(self, file_path):
+        """Start processing a file.
+
+        :param str file_path: Path of the file.
+        """
+        self.current[file_path] = (self.clock(), get_size(file_path),
+                                   timing.totals())
+        self.on_file_started(file_path, self.current[file_path][1])
+
+    def file_finished(self, file_path, status, destination=None):
+        """Finish processing a file.
+
+        :param str file_path: Path of the file.
+        :param status: True if the file was processed, None if it was a
+            duplicate and False if it failed.
+        :param str destination: Where the file was written to, if anywhere.
+        """
+        now = self.clock()
+        if file_path in self.current:
+            started, size, totals = self.current.pop(file_path)
+            seconds = now - started
+            stages = dict(
+                (name, total - totals.get(name, 0))
+                for name, total in timing.totals().items()
+                if total != totals.get(name, 0)
+            )
+        else:
+            size, seconds, stages = get_size(file_path), None, {}
+
+        self.completed += 1
+        self.bytes += size
+        self.on_file_finished(file_path, status, destination, size, seconds,
+                              stages)
+
+    def finish(self):
+        """Finish processing files."""
+        # Every file was processed before they were all counted.
+        if self.counting:
+            self.counting = False
+            self.total = self.completed
+        self.on_finish()
+
+    def elapsed(self):
+        """Get the seconds since processing started.
+
+        :returns: float
+        """
+        if self.started is None:
+            return 0.0
+        return self.clock() - self.started
+
+    def rates(self):
+        """Get the throughput so far and the estimated time remaining.
+
+        :returns: tuple(float, float, float or None) of files per second,
+            megabytes per second and seconds remaining. Seconds remaining is
+            None if the total isn't known or nothing has been processed yet.
+        """
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return (0.0, 0.0, None)
+
+        files_per_second = self.completed / elapsed
+        mb_per_second = self.bytes / elapsed / 1000000
+        eta = None
+        if self.total is not None and files_per_second > 0:
+            eta = max(self.total - self.completed, 0) / files_per_second
+        return (files_per_second, mb_per_second, eta)
+
+    def on_start(self):
+        pass
+
+    def on_file_started(self, file_path, size):
+        pass
+
+    def on_file_finished(self, file_path, status, destination, size, seconds,
+                         stages):
+        pass
+
+    def on_finish(self):
+        pass
+
+
+class DotProgress(Progress):
+    """Print a dot for each file and an x for each file which failed."""
+
+    def on_file_finished(self, file_path, status, destination, size, seconds,
+                         stages):
+        log.progress('x' if status is False else '.')
+
+    def on_finish(self):
+        log.progress('', True)
+
+
+class BarProgress(Progress):
+    """Draw a progress bar with the throughput and time remaining.
+
+    :param int width: Number of characters in the bar.
+    :param float interval: Minimum seconds between redrawing the bar.
+    """
+
+    def __init__(self, stream=None, clock=time.monotonic, width=30,
+                 interval=0.1):
+        super(BarProgress, self).__init__(stream or sys.stderr, clock)
+        self.width = width
+        self.interval = interval
+        self.drawn = None
+
+    def on_file_finished(self, file_path, status, destination, size, seconds,
+                         stages):
+        now = self.clock()
+        if self.drawn is None or now - self.drawn >= self.interval:
+            self.draw()
+            self.drawn = now
+
+    def on_finish(self):
+        self.draw()
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def draw(self):
+        files_per_second, mb_per_second, eta = self.rates()
+        if self.total:
+            filled = int(self.width * min(self.completed / self.total, 1))
+            line = '[%s%s] %d/%d' % ('#' * filled, '-' * (self.width - filled),
+                                     self.completed, self.total)
+        else:
+            line = '%d' % self.completed
+        line += ' %.1f files/s %.1f MB/s' % (files_per_second, mb_per_second)
+        if eta is not None:
+            line += ' ETA %s' % format_seconds(eta)
+
+        self.stream.write('\r%s\033[K' % line)
+        self.stream.flush()
+
+
+class JsonProgress(Progress):
+    """Write an event per line as JSON.
+
+    Every event has an `event` and a `time`. The events are
+    `start`, `file_started`, `file_finished` and `finish`. `file_finished`
+    and `finish` include the throughput so far and the estimated seconds
+    remaining. `file_finished` also has the seconds spent in each stage of
+    processing the file when stages are being timed.
+    """
+
+    def __init__(self, stream=None, clock=time.monotonic):
+        super(JsonProgress, self).__init__(stream or sys.stderr, clock)
+
+    def on_start(self):
+        self.emit({'event': 'start', 'total': self.total})
+
+    def on_file_started(self, file_path, size):
+        self.emit({'event': 'file_started', 'file': file_path, 'bytes': size})
+
+    def on_file_finished(self, file_path, status, destination, size, seconds,
+                         stages):
+        event = {
+            'event': 'file_finished',
+            'file': file_path,
+            'status': STATUS[status],
+            'destination': destination,
+            'bytes': size,
+            'seconds': seconds,
+            'stages': stages,
+        }
+        event.update(self.counters())
+        self.emit(event)
+
+    def on_finish(self):
+        event = {'event': 'finish', 'seconds': self.elapsed()}
+        event.update(self.counters())
+        self.emit(event)
+
+    def counters(self):
+        files_per_second, mb_per_second, eta = self.rates()
+        return {
+            'completed': self.completed,
+            'total': self.total,
+            'bytes_completed': self.bytes,
+            'files_per_second': files_per_second,
+            'mb_per_second': mb_per_second,
+            'eta_seconds': eta,
+        }
+
+    def emit(self, event):
+        event['time'] = time.time()
+        self.stream.write(dumps(event) + '\n')
+        self.stream.flush()
+
+
+def get_progress(mode=None, fd=None):
+    """Get the progress reporter for a mode.
+
+    :param str mode: One of :data:`MODES` or None to not show progress.
+    :param int fd: File descriptor to write progress to instead of stderr.
+    :returns: :class:`Progress`
+    """
+    stream = None
+    if fd is not None:
+        stream = os.fdopen(fd, 'w', closefd=False)
+
+    if mode == 'dots':
+        return DotProgress()
+    elif mode == 'bar':
+        return BarProgress(stream)
+    elif mode == 'json':
+        return JsonProgress(stream)
+    return Progress()
+
+
+def get_size(file_path):
+    """Get the size of a file or 0 if it doesn't exist.
+
+    :returns: int
+    """
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def format_seconds(seconds):
+    """Format seconds as h:mm:ss.
+
+    :returns: str
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
@@ -1,15 +1,51 @@
-from tabulate import tabulate
+"""
+Count the outcome of each file a command processed and print a summary.
+
+Only counters and the first few errors and duplicates are kept in memory.
+Every row can also be streamed to a CSV or JSON Lines report file as it
+happens.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+import csv
+
+from json import dumps
+
+from elodie import metrics
+
+#: Number of errors and of duplicates listed in the summary. Any beyond this
+#:  are only counted, and written to the report file if there is one.
+MAX_DETAILS = 100
+
+#: Status written to the report for each file.
+STATUS = {True: 'success', False: 'error', None: 'duplicate'}
 
 
 class Result(object):
+    """Summary of the files a command processed.
+
+    :param str report_file: Path of a file every row is written to. Rows are
+        written as CSV if it ends with .csv and as JSON Lines otherwise.
+    :param int max_details: Number of errors and of duplicates kept to list
+        in the summary.
+    """
 
-    def __init__(self):
+    def __init__(self, report_file=None, max_details=MAX_DETAILS):
         self.records = []
         self.success = 0
         self.error = 0
         self.error_items = []
         self.duplicate = 0
         self.duplicate_items = []
+        self.max_details = max_details
+        self.report_file = report_file
+        self.report = None
+        self.report_writer = None
+        if report_file is not None:
+            self.report = open(report_file, 'w', newline='')
+            if report_file.lower().endswith('.csv'):
+                self.report_writer = csv.writer(self.report)
+                self.report_writer.writerow(['file', 'status'])
 
     def append(self, row):
         id, status = row
@@ -19,12 +55,35 @@ class Result(object):
             self.success += 1
         elif status is None: # status is only ever None if file checksum matched an existing file checksum and is therefore a duplicate file
             self.duplicate += 1
-            self.duplicate_items.append(id)
+            if len(self.duplicate_items) < self.max_details:
+                self.duplicate_items.append(id)
         else:
             self.error += 1
-            self.error_items.append(id)
+            if len(self.error_items) < self.max_details:
+                self.error_items.append(id)
+
+        metrics.increment('elodie_files_total', status=STATUS[status])
+
+        if self.report_writer is not None:
+            self.report_writer.writerow([id, STATUS[status]])
+        elif self.report is not None:
+            self.report.write(
+                dumps({'file': id, 'status': STATUS[status]}) + '\n')
+
+    def close(self):
+        """Close the report file."""
+        if self.report is not None:
+            self.report.close()
+            self.report = None
+            self.report_writer = None
 
     def write(self):
+        # tabulate is slow to import so we wait until there's something to
+        #  print.
+        from tabulate import tabulate
+
+        self.close()
+
         print("\n")
         if self.error > 0:
             error_headers = ["File"]
@@ -34,6 +93,7 @@ class Result(object):
 
             print("****** ERROR DETAILS ******")
             print(tabulate(error_result, headers=error_headers))
+            self._write_truncated(self.error, self.error_items)
             print("\n")
 
         if self.duplicate > 0:
@@ -44,6 +104,7 @@ class Result(object):
 
             print("****** DUPLICATE (NOT IMPORTED) DETAILS ******")
             print(tabulate(duplicate_result, headers=duplicate_headers))
+            self._write_truncated(self.duplicate, self.duplicate_items)
             print("\n")
 
         headers = ["Metric", "Count"]
@@ -55,3 +116,12 @@ class Result(object):
 
         print("****** SUMMARY ******")
         print(tabulate(result, headers=headers))
+
+    def _write_truncated(self, count, items):
+        if count <= len(items):
+            return
+
+        message = "... and %d more" % (count - len(items))
+        if self.report_file is not None:
+            message += " (see %s)" % self.report_file
+        print(message)
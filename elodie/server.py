@@ -0,0 +1,213 @@
+"""
+Long running service which accepts jobs over a Unix domain socket.
+
+Clients send one JSON object per line in the form of
+{"id": ..., "command": ..., "args": {...}}. The server replies with one JSON
+object per line. Any number of `progress` events may be sent while a job runs
+and every job ends with either a `done` or an `error` event. Each event
+carries the id of the job it belongs to.
+
+Jobs run one at a time so they can share a single Db and ExifTool process.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+from builtins import object
+
+import errno
+import os
+import socket
+import socketserver
+import threading
+
+from json import dumps, loads
+
+from elodie import constants
+from elodie import log
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.connected = True
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('Request must be an object')
+            except ValueError as e:
+                self.send({'id': None, 'event': 'error', 'error': str(e)})
+                continue
+            self.server.elodie_server.handle(request, self.send)
+
+    def send(self, event):
+        # The job keeps running if the client goes away.
+        if not self.connected:
+            return
+        try:
+            self.wfile.write((dumps(event) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except OSError:
+            self.connected = False
+
+
+class Server(object):
+    """Accept jobs on a Unix domain socket and run them with handlers.
+
+    A handler is called with the job's args and a function which sends a
+    progress event to the client. The dict it returns is sent with the
+    `done` event.
+
+    :param str socket_path: Path of the socket. Defaults to
+        :func:`~elodie.constants.server_socket`.
+    """
+
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = constants.server_socket()
+        self.socket_path = socket_path
+        self.handlers = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def add_handler(self, command, handler):
+        """Register the function which runs jobs for a command.
+
+        :param str command: Name of the command.
+        :param handler: Function called with (args, emit).
+        """
+        self.handlers[command] = handler
+
+    def bind(self):
+        """Create the socket.
+
+        A socket left behind by a server which is no longer running is
+        replaced.
+
+        :raises OSError: If another server is listening on the socket.
+        """
+        if os.path.exists(self.socket_path):
+            if is_running(self.socket_path):
+                raise OSError(errno.EADDRINUSE,
+                              'A server is already running on %s' %
+                              self.socket_path)
+            os.remove(self.socket_path)
+
+        # Only the current user may connect to the socket.
+        umask = os.umask(0o177)
+        try:
+            self.server = _UnixServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.server.elodie_server = self
+
+    def serve_forever(self):
+        """Accept jobs until a client sends the shutdown command."""
+        if self.server is None:
+            self.bind()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+    def close(self):
+        if self.server is None:
+            return
+        self.server.server_close()
+        self.server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def handle(self, request, send):
+        """Run a single job and send its events.
+
+        :param dict request: The decoded request.
+        :param send: Function which sends an event to the client.
+        """
+        job_id = request.get('id')
+        command = request.get('command')
+        args = request.get('args') or {}
+
+        def emit(event):
+            event = dict(event)
+            event.setdefault('event', 'progress')
+            event['id'] = job_id
+            send(event)
+
+        if command == 'ping':
+            emit({'event': 'done', 'result': {'pid': os.getpid()}})
+            return
+        if command == 'shutdown':
+            emit({'event': 'done', 'result': {}})
+            self.shutdown()
+            return
+        if command not in self.handlers:
+            emit({'event': 'error',
+                  'error': 'Unknown command %s' % command})
+            return
+
+        with self.lock:
+            try:
+                result = self.handlers[command](args, emit)
+            except (Exception, SystemExit) as e:
+                # Commands shared with the CLI exit on some errors.
+                log.error('Job %s failed: %r' % (job_id, e))
+                emit({'event': 'error', 'error': str(e) or repr(e)})
+                return
+        emit({'event': 'done', 'result': result or {}})
+
+
+def is_running(socket_path=None):
+    """Check whether a server is accepting connections.
+
+    :param str socket_path: Path of the socket.
+    :returns: bool
+    """
+    if socket_path is None:
+        socket_path = constants.server_socket()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def request(command, args=None, socket_path=None, job_id=1):
+    """Send a job to a running server.
+
+    :param str command: Name of the command.
+    :param dict args: Arguments of the command.
+    :param str socket_path: Path of the socket.
+    :returns: generator of dict over the events of the job, ending with its
+        `done` or `error` event.
+    """
+    if socket_path is None:
+        socket_path = constants.server_socket()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    try:
+        sock.sendall((dumps({
+            'id': job_id,
+            'command': command,
+            'args': args or {}
+        }) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as f:
+            for line in f:
+                event = loads(line)
+                yield event
+                if event['event'] in ('done', 'error'):
+                    return
+    finally:
+        sock.close()
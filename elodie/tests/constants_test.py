@@ -57,6 +57,9 @@ def test_application_directory_override_valid():
 def test_hash_db():
     assert constants.hash_db() == '{}/hash.json'.format(constants.application_directory()), constants.hash_db()
 
+def test_metadata_cache():
+    assert constants.metadata_cache() == '{}/metadata.sqlite'.format(constants.application_directory()), constants.metadata_cache()
+
 def test_location_db():
     assert constants.location_db() == '{}/location.json'.format(constants.application_directory()), constants.location_db()
 
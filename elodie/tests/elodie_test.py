@@ -6,6 +6,7 @@ import sys
 import shutil
 
 from click.testing import CliRunner
+from json import loads
 import pytest
 # assert_raises replaced with pytest.raises
 from six import text_type, unichr as six_unichr
@@ -21,6 +22,7 @@ elodie = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(elodie)
 
 from elodie.config import load_config
+from elodie.journal import Journal
 from elodie.localstorage import Db
 from elodie.media.audio import Audio
 from elodie.media.photo import Photo
@@ -293,6 +295,228 @@ def test_import_invalid_file_exit_code():
 
     assert result.exit_code == 1, result.exit_code
 
+def test_watch_destination_in_source():
+    temporary_folder, folder = helper.create_working_folder()
+    folder_destination = '%s/destination' % folder
+    os.mkdir(folder_destination)
+
+    runner = CliRunner()
+    result = runner.invoke(elodie._watch, ['--destination', folder_destination, '--source', folder, '--poll'])
+
+    shutil.rmtree(folder)
+
+    assert result.exit_code == 1, result.exit_code
+    assert 'inside the watched directory' in result.output, result.output
+
+def test_import_resume_skips_completed_files():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    origin_checksum = helper.checksum(origin)
+
+    journal = Journal(destination=folder_destination)
+    journal.open()
+    journal.plan(origin, origin_checksum, '%s/already-imported.txt' % folder_destination)
+    journal.complete(origin, origin_checksum, '%s/already-imported.txt' % folder_destination)
+    journal.close()
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    result = runner.invoke(elodie._import, ['--destination', folder_destination, '--resume', folder])
+    db = Db()
+    helper.restore_dbs()
+
+    imported_files = os.listdir(folder_destination)
+    journal_exists = journal.exists()
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert result.exit_code == 0, result.output
+    assert imported_files == [], imported_files
+    assert db.get_hash(origin_checksum) == '%s/already-imported.txt' % folder_destination, db.hash_db
+    assert journal_exists == False
+
+def test_import_resume_restores_incomplete_files():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin + '_original')
+    origin_checksum = helper.checksum(origin + '_original')
+    with open(origin, 'w') as f:
+        f.write('{"title": "half written"}\n')
+
+    journal = Journal(destination=folder_destination)
+    journal.open()
+    journal.plan(origin, origin_checksum, '%s/partial.txt' % folder_destination)
+    journal.close()
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    result = runner.invoke(elodie._import, ['--destination', folder_destination, '--resume', folder])
+    db = Db()
+    helper.restore_dbs()
+
+    original_exists = os.path.isfile(origin + '_original')
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert result.exit_code == 0, result.output
+    assert original_exists == False
+    assert origin_checksum in db.hash_db, db.hash_db
+    assert 'sample-title' in db.hash_db[origin_checksum], db.hash_db
+
+def test_plan_and_apply():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/plain.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    plan_file = '%s/plan.jsonl' % folder_destination
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    result_plan = runner.invoke(elodie._plan, ['--destination', folder_destination, '--output', plan_file, folder])
+    with open(plan_file, 'r') as f:
+        records = [loads(line) for line in f]
+    result_apply = runner.invoke(elodie._apply, [plan_file])
+    dest_path = records[0]['destination']
+    dest_exists = os.path.isfile(dest_path)
+    original_name = Photo(dest_path).get_original_name()
+    helper.restore_dbs()
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert result_plan.exit_code == 0, result_plan.output
+    assert result_apply.exit_code == 0, result_apply.output
+    assert len(records) == 1, records
+    assert helper.path_tz_fix(os.path.join('2015-12-Dec','Unknown Location','2015-12-05_00-59-26-plain.jpg')) in dest_path, dest_path
+    assert dest_exists == True
+    assert original_name == 'plain.jpg', original_name
+
+def test_import_skips_unchanged_files_from_source_index():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    runner.invoke(elodie._import, ['--destination', folder_destination, folder])
+    with mock.patch('elodie.filesystem.FileSystem.process_checksum') as process_checksum:
+        result = runner.invoke(elodie._import, ['--destination', folder_destination, folder])
+    helper.restore_dbs()
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert process_checksum.called == False
+    assert 'Duplicate, not imported        1' in result.output, result.output
+
+def test_serve_import_emits_progress_events():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    helper.reset_dbs()
+    db = Db()
+    events = []
+    summary = elodie.serve_import({'destination': folder_destination, 'paths': [folder]}, events.append, db)
+    helper.restore_dbs()
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert summary == {'success': 1, 'error': 0, 'duplicate': 0}, summary
+    assert len(events) == 1, events
+    assert events[0]['source'] == origin, events
+    assert events[0]['status'] == 'success', events
+    assert db.get_hash(helper.checksum(helper.get_file('valid.txt'))) == events[0]['destination'], db.hash_db
+
+def test_get_files_to_import_overlapping_paths():
+    temporary_folder, folder = helper.create_working_folder()
+
+    os.makedirs('%s/subfolder' % folder)
+    origin = '%s/subfolder/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    shutil.copyfile(helper.get_file('plain.jpg'), '%s/plain.jpg' % folder)
+
+    files = elodie.get_files_to_import(folder, origin, ['%s/subfolder' % folder], [])
+
+    assert not isinstance(files, (set, list)), files
+    files = list(files)
+    shutil.rmtree(folder)
+
+    assert len(files) == 2, files
+    assert sorted(os.path.basename(f) for f in files) == ['plain.jpg', 'valid.txt'], files
+
+def test_import_report():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    report_file = '%s/report.jsonl' % folder_destination
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    runner.invoke(elodie._import, ['--destination', folder_destination, '--report', report_file, origin])
+    helper.restore_dbs()
+
+    with open(report_file, 'r') as f:
+        rows = [loads(line) for line in f]
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert rows == [{'file': origin, 'status': 'success'}], rows
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-import-after-queue' % gettempdir())
+def test_import_after_queue_reports_plugin_errors(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=AfterError
+async_after=true
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    report_file = '%s/report.jsonl' % folder
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    with mock.patch.object(elodie.FILESYSTEM, 'plugins', Plugins()):
+        result = runner.invoke(elodie._import, ['--destination', folder_destination, '--report', report_file, origin])
+    helper.restore_dbs()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    with open(report_file, 'r') as f:
+        rows = [loads(line) for line in f]
+    imported_files = os.listdir(folder_destination)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert result.exit_code == 1, result.output
+    assert rows == [{'file': origin, 'status': 'error'}], rows
+    assert imported_files != [], imported_files
+
 def test_import_file_with_single_exclude():
     temporary_folder, folder = helper.create_working_folder()
     temporary_folder_destination, folder_destination = helper.create_working_folder()
@@ -816,6 +1040,29 @@ def test_verify_error():
     assert origin in result.output, result.output
     assert 'Error                          1' in result.output, result.output
 
+def test_import_progress_json():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    helper.reset_dbs()
+    runner = CliRunner()
+    result = runner.invoke(elodie._import, ['--destination', folder_destination, '--progress', 'json', origin])
+    helper.restore_dbs()
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    events = [loads(line) for line in result.output.splitlines() if line.startswith('{"event"')]
+
+    assert [e['event'] for e in events] == ['start', 'file_started', 'file_finished', 'finish'], result.output
+    assert events[2]['status'] == 'success', events[2]
+    assert events[2]['bytes'] == os.path.getsize(helper.get_file('valid.txt')), events[2]
+    assert 'checksum' in events[2]['stages'], events[2]
+    assert events[3]['completed'] == 1, events[3]
+
 @mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-cli-batch-plugin-googlephotos' % gettempdir())
 def test_cli_batch_plugin_googlephotos(mock_get_config_file):
     auth_file = helper.get_file('plugins/googlephotos/auth_file.json')
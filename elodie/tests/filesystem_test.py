@@ -928,6 +928,47 @@ def test_process_video_with_album_then_title():
     assert origin_checksum_preprocess == origin_checksum
     assert helper.path_tz_fix(os.path.join('2015-01-Jan','test_album','2015-01-19_12-45-11-movie-test_title.mov')) in destination, destination
 
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-sidecars' % gettempdir())
+def test_process_video_with_sidecar(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Metadata]
+sidecars=video
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    filesystem = FileSystem()
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder,'movie.mov')
+    shutil.copyfile(helper.get_file('video.mov'), origin)
+
+    origin_checksum_preprocess = helper.checksum(origin)
+    media = Video(origin)
+    media.set_album('test_album')
+    media.set_title('test_title')
+    destination = filesystem.process_file(origin, temporary_folder, media, allowDuplicate=True)
+
+    origin_checksum = helper.checksum(origin)
+    destination_checksum = helper.checksum(destination)
+    destination_metadata = Video(destination).get_metadata(update_cache=True)
+    origin_sidecar_exists = os.path.isfile(origin + '.xmp')
+    destination_sidecar_exists = os.path.isfile(destination + '.xmp')
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+    shutil.rmtree(folder)
+    shutil.rmtree(os.path.dirname(os.path.dirname(destination)))
+
+    assert origin_checksum_preprocess == origin_checksum
+    assert destination_checksum == origin_checksum
+    assert origin_sidecar_exists is True
+    assert destination_sidecar_exists is True
+    assert destination_metadata['title'] == 'test_title', destination_metadata
+    assert destination_metadata['original_name'] == 'movie.mov', destination_metadata
+    assert helper.path_tz_fix(os.path.join('2015-01-Jan','test_album','2015-01-19_12-45-11-movie-test_title.mov')) in destination, destination
+
 @mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-fallback-folder' % gettempdir())
 def test_process_file_fallback_folder(mock_get_config_file):
     with open(mock_get_config_file.return_value, 'w') as f:
@@ -0,0 +1,223 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import shutil
+
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import constants
+from elodie.journal import Journal
+from elodie.localstorage import Db
+
+def test_journal_default_location():
+    journal = Journal()
+    assert journal.journal_file == constants.import_journal(), journal.journal_file
+
+def test_journal_plan_and_complete():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.complete('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    entries = list(journal.entries())
+    assert len(entries) == 2, entries
+    assert entries[0]['phase'] == Journal.PLANNED, entries[0]
+    assert entries[1]['phase'] == Journal.COMPLETED, entries[1]
+    assert entries[1]['destination'] == '/dest/a.jpg', entries[1]
+
+def test_journal_open_without_resume_truncates():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    journal.open()
+    journal.close()
+
+    assert journal.exists() == False
+
+def test_journal_open_with_resume_appends():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    journal.open(resume=True)
+    journal.complete('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    assert len(list(journal.entries())) == 2
+
+def test_journal_close_remove():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close(remove=True)
+
+    assert os.path.isfile(journal.journal_file) == False
+
+def test_journal_entries_ignores_partial_line():
+    journal = Journal()
+    journal.open()
+    journal.complete('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+    with open(journal.journal_file, 'a') as f:
+        f.write('{"source": "/source/b.jpg", "check')
+
+    entries = list(journal.entries())
+    assert len(entries) == 1, entries
+
+def test_journal_replay_adds_completed_to_db():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.complete('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    db = Db()
+    completed = journal.replay(db)
+
+    assert completed == set(['/source/a.jpg']), completed
+    assert db.get_hash('abc') == '/dest/a.jpg', db.hash_db
+
+def test_journal_replay_cleans_up_incomplete():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    source = '%s/valid.txt' % folder
+    destination = '%s/valid.txt' % folder_destination
+    shutil.copyfile(helper.get_file('valid.txt'), source + '_original')
+    with open(source, 'w') as f:
+        f.write('modified by exiftool')
+
+    journal = Journal()
+    journal.open()
+    journal.plan(source, 'abc', destination)
+    journal.close()
+    with open(destination, 'w') as f:
+        f.write('partial copy')
+
+    db = Db()
+    completed = journal.replay(db)
+
+    source_checksum = helper.checksum(source)
+    original_exists = os.path.isfile(source + '_original')
+    destination_exists = os.path.isfile(destination)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert completed == set(), completed
+    assert db.check_hash('abc') == False, db.hash_db
+    assert source_checksum == helper.checksum(helper.get_file('valid.txt'))
+    assert original_exists == False
+    assert destination_exists == False
+
+def test_journal_replay_keeps_known_destination():
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    destination = '%s/valid.txt' % folder_destination
+    shutil.copyfile(helper.get_file('valid.txt'), destination)
+
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/valid.txt', 'abc', destination)
+    journal.close()
+
+    db = Db()
+    db.add_hash('def', destination)
+    journal.replay(db)
+
+    destination_exists = os.path.isfile(destination)
+
+    shutil.rmtree(folder_destination)
+
+    assert destination_exists == True
+
+def test_journal_per_destination():
+    journal = Journal(destination='/dest/a')
+    other_journal = Journal(destination='/dest/b')
+
+    assert journal.journal_file == constants.import_journal('/dest/a'), journal.journal_file
+    assert journal.journal_file != other_journal.journal_file, journal.journal_file
+    assert journal.journal_file != Journal().journal_file, journal.journal_file
+
+def test_journal_replay_keeps_source_as_destination():
+    temporary_folder, folder = helper.create_working_folder()
+
+    source = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), source)
+
+    journal = Journal()
+    journal.open()
+    journal.plan(source, 'abc', source)
+    journal.close()
+
+    journal.replay(Db())
+
+    source_exists = os.path.isfile(source)
+
+    shutil.rmtree(folder)
+
+    assert source_exists == True
+
+def test_journal_replay_keeps_destination_which_existed():
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    destination = '%s/valid.txt' % folder_destination
+    shutil.copyfile(helper.get_file('valid.txt'), destination)
+
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/valid.txt', 'abc', destination)
+    journal.close()
+
+    entries = list(journal.entries())
+    journal.replay(Db())
+
+    destination_exists = os.path.isfile(destination)
+
+    shutil.rmtree(folder_destination)
+
+    assert entries[0]['existed'] == True, entries
+    assert destination_exists == True
+
+def test_journal_replay_completes_moved_file():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    source = '%s/valid.txt' % folder
+    destination = '%s/valid.txt' % folder_destination
+
+    journal = Journal()
+    journal.open()
+    journal.plan(source, 'abc', destination)
+    journal.close()
+    # The import was interrupted right after moving the file.
+    shutil.copyfile(helper.get_file('valid.txt'), destination)
+
+    db = Db()
+    completed = journal.replay(db)
+
+    destination_exists = os.path.isfile(destination)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert completed == set([source]), completed
+    assert db.get_hash('abc') == destination, db.hash_db
+    assert destination_exists == True
+
+@mock.patch('elodie.constants.dry_run', True)
+def test_journal_dry_run_does_not_write():
+    journal = Journal()
+    journal.open()
+    journal.plan('/source/a.jpg', 'abc', '/dest/a.jpg')
+    journal.close()
+
+    assert journal.exists() == False
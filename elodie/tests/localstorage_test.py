@@ -6,9 +6,16 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 
+import shutil
+
+import unittest.mock as mock
+
 from . import helper
-from elodie.localstorage import Db
+import time
+
+from elodie.localstorage import Db, MetadataCache, SourceIndex, get_metadata_cache
 from elodie import constants
+from elodie.media.record import MediaRecord
 
 os.environ['TZ'] = 'GMT'
 
@@ -293,3 +300,271 @@ def test_get_location_coordinates_does_not_exists():
     location = db.get_location_coordinates(name)
 
     assert location is None
+
+def test_source_index_unchanged_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    source_index.add(origin, 'checksum', '/dest/valid.txt')
+    unchanged = source_index.get_unchanged(origin)
+
+    shutil.rmtree(folder)
+
+    assert unchanged == ('checksum', '/dest/valid.txt'), unchanged
+
+def test_source_index_new_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    unchanged = source_index.get_unchanged(origin)
+
+    shutil.rmtree(folder)
+
+    assert unchanged is None, unchanged
+
+def test_source_index_changed_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    source_index.add(origin, 'checksum', '/dest/valid.txt')
+    with open(origin, 'a') as f:
+        f.write('changed')
+    unchanged = source_index.get_unchanged(origin)
+
+    shutil.rmtree(folder)
+
+    assert unchanged is None, unchanged
+
+def test_source_index_write_and_reload():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    source_index.add(origin, 'checksum', '/dest/valid.txt')
+    source_index.write()
+
+    source_index_2 = SourceIndex(folder)
+    unchanged = source_index_2.get_unchanged(origin)
+
+    shutil.rmtree(folder)
+
+    assert os.path.isfile(constants.source_index(os.path.abspath(folder)))
+    assert unchanged == ('checksum', '/dest/valid.txt'), unchanged
+
+def test_source_index_write_keeps_index_if_interrupted():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    source_index.add(origin, 'checksum', '/dest/valid.txt')
+    source_index.write()
+    source_index.add(origin, 'checksum-2', '/dest/valid-2.txt')
+    with mock.patch('elodie.localstorage.json.dump', side_effect=KeyboardInterrupt):
+        try:
+            source_index.write()
+        except KeyboardInterrupt:
+            pass
+
+    unchanged = SourceIndex(folder).get_unchanged(origin)
+    index_files = os.listdir(os.path.dirname(source_index.index_file))
+
+    shutil.rmtree(folder)
+
+    assert unchanged == ('checksum', '/dest/valid.txt'), unchanged
+    assert index_files == [os.path.basename(source_index.index_file)], index_files
+
+def test_source_index_write_prune():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    source_index = SourceIndex(folder)
+    source_index.add(origin, 'checksum', '/dest/valid.txt')
+    source_index.write()
+
+    source_index_2 = SourceIndex(folder)
+    source_index_2.write(prune=True)
+
+    source_index_3 = SourceIndex(folder)
+    unchanged = source_index_3.get_unchanged(origin)
+
+    shutil.rmtree(folder)
+
+    assert unchanged is None, unchanged
+
+def test_source_index_contains():
+    source_index = SourceIndex('/path/to/source')
+
+    assert source_index.contains('/path/to/source/photo.jpg') == True
+    assert source_index.contains('/path/to/source/nested/photo.jpg') == True
+    assert source_index.contains('/path/to/source-other/photo.jpg') == False
+
+def test_metadata_cache_add_and_get():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/plain.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+
+    metadata = MediaRecord(
+        date_taken=time.gmtime(1449277166),
+        title='Some Title',
+        base_name='plain',
+        extension='jpg',
+        directory_path=folder
+    )
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, metadata)
+    pending = metadata_cache.get(origin)
+    metadata_cache.commit()
+    cached = MetadataCache().get(origin)
+
+    shutil.rmtree(folder)
+
+    assert os.path.isfile(constants.metadata_cache())
+    assert pending == metadata, pending
+    assert cached == metadata, cached
+
+def test_metadata_cache_changed_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title'})
+    with open(origin, 'a') as f:
+        f.write('changed')
+    cached = metadata_cache.get(origin)
+
+    shutil.rmtree(folder)
+
+    assert cached is None, cached
+
+def test_metadata_cache_remove():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title'})
+    metadata_cache.remove(origin)
+    cached = metadata_cache.get(origin)
+
+    shutil.rmtree(folder)
+
+    assert cached is None, cached
+
+def test_metadata_cache_get_by_checksum():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    copy = '%s/copy.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    shutil.copyfile(helper.get_file('valid.txt'), copy)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title', 'base_name': 'valid'}, 'checksum', False)
+    without_checksum = metadata_cache.get(copy)
+    with_checksum = metadata_cache.get(copy, 'checksum')
+
+    shutil.rmtree(folder)
+
+    assert without_checksum is None, without_checksum
+    assert with_checksum['title'] == 'Some Title', with_checksum
+    assert with_checksum['base_name'] == 'copy', with_checksum
+
+def test_metadata_cache_get_by_checksum_committed():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    copy = '%s/copy.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    shutil.copyfile(helper.get_file('valid.txt'), copy)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title'}, 'checksum', False)
+    metadata_cache.commit()
+    with_checksum = MetadataCache().get(copy, 'checksum')
+
+    shutil.rmtree(folder)
+
+    assert with_checksum['title'] == 'Some Title', with_checksum
+
+def test_metadata_cache_get_by_checksum_date_from_file():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    copy = '%s/copy.txt' % folder
+    unknown = '%s/unknown.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+    shutil.copyfile(helper.get_file('valid.txt'), copy)
+    shutil.copyfile(helper.get_file('valid.txt'), unknown)
+    os.utime(origin, (1000000, 1000000))
+    os.utime(copy, (2000000, 2000000))
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title', 'date_taken': time.gmtime(1000000)}, 'checksum-file', True)
+    metadata_cache.add(unknown, {'title': 'Some Title'}, 'checksum-unknown')
+    pending = metadata_cache.get(copy, 'checksum-file')
+    pending_unknown = metadata_cache.get(copy, 'checksum-unknown')
+    metadata_cache.commit()
+    committed = MetadataCache().get(copy, 'checksum-file')
+    committed_unknown = MetadataCache().get(copy, 'checksum-unknown')
+
+    shutil.rmtree(folder)
+
+    assert pending['date_taken'] == time.gmtime(2000000), pending
+    assert committed['date_taken'] == time.gmtime(2000000), committed
+    assert committed['title'] == 'Some Title', committed
+    assert pending_unknown is None, pending_unknown
+    assert committed_unknown is None, committed_unknown
+
+def test_metadata_cache_commits_in_batches():
+    temporary_folder, folder = helper.create_working_folder()
+    origins = []
+    for i in range(3):
+        origin = '%s/valid-%d.txt' % (folder, i)
+        shutil.copyfile(helper.get_file('valid.txt'), origin)
+        origins.append(origin)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.commit_every = 2
+    metadata_cache.add(origins[0], {'title': 'Some Title'})
+    before_batch = MetadataCache().get(origins[0])
+    metadata_cache.add(origins[1], {'title': 'Some Title'})
+    metadata_cache.add(origins[2], {'title': 'Some Title'})
+    after_batch = [MetadataCache().get(o) for o in origins]
+    metadata_cache.close()
+    after_close = MetadataCache().get(origins[2])
+
+    shutil.rmtree(folder)
+
+    assert before_batch is None, before_batch
+    assert after_batch[0]['title'] == 'Some Title', after_batch
+    assert after_batch[1]['title'] == 'Some Title', after_batch
+    assert after_batch[2] is None, after_batch
+    assert after_close['title'] == 'Some Title', after_close
+
+def test_metadata_cache_discards_other_versions():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/valid.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), origin)
+
+    metadata_cache = MetadataCache()
+    metadata_cache.add(origin, {'title': 'Some Title'})
+    metadata_cache.connection.execute('PRAGMA user_version=0')
+    metadata_cache.connection.commit()
+    cached = MetadataCache().get(origin)
+
+    shutil.rmtree(folder)
+
+    assert cached is None, cached
+
+def test_get_metadata_cache_follows_application_directory():
+    metadata_cache = get_metadata_cache()
+
+    assert get_metadata_cache() is metadata_cache
+    assert metadata_cache.cache_file == constants.metadata_cache()
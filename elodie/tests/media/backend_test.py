@@ -0,0 +1,201 @@
+# -*- coding: utf-8
+# Project imports
+from __future__ import unicode_literals
+import os
+import shutil
+import sys
+
+import unittest.mock as mock
+
+from tempfile import gettempdir
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.config import load_config
+from elodie.media import backend
+from elodie.media.photo import Photo
+
+os.environ['TZ'] = 'GMT'
+
+class CountingBackend(backend.MetadataBackend):
+    def __init__(self, metadata=None):
+        self.metadata = metadata or {}
+        self.reads = []
+        self.writes = []
+
+    def read_batch(self, sources):
+        self.reads.append(list(sources))
+        return [self.metadata.get(source) for source in sources]
+
+    def write(self, tags, source):
+        self.writes.append((tags, source))
+        return True
+
+def test_chain_uses_first_backend_which_reads():
+    first = CountingBackend({'a.jpg': {'SourceFile': 'a.jpg', 'EXIF:Make': 'first'}})
+    second = CountingBackend({'a.jpg': {'SourceFile': 'a.jpg', 'EXIF:Make': 'second'},
+                              'b.png': {'SourceFile': 'b.png', 'EXIF:Make': 'second'}})
+    chain = backend.ChainBackend([first, second])
+
+    metadata = chain.read_batch(['a.jpg', 'b.png', 'c.gif'])
+
+    assert metadata[0]['EXIF:Make'] == 'first', metadata
+    assert metadata[1]['EXIF:Make'] == 'second', metadata
+    assert metadata[2] is None, metadata
+    assert second.reads == [['b.png', 'c.gif']], second.reads
+
+def test_chain_write_skips_backends_which_cannot_write():
+    second = CountingBackend()
+    chain = backend.ChainBackend([backend.NativeBackend(), second])
+
+    status = chain.write_batch({'a.jpg': {'XMP:Title': 'Title'}})
+
+    assert status == {'a.jpg': True}, status
+    assert second.writes == [({'XMP:Title': 'Title'}, 'a.jpg')], second.writes
+
+def test_native_backend():
+    native = backend.NativeBackend()
+
+    assert native.read(helper.get_file('plain.jpg'))['EXIF:Make'] == 'Canon'
+    assert native.read(helper.get_file('photo.png')) is None
+    assert native.write({'XMP:Title': 'Title'}, helper.get_file('plain.jpg')) is None
+
+def test_cached_backend_reads_once():
+    source = helper.get_file('plain.jpg')
+    counting = CountingBackend({source: {'SourceFile': source}})
+    cached = backend.CachedBackend(counting)
+
+    cached.read(source)
+    metadata = cached.read(source)
+
+    assert metadata == {'SourceFile': source}, metadata
+    assert counting.reads == [[source]], counting.reads
+
+def test_cached_backend_forgets_on_write_and_change():
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/plain.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    counting = CountingBackend({source: {'SourceFile': source}})
+    cached = backend.CachedBackend(counting)
+
+    cached.read(source)
+    cached.write({'XMP:Title': 'Title'}, source)
+    cached.read(source)
+    os.utime(source, ns=(0, 0))
+    cached.read(source)
+
+    shutil.rmtree(folder)
+
+    assert len(counting.reads) == 3, counting.reads
+
+def test_cached_backend_max_size():
+    sources = [helper.get_file('plain.jpg'), helper.get_file('with-title.jpg')]
+    counting = CountingBackend(dict((s, {'SourceFile': s}) for s in sources))
+    cached = backend.CachedBackend(counting, max_size=1)
+
+    cached.read_batch(sources)
+
+    assert list(cached.cache.keys()) == [sources[1]], cached.cache.keys()
+
+def test_memory_backend_overlays_writes():
+    source = helper.get_file('plain.jpg')
+    memory = backend.MemoryBackend(backend.NativeBackend())
+
+    status = memory.write({'XMP:Title': 'In memory'}, source)
+    metadata = memory.read(source)
+
+    assert status is True
+    assert metadata['XMP:Title'] == 'In memory', metadata
+    assert metadata['EXIF:Make'] == 'Canon', metadata
+
+def test_create_backend():
+    created = backend.create_backend(['cache', 'native', 'exiftool'])
+
+    assert isinstance(created, backend.CachedBackend), created
+    assert isinstance(created.backend, backend.ChainBackend), created.backend
+    assert [b.name for b in created.backend.backends] == ['native', 'exiftool']
+    assert isinstance(backend.create_backend(['native']), backend.NativeBackend)
+
+def test_create_backend_unknown():
+    try:
+        backend.create_backend(['native', 'foo'])
+    except ValueError:
+        return
+
+    assert False, 'Expected ValueError'
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-metadata-backend' % gettempdir())
+def test_get_backend_from_config(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Metadata]
+backends=memory,native
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+    backend.set_backend(None)
+
+    configured = backend.get_backend()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+    backend.set_backend(None)
+
+    assert isinstance(configured, backend.MemoryBackend), configured
+    assert isinstance(configured.backend, backend.NativeBackend), configured.backend
+
+def test_media_uses_backend():
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/plain.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    memory = backend.MemoryBackend(backend.NativeBackend())
+    backend.set_backend(memory)
+
+    photo = Photo(source)
+    status = photo.set_title('Memory title')
+    metadata = photo.get_metadata()
+
+    backend.set_backend(None)
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert metadata['title'] == 'Memory title', metadata
+    assert memory.metadata[source] == {'XMP:Title': 'Memory title'}, memory.metadata
+
+def test_group_by_tags():
+    groups = backend.group_by_tags({
+        'a.jpg': {'XMP:Album': 'One'},
+        'b.jpg': {'XMP:Album': 'Two'},
+        'c.jpg': {'XMP:Album': 'One'},
+    })
+
+    assert groups == [({'XMP:Album': 'One'}, ['a.jpg', 'c.jpg']),
+                      ({'XMP:Album': 'Two'}, ['b.jpg'])], groups
+
+def test_exiftool_backend_writes_same_tags_together():
+    def set_tags_batch(tags, params):
+        # exiftool lists the files it couldn't write in the -efile file.
+        with open(params[1], 'w') as f:
+            f.write('b.jpg\n')
+        return b'    1 image files updated\n    1 files weren\'t updated due to errors'
+
+    exiftool = backend.ExifToolBackend()
+    # ExifTool is patched where the backend looks it up so the test doesn't
+    #  depend on which ExifTool instance other tests left behind.
+    with mock.patch('elodie.media.backend.ExifTool') as mock_exiftool:
+        mock_set_tags_batch = mock_exiftool.return_value.set_tags_batch
+        mock_set_tags_batch.side_effect = set_tags_batch
+        mock_set_tags = mock_exiftool.return_value.set_tags
+        mock_set_tags.return_value = b'    1 image files updated'
+        status = exiftool.write_batch({
+            'a.jpg': {'XMP:Album': 'One'},
+            'b.jpg': {'XMP:Album': 'One'},
+            'c.jpg': {'XMP:Album': 'Two'},
+        })
+
+    assert status == {'a.jpg': True, 'b.jpg': False, 'c.jpg': True}, status
+    assert mock_set_tags_batch.call_count == 1
+    assert mock_set_tags_batch.call_args[0][1][2:] == ['a.jpg', 'b.jpg']
+    assert mock_set_tags.call_count == 1
@@ -10,12 +10,16 @@ import string
 import tempfile
 import time
 
+import unittest.mock as mock
+
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
 
 import helper
+from elodie.media import backend
 from elodie.media.audio import Audio
-from elodie.media.media import Media
+from elodie.media.base import Base
+from elodie.media.media import ExtractionPlan, Media
 from elodie.media.photo import Photo
 from elodie.media.video import Video
 
@@ -161,7 +165,110 @@ def test_set_original_name():
         assert metadata['original_name'] is None, metadata['original_name']
         assert metadata_updated['original_name'] == random_file_name, metadata_updated['original_name']
 
+def test_get_metadata_from_cache():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/with-title.jpg' % folder
+    shutil.copyfile(helper.get_file('with-title.jpg'), origin)
+
+    metadata = Photo(origin).get_metadata()
+    with mock.patch.object(backend.NativeBackend, 'read') as mock_read:
+        metadata_cached = Photo(origin).get_metadata()
+
+    shutil.rmtree(folder)
+
+    assert mock_read.called is False
+    assert metadata_cached == metadata, metadata_cached
+
+def test_set_title_removes_from_cache():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = '%s/with-title.jpg' % folder
+    shutil.copyfile(helper.get_file('with-title.jpg'), origin)
+    backend.set_backend(backend.MemoryBackend(backend.NativeBackend()))
+
+    Photo(origin).get_metadata()
+    Photo(origin).set_title('Updated Title')
+    metadata = Photo(origin).get_metadata()
+
+    backend.set_backend(None)
+    shutil.rmtree(folder)
+
+    assert metadata['title'] == 'Updated Title', metadata
+
+def test_read_metadata_matches_getters():
+    files = ['plain.jpg', 'with-location.jpg', 'with-location-inv.jpg',
+             'with-null-coordinates.jpg', 'with-album-and-title.jpg',
+             'with-original-name.jpg', 'video.mov']
+    for file in files:
+        media = Media.get_class_by_file(helper.get_file(file), [Photo, Video])
+
+        metadata = media.read_metadata()
+        metadata_from_getters = Base.read_metadata(media)
+
+        assert metadata == metadata_from_getters, (file, metadata, metadata_from_getters)
+
+def test_get_metadata_validates_once():
+    photo = Photo(helper.get_file('with-location.jpg'))
+
+    with mock.patch.object(Photo, 'is_valid', return_value=True) as mock_is_valid:
+        photo.get_metadata(update_cache=True)
+
+    assert mock_is_valid.call_count == 1, mock_is_valid.call_count
+
+def test_get_extraction_plan_per_class():
+    photo_plan = Photo().get_extraction_plan()
+
+    assert Photo().get_extraction_plan() is photo_plan
+    assert Video().get_extraction_plan() is not photo_plan
+    assert isinstance(photo_plan, ExtractionPlan)
+    assert Video().get_extraction_plan().tags[3] == ('title', ('XMP:DisplayName',))
+
+def test_read_metadata_batch():
+    photo = Photo(helper.get_file('with-location.jpg'))
+    video = Video(helper.get_file('video.mov'))
+    photo_2 = Photo(helper.get_file('with-album-and-title.jpg'))
+    medias = [photo, video, photo_2]
+    for media in medias:
+        media.exif_metadata = {'SourceFile': media.source, 'EXIF:Make': 'Batch', 'QuickTime:Make': 'Batch'}
+    photo.exif_metadata['EXIF:GPSLatitude'] = 10.5
+    photo.exif_metadata['EXIF:GPSLatitudeRef'] = 'S'
+    video.exif_metadata['QuickTime:CreationDate'] = '2015:01:19 12:45:11-08:00'
+
+    metadata = Media.read_metadata_batch(medias)
+
+    assert [m['camera_make'] for m in metadata] == ['Batch'] * 3, metadata
+    assert metadata[0]['latitude'] == -10.5, metadata[0]
+    assert time.strftime('%Y-%m-%d %H:%M:%S', metadata[1]['date_taken']) == '2015-01-19 12:45:11', metadata[1]
+    assert metadata[2]['base_name'] == 'with-album-and-title', metadata[2]
+    assert photo.metadata is metadata[0]
+
 def is_valid():
     media = Media()
 
     assert not media.is_valid()
+
+def test_set_tags_batch():
+    temporary_folder, folder = helper.create_working_folder()
+    sources = ['%s/%s.jpg' % (folder, name) for name in ('a', 'b')]
+    for source in sources:
+        shutil.copyfile(helper.get_file('plain.jpg'), source)
+    medias = [Photo(source) for source in sources]
+    memory = backend.MemoryBackend(backend.NativeBackend())
+    backend.set_backend(memory)
+
+    with mock.patch.object(memory, 'write_batch',
+                           wraps=memory.write_batch) as mock_write_batch:
+        statuses = Media.set_tags_batch([
+            (medias[0], medias[0].get_tags(album='Album', title='Title')),
+            (medias[1], medias[1].get_tags(album='Album')),
+        ])
+    metadata = [Photo(source).get_metadata() for source in sources]
+
+    backend.set_backend(None)
+    shutil.rmtree(folder)
+
+    assert statuses == [True, True], statuses
+    assert mock_write_batch.call_count == 1
+    assert metadata[0]['album'] == 'Album', metadata[0]
+    assert metadata[0]['title'] == 'Title', metadata[0]
+    assert metadata[1]['album'] == 'Album', metadata[1]
+    assert metadata[1]['title'] is None, metadata[1]
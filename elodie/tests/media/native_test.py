@@ -0,0 +1,119 @@
+# -*- coding: utf-8
+# Project imports
+from __future__ import unicode_literals
+import os
+import shutil
+import sys
+
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.media import native
+from elodie.media.photo import Photo
+from elodie.media.video import Video
+
+os.environ['TZ'] = 'GMT'
+
+def test_get_metadata_jpeg():
+    source = helper.get_file('plain.jpg')
+    metadata = native.get_metadata(source)
+
+    assert metadata['SourceFile'] == source, metadata
+    assert metadata['EXIF:DateTimeOriginal'] == '2015:12:05 00:59:26', metadata
+    assert metadata['EXIF:CreateDate'] == '2015:12:05 00:59:26', metadata
+    assert metadata['EXIF:Make'] == 'Canon', metadata
+    assert metadata['EXIF:Model'] == 'Canon EOS REBEL T2i', metadata
+
+def test_get_metadata_jpeg_with_location():
+    metadata = native.get_metadata(helper.get_file('with-location.jpg'))
+
+    assert helper.isclose(metadata['EXIF:GPSLatitude'], 37.36670272222222), metadata
+    assert metadata['EXIF:GPSLatitudeRef'] == 'N', metadata
+    assert helper.isclose(metadata['EXIF:GPSLongitude'], 122.03338361111084), metadata
+    assert metadata['EXIF:GPSLongitudeRef'] == 'W', metadata
+
+def test_get_metadata_jpeg_with_null_coordinates():
+    metadata = native.get_metadata(helper.get_file('with-null-coordinates.jpg'))
+
+    assert metadata['EXIF:GPSLatitude'] == '', metadata
+    assert metadata['EXIF:GPSLongitude'] == '', metadata
+
+def test_get_metadata_jpeg_with_xmp():
+    metadata = native.get_metadata(helper.get_file('with-album-and-title.jpg'))
+
+    assert metadata['XMP:Album'] == 'Test Album', metadata
+    assert metadata['XMP:Title'] == 'Some Title', metadata
+
+def test_get_metadata_jpeg_with_original_name():
+    metadata = native.get_metadata(helper.get_file('with-original-name.jpg'))
+
+    assert metadata['XMP:OriginalFileName'] == 'originalfilename.jpg', metadata
+
+def test_get_metadata_quicktime():
+    metadata = native.get_metadata(helper.get_file('video.mov'))
+
+    assert metadata['QuickTime:CreationDate'] == '2015:01:19 12:45:11-08:00', metadata
+    assert metadata['QuickTime:Make'] == 'Apple', metadata
+    assert metadata['QuickTime:Model'] == 'iPhone 5', metadata
+    assert helper.isclose(metadata['Composite:GPSLatitude'], 38.1893), metadata
+    assert helper.isclose(metadata['Composite:GPSLongitude'], -119.9558), metadata
+
+def test_get_metadata_unsupported_extension():
+    assert native.get_metadata(helper.get_file('photo.png')) is None
+    assert native.get_metadata(helper.get_file('text.txt')) is None
+
+def test_get_metadata_invalid_jpeg():
+    assert native.get_metadata(helper.get_file('invalid.jpg')) is None
+
+def test_get_metadata_missing_file():
+    assert native.get_metadata('/does/not/exist.jpg') is None
+
+def test_read_xmp_unmapped_property():
+    packet = (
+        b'<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        b'<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        b'<rdf:Description xmlns:foo="http://example.com/foo/" foo:Title="x"/>'
+        b'</rdf:RDF></x:xmpmeta>'
+    )
+
+    try:
+        native.read_xmp(packet)
+    except native.UnsupportedError:
+        return
+
+    assert False, 'Expected UnsupportedError'
+
+def test_read_jpeg_extended_xmp():
+    packet = native.XMP_EXTENSION_SIGNATURE + b'extended'
+    segment = b'\xff\xe1' + (len(packet) + 2).to_bytes(2, 'big') + packet
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/extended.jpg' % folder
+    with open(source, 'wb') as f:
+        f.write(b'\xff\xd8' + segment + b'\xff\xd9')
+
+    metadata = native.get_metadata(source)
+
+    shutil.rmtree(folder)
+
+    assert metadata is None, metadata
+
+@mock.patch('elodie.external.pyexiftool.ExifTool.get_metadata')
+def test_photo_read_without_exiftool(mock_get_metadata):
+    photo = Photo(helper.get_file('with-location.jpg'))
+    metadata = photo.get_metadata()
+
+    assert mock_get_metadata.called is False
+    assert helper.isclose(metadata['latitude'], 37.36670272222222), metadata
+    assert helper.isclose(metadata['longitude'], -122.03338361111084), metadata
+
+@mock.patch('elodie.external.pyexiftool.ExifTool.get_metadata')
+def test_video_read_without_exiftool(mock_get_metadata):
+    video = Video(helper.get_file('video.mov'))
+    metadata = video.get_metadata()
+
+    assert mock_get_metadata.called is False
+    assert metadata['camera_make'] == 'Apple', metadata
+    assert helper.isclose(metadata['latitude'], 38.1893), metadata
@@ -0,0 +1,90 @@
+# -*- coding: utf-8
+# Project imports
+from __future__ import unicode_literals
+import json
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.media.photo import Photo
+from elodie.media.record import MediaRecord
+
+os.environ['TZ'] = 'GMT'
+
+def test_every_field_defaults_to_none():
+    record = MediaRecord()
+
+    assert len(record) == len(MediaRecord.FIELDS)
+    assert list(record.keys()) == list(MediaRecord.FIELDS)
+    assert all(value is None for value in record.values()), record
+
+def test_dict_access():
+    record = MediaRecord({'title': 'Some Title'}, album='Album')
+    record['camera_make'] = 'Canon'
+
+    assert record['title'] == 'Some Title', record
+    assert record['album'] == 'Album', record
+    assert record.camera_make == 'Canon', record
+    assert record.get('latitude', 1) is None, record
+    assert 'base_name' in record
+    assert 'foo' not in record
+    assert record.get('foo') is None
+    assert dict(record)['title'] == 'Some Title'
+    assert record == record.to_dict()
+
+def test_unknown_key():
+    record = MediaRecord({'rating': 5})
+    record['foo'] = 'bar'
+    missing = record.get('baz')
+    del record['rating']
+
+    assert record['foo'] == 'bar', record
+    assert 'foo' in record
+    assert 'rating' not in record
+    assert missing is None
+    assert len(record) == len(MediaRecord.FIELDS) + 1, record
+    assert list(record.keys())[-1] == 'foo', record
+    assert record.to_dict()['foo'] == 'bar', record
+    assert pickle.loads(pickle.dumps(record))['foo'] == 'bar'
+
+def test_delete_field():
+    record = MediaRecord()
+
+    try:
+        del record['title']
+    except TypeError:
+        return
+
+    assert False, 'Expected TypeError'
+
+def test_no_instance_dict():
+    record = MediaRecord()
+
+    assert not hasattr(record, '__dict__')
+
+def test_copy_and_pickle():
+    record = MediaRecord(title='Some Title', date_taken=time.gmtime(0))
+    copied = record.copy()
+    copied['title'] = 'Other Title'
+    unpickled = pickle.loads(pickle.dumps(record))
+
+    assert record['title'] == 'Some Title', record
+    assert unpickled == record, unpickled
+
+def test_json():
+    record = MediaRecord(title='Some Title')
+
+    assert json.loads(json.dumps(record.to_dict()))['title'] == 'Some Title'
+
+def test_get_metadata_returns_record():
+    photo = Photo(helper.get_file('plain.jpg'))
+    metadata = photo.get_metadata(update_cache=True)
+
+    assert isinstance(metadata, MediaRecord), metadata
+    assert metadata['camera_make'] == 'Canon', metadata
+    assert photo.exif_metadata is None, photo.exif_metadata
@@ -0,0 +1,128 @@
+# -*- coding: utf-8
+# Project imports
+from __future__ import unicode_literals
+import os
+import shutil
+import sys
+
+import unittest.mock as mock
+
+from tempfile import gettempdir
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+import helper
+from elodie.config import load_config
+from elodie.media import sidecar
+from elodie.media.photo import Photo
+from elodie.media.video import Video
+
+os.environ['TZ'] = 'GMT'
+
+def reset_config():
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+def test_get_sidecar_path():
+    assert sidecar.get_sidecar_path('/a/b/video.mov') == '/a/b/video.mov.xmp'
+
+def test_read_without_sidecar():
+    assert sidecar.read(helper.get_file('plain.jpg')) is None
+
+def test_write_and_read():
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/video.mov' % folder
+
+    status = sidecar.write(source, {
+        'album': 'Test Album',
+        'title': 'Some Title',
+        'original_name': 'video.mov',
+        'latitude': -37.5,
+        'longitude': 122.25,
+        'date_taken': '2015:01:19 12:45:11',
+    })
+    values = sidecar.read(source)
+
+    shutil.rmtree(folder)
+
+    assert status is True
+    assert values['album'] == 'Test Album', values
+    assert values['title'] == 'Some Title', values
+    assert values['original_name'] == 'video.mov', values
+    assert helper.isclose(values['latitude'], -37.5), values
+    assert helper.isclose(values['longitude'], 122.25), values
+    assert values['date_taken'] == '2015:01:19 12:45:11', values
+
+def test_write_keeps_other_properties():
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/photo.cr2' % folder
+    with open(sidecar.get_sidecar_path(source), 'w') as f:
+        f.write(
+            '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+            '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+            '<rdf:Description rdf:about="" '
+            'xmlns:crs="http://ns.adobe.com/camera-raw-settings/1.0/" '
+            'xmlns:xmpDM="http://ns.adobe.com/xmp/1.0/DynamicMedia/" '
+            'crs:Exposure2012="+0.50" xmpDM:album="Old Album"/>'
+            '</rdf:RDF></x:xmpmeta>'
+        )
+
+    sidecar.write(source, {'album': 'New Album'})
+    values = sidecar.read(source)
+    with open(sidecar.get_sidecar_path(source)) as f:
+        contents = f.read()
+
+    shutil.rmtree(folder)
+
+    assert values == {'album': 'New Album'}, values
+    assert 'Exposure2012="+0.50"' in contents, contents
+    assert 'Old Album' not in contents, contents
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-sidecars' % gettempdir())
+def test_media_writes_to_sidecar(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Metadata]
+sidecars=photo
+        """)
+    reset_config()
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/plain.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    checksum = helper.checksum(source)
+
+    photo = Photo(source)
+    status = photo.set_title('Sidecar title')
+    location_status = photo.set_location(-11.1, -22.2)
+    metadata = Photo(source).get_metadata(update_cache=True)
+    sidecar_exists = os.path.isfile(sidecar.get_sidecar_path(source))
+    file_checksum = helper.checksum(source)
+
+    reset_config()
+    shutil.rmtree(folder)
+
+    assert status is True, status
+    assert location_status is True, location_status
+    assert sidecar_exists is True
+    assert file_checksum == checksum
+    assert metadata['title'] == 'Sidecar title', metadata
+    assert helper.isclose(metadata['latitude'], -11.1), metadata
+    assert helper.isclose(metadata['longitude'], -22.2), metadata
+    assert metadata['camera_make'] == 'Canon', metadata
+
+def test_sidecar_overrides_embedded_values():
+    temporary_folder, folder = helper.create_working_folder()
+    source = '%s/video.mov' % folder
+    shutil.copyfile(helper.get_file('video.mov'), source)
+    sidecar.write(source, {'latitude': -10.5,
+                           'date_taken': '2020:02:03 04:05:06'})
+
+    metadata = Video(source).get_metadata(update_cache=True)
+
+    shutil.rmtree(folder)
+
+    assert helper.isclose(metadata['latitude'], -10.5), metadata
+    assert helper.isclose(metadata['longitude'], -119.9558), metadata
+    assert metadata['date_taken'][:6] == (2020, 2, 3, 4, 5, 6), metadata
+    assert metadata['camera_make'] == 'Apple', metadata
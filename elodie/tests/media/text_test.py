@@ -399,3 +399,84 @@ def test_set_original_name_with_non_utf8_encoding():
 
     assert status == True, status
     assert metadata["original_name"] == "cp1252.txt", metadata["original_name"]
+
+
+def test_set_album_keeps_body_bytes():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = "%s/body.txt" % folder
+    body = b"first line\r\nnot utf-8 \x92\xff\r\nlast line"
+    with open(origin, "wb") as f:
+        f.write(b'{"album": "Old Album"}\r\n' + body)
+    os.chmod(origin, 0o640)
+
+    text = Text(origin)
+    status = text.set_album("New Album")
+
+    with open(origin, "rb") as f:
+        contents = f.read()
+    with open(origin + "_original", "rb") as f:
+        original_contents = f.read()
+    mode = os.stat(origin).st_mode & 0o777
+    files = sorted(os.listdir(folder))
+
+    shutil.rmtree(folder)
+
+    assert status == True, status
+    assert contents == b'{"album": "New Album"}\n' + body, contents
+    assert original_contents == b'{"album": "Old Album"}\r\n' + body, original_contents
+    assert mode == 0o640, oct(mode)
+    assert files == ["body.txt", "body.txt_original"], files
+
+
+def test_parse_metadata_line_reads_first_line_only():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = "%s/long.txt" % folder
+    with open(origin, "wb") as f:
+        f.write(b'{"title": "Some Title"}\n' + b"x" * (Text.max_metadata_line * 2))
+
+    text = Text(origin)
+    first_line = text._read_first_line()
+    title = text.get_title()
+
+    shutil.rmtree(folder)
+
+    assert first_line == b'{"title": "Some Title"}\n', first_line
+    assert title == "Some Title", title
+
+
+def test_parse_metadata_line_too_long():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = "%s/long.txt" % folder
+    with open(origin, "wb") as f:
+        f.write(b'{"title": "' + b"x" * Text.max_metadata_line + b'"}\n')
+
+    text = Text(origin)
+    title = text.get_title()
+
+    shutil.rmtree(folder)
+
+    assert title is None, title
+
+
+def test_get_metadata_of_copy_uses_its_own_date():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = "%s/origin.txt" % folder
+    copy = "%s/copy.txt" % folder
+    shutil.copyfile(helper.get_file("valid-without-header.txt"), origin)
+    shutil.copyfile(helper.get_file("valid-without-header.txt"), copy)
+    os.utime(origin, (1000000, 1000000))
+    os.utime(copy, (2000000, 2000000))
+    checksum = helper.checksum(origin)
+
+    origin_metadata = Text(origin).get_metadata(update_cache=True, checksum=checksum)
+    copy_metadata = Text(copy).get_metadata(checksum=checksum)
+
+    shutil.rmtree(folder)
+
+    assert origin_metadata["date_taken"] == time.gmtime(1000000), origin_metadata["date_taken"]
+    assert copy_metadata["date_taken"] == time.gmtime(2000000), copy_metadata["date_taken"]
+    assert copy_metadata["base_name"] == "copy", copy_metadata["base_name"]
@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+
+import pytest
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import geolocation
+from elodie import metrics
+from elodie.localstorage import Db
+from elodie.result import Result
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_render_empty():
+    assert metrics.render() == '# EOF\n'
+
+def test_render_counter():
+    metrics.increment('elodie_files_total', status='success')
+    metrics.increment('elodie_files_total', status='success')
+    metrics.increment('elodie_files_total', status='error')
+
+    output = metrics.render()
+
+    assert '# TYPE elodie_files_total counter\n' in output, output
+    assert 'elodie_files_total{status="error"} 1\n' in output, output
+    assert 'elodie_files_total{status="success"} 2\n' in output, output
+    assert output.endswith('# EOF\n'), output
+
+def test_render_gauge():
+    metrics.set_gauge('elodie_hash_db_entries', 10)
+    metrics.set_gauge('elodie_hash_db_entries', 5)
+
+    output = metrics.render()
+
+    assert '# TYPE elodie_hash_db_entries gauge\n' in output, output
+    assert 'elodie_hash_db_entries 5\n' in output, output
+
+def test_render_histogram():
+    metrics.observe('elodie_exiftool_call_duration_seconds', 0.001)
+    metrics.observe('elodie_exiftool_call_duration_seconds', 0.2)
+    metrics.observe('elodie_exiftool_call_duration_seconds', 60)
+
+    output = metrics.render()
+
+    assert '# TYPE elodie_exiftool_call_duration_seconds histogram\n' in output, output
+    assert 'elodie_exiftool_call_duration_seconds_bucket{le="0.005"} 1\n' in output, output
+    assert 'elodie_exiftool_call_duration_seconds_bucket{le="0.25"} 2\n' in output, output
+    assert 'elodie_exiftool_call_duration_seconds_bucket{le="10.0"} 2\n' in output, output
+    assert 'elodie_exiftool_call_duration_seconds_bucket{le="+Inf"} 3\n' in output, output
+    assert 'elodie_exiftool_call_duration_seconds_count 3\n' in output, output
+
+def test_render_escapes_labels():
+    metrics.increment('elodie_files_total', status='a "quoted"\\value')
+
+    assert 'elodie_files_total{status="a \\"quoted\\"\\\\value"} 1' in metrics.render()
+
+def test_write_replaces_file():
+    temporary_folder, folder = helper.create_working_folder()
+    metrics_file = '%s/elodie.prom' % folder
+    with open(metrics_file, 'w') as f:
+        f.write('stale')
+
+    metrics.set_gauge('elodie_hash_db_entries', 3)
+    metrics.write(metrics_file)
+
+    with open(metrics_file, 'r') as f:
+        output = f.read()
+
+    assert output == metrics.render(), output
+    assert os.listdir(folder) == ['elodie.prom'], os.listdir(folder)
+
+def test_exporter_writes_on_start_and_stop():
+    temporary_folder, folder = helper.create_working_folder()
+    metrics_file = '%s/elodie.prom' % folder
+
+    exporter = metrics.Exporter(metrics_file, interval=60).start()
+    with open(metrics_file, 'r') as f:
+        assert f.read() == '# EOF\n'
+
+    metrics.increment('elodie_files_total', status='success')
+    exporter.stop()
+
+    with open(metrics_file, 'r') as f:
+        assert 'elodie_files_total{status="success"} 1' in f.read()
+
+def test_exporter_without_file():
+    exporter = metrics.Exporter(None).start()
+    exporter.stop()
+
+    assert exporter.thread is None
+
+def test_result_counts_files():
+    result = Result()
+    result.append(('id1', True))
+    result.append(('id2', None))
+
+    output = metrics.render()
+
+    assert 'elodie_files_total{status="success"} 1' in output, output
+    assert 'elodie_files_total{status="duplicate"} 1' in output, output
+
+def test_db_sets_hash_db_entries():
+    helper.reset_dbs()
+    db = Db()
+    db.add_hash('checksum', '/path/to/file.jpg')
+    db.update_hash_db()
+    helper.restore_dbs()
+
+    assert 'elodie_hash_db_entries %d' % len(db.hash_db) in metrics.render()
+
+@mock.patch('elodie.localstorage.Db.get_location_name', return_value={'default': 'Sunnyvale'})
+def test_geolocation_cache_hit(mock_get_location_name):
+    geolocation.place_name(37.368, -122.03)
+
+    assert 'elodie_geocoder_cache_requests_total{result="hit"} 1' in metrics.render()
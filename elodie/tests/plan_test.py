@@ -0,0 +1,193 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import shutil
+
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie.filesystem import FileSystem
+from elodie.localstorage import Db
+from elodie.media.text import Text
+from elodie.plan import Plan
+
+os.environ['TZ'] = 'GMT'
+
+def test_plan_text_file():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    records = list(planner.plan([origin], folder_destination))
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert len(records) == 1, records
+    record = records[0]
+    assert record['status'] == Plan.IMPORT, record
+    assert record['checksum'] == helper.checksum(helper.get_file('valid-without-header.txt')), record
+    assert record['destination'].startswith(folder_destination), record
+    assert record['destination'].endswith('-text.txt'), record
+    assert record['tags'] == {'original_name': 'text.txt'}, record
+    assert record['media_class'] == 'Text', record
+
+def test_plan_does_not_modify_source():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+    checksum_before = helper.checksum(origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    list(planner.plan([origin], folder_destination, album_from_folder=True))
+
+    checksum_after = helper.checksum(origin)
+    destination_contents = os.listdir(folder_destination)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert checksum_before == checksum_after
+    assert destination_contents == [], destination_contents
+
+def test_plan_album_from_folder():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    record = list(planner.plan([origin], folder_destination, album_from_folder=True))[0]
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    album = os.path.basename(folder)
+    assert record['tags']['album'] == album, record
+    assert record['metadata']['album'] == album, record
+    assert '{}{}{}'.format(os.sep, album, os.sep) in record['destination'], record
+
+def test_plan_duplicates_within_plan():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin_1 = '%s/text-1.txt' % folder
+    origin_2 = '%s/text-2.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin_1)
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin_2)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    statuses = [r['status'] for r in planner.plan([origin_1, origin_2], folder_destination)]
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert statuses == [Plan.IMPORT, Plan.DUPLICATE], statuses
+
+def test_plan_unsupported_file():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = '%s/invalid.invalid' % folder
+    shutil.copyfile(helper.get_file('invalid.invalid'), origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    record = list(planner.plan([origin], folder))[0]
+
+    shutil.rmtree(folder)
+
+    assert record['status'] == Plan.ERROR, record
+
+def test_apply_text_file():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    db = Db()
+    planner = Plan(FileSystem(), db, 2)
+    records = list(planner.plan([origin], folder_destination))
+    applied = list(planner.apply(records))
+
+    record, dest_path = applied[0]
+    dest_exists = os.path.isfile(dest_path)
+    dest_original_exists = os.path.isfile(dest_path + '_original')
+    original_name = Text(dest_path).get_original_name()
+    source_checksum = helper.checksum(origin)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert dest_path == record['destination'], applied
+    assert dest_exists == True
+    assert dest_original_exists == False
+    assert original_name == 'text.txt', original_name
+    assert db.get_hash(record['checksum']) == dest_path, db.hash_db
+    assert source_checksum == record['checksum']
+
+def test_apply_skips_files_imported_since_plan():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    db = Db()
+    planner = Plan(FileSystem(), db, 2)
+    records = list(planner.plan([origin], folder_destination))
+    db.add_hash(records[0]['checksum'], origin)
+    applied = list(planner.apply(records))
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    record, dest_path = applied[0]
+    assert dest_path is None, applied
+    assert record['status'] == Plan.DUPLICATE, record
+
+def test_apply_source_changed_since_plan():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    records = list(planner.plan([origin], folder_destination))
+    with open(origin, 'a') as f:
+        f.write('more text')
+    applied = list(planner.apply(records))
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    record, dest_path = applied[0]
+    assert dest_path is None, applied
+    assert record['status'] == Plan.ERROR, record
+
+@mock.patch('elodie.constants.dry_run', True)
+def test_apply_dry_run():
+    temporary_folder, folder = helper.create_working_folder()
+    temporary_folder_destination, folder_destination = helper.create_working_folder()
+
+    origin = '%s/text.txt' % folder
+    shutil.copyfile(helper.get_file('valid-without-header.txt'), origin)
+
+    planner = Plan(FileSystem(), Db(), 2)
+    records = list(planner.plan([origin], folder_destination))
+    record, dest_path = list(planner.apply(records))[0]
+    dest_exists = os.path.isfile(dest_path)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(folder_destination)
+
+    assert dest_exists == False
@@ -1,10 +1,16 @@
 from __future__ import absolute_import
 # Project imports
 import unittest.mock as mock
+import json
 import os
+import shutil
 import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from tempfile import gettempdir
 
+import requests
+
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
 
@@ -30,6 +36,96 @@ config_string_fmt = config_string.format(
     secrets_file
 )
 
+class FakePhotosHandler(BaseHTTPRequestHandler):
+    """Handles requests to the upload and batchCreate endpoints of a
+    FakePhotosServer.
+    """
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers), body))
+            if(server.failures > 0):
+                server.failures -= 1
+                return self.reply(server.failure_status)
+
+        if(self.path == '/v1/mediaItems:batchCreate'):
+            items = json.loads(body.decode())['newMediaItems']
+            results = []
+            for item in items:
+                upload_token = item['simpleMediaItem']['uploadToken']
+                status = {'message': 'Success'}
+                if(upload_token in server.rejected):
+                    status = {'code': 3, 'message': 'Failed: Unsupported file'}
+                results.append({'uploadToken': upload_token, 'status': status})
+            return self.reply(200, json.dumps({'newMediaItemResults': results}).encode())
+
+        command = self.headers.get('X-Goog-Upload-Command', '')
+        with server.lock:
+            if(self.headers.get('X-Goog-Upload-Protocol') == 'raw'):
+                server.uploads.append(body)
+                return self.reply(200, 'token-{}'.format(self.headers['X-Goog-Upload-File-Name']).encode())
+            if(command == 'start'):
+                server.uploads.append(b'')
+                return self.reply(200, headers={
+                    'X-Goog-Upload-URL': '{}/session/{}'.format(server.url, len(server.uploads)),
+                    'X-Goog-Upload-Chunk-Granularity': '4'
+                })
+
+            index = int(self.path.split('/')[-1])
+            offset = int(self.headers['X-Goog-Upload-Offset'])
+            if(offset != len(server.uploads[index - 1])):
+                return self.reply(400)
+            server.uploads[index - 1] += body
+            if('finalize' in command):
+                return self.reply(200, 'token-{}'.format(index).encode())
+            return self.reply(200)
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status_code, body=b'', headers={}):
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakePhotosServer(HTTPServer):
+    """A local stand in for the Google Photos API.
+
+    Set failures to make the next requests fail with failure_status, a 503
+    by default, and add upload tokens to rejected to fail creating their
+    media items.
+    """
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakePhotosHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.failure_status = 503
+        self.rejected = set()
+        self.requests = []
+        self.uploads = []
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def get_fake_googlephotos(server):
+    gp = GooglePhotos()
+    gp.session = requests.Session()
+    gp.upload_url = '{}/v1/uploads'.format(server.url)
+    gp.media_create_url = '{}/v1/mediaItems:batchCreate'.format(server.url)
+    gp.backoff = 0
+    return gp
+
 @mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-set-session' % gettempdir())
 def test_googlephotos_set_session(mock_get_config_file):
     with open(mock_get_config_file.return_value, 'w') as f:
@@ -248,3 +344,191 @@ def test_googlephotos_batch_dry_run(mock_get_config_file, mock_print):
     # Verify data still exists in database (wasn't actually deleted)
     remaining_data = gp.db.get_all()
     assert len(remaining_data) == 2, remaining_data
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-upload-fake-endpoint' % gettempdir())
+def test_googlephotos_upload_fake_endpoint(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    server = FakePhotosServer()
+    gp = get_fake_googlephotos(server)
+    status = gp.upload(helper.get_file('plain.jpg'))
+    server.stop()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    with open(helper.get_file('plain.jpg'), 'rb') as f:
+        photo_bytes = f.read()
+
+    assert status is not None, status
+    assert status['uploadToken'] == 'token-plain.jpg', status
+    assert server.uploads == [photo_bytes], len(server.uploads)
+    assert server.requests[0][1]['X-Goog-Upload-File-Name'] == 'plain.jpg', server.requests[0][1]
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-upload-resumable' % gettempdir())
+def test_googlephotos_upload_resumable(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    server = FakePhotosServer()
+    gp = get_fake_googlephotos(server)
+    gp.resumable_threshold = 0
+    gp.chunk_size = 1000
+    status = gp.upload(helper.get_file('plain.jpg'))
+    server.stop()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    with open(helper.get_file('plain.jpg'), 'rb') as f:
+        photo_bytes = f.read()
+    chunks = [headers for path, headers, body in server.requests if path.startswith('/session/')]
+
+    assert status is not None, status
+    assert server.uploads == [photo_bytes], len(server.uploads)
+    assert len(chunks) == (len(photo_bytes) + 999) // 1000, len(chunks)
+    assert chunks[-1]['X-Goog-Upload-Command'] == 'upload, finalize', chunks[-1]
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-upload-retry' % gettempdir())
+def test_googlephotos_upload_retry(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    server = FakePhotosServer()
+    server.failures = 2
+    gp = get_fake_googlephotos(server)
+    status = gp.upload(helper.get_file('plain.jpg'))
+    server.failures = 10
+    status_failed = gp.upload(helper.get_file('plain.jpg'))
+    server.stop()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert status is not None, status
+    assert len(server.uploads) == 1, len(server.uploads)
+    assert status_failed is None, status_failed
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-batch-fake-endpoint' % gettempdir())
+def test_googlephotos_batch_fake_endpoint(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt + '\nworkers=2\n')
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    temporary_folder, folder = helper.create_working_folder()
+    sources = ['{}/photo-{}.jpg'.format(folder, i) for i in range(5)]
+    server = FakePhotosServer()
+    gp = get_fake_googlephotos(server)
+    for source in sources:
+        shutil.copyfile(helper.get_file('plain.jpg'), source)
+        gp.db.set(source, 'queued')
+    gp.db.set('{}/does-not-exist.jpg'.format(folder), 'queued')
+
+    status, count = gp.batch()
+    remaining = gp.db.get_all()
+    server.stop()
+    shutil.rmtree(folder)
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert gp.workers == 2, gp.workers
+    assert status is False, status
+    assert count == 5, count
+    assert list(remaining) == ['{}/does-not-exist.jpg'.format(folder)], remaining
+    assert len(server.uploads) == 5, len(server.uploads)
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-batch-create' % gettempdir())
+def test_googlephotos_batch_create(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    temporary_folder, folder = helper.create_working_folder()
+    sources = ['{}/photo-{}.jpg'.format(folder, i) for i in range(5)]
+    server = FakePhotosServer()
+    server.rejected.add('token-photo-1.jpg')
+    gp = get_fake_googlephotos(server)
+    gp.media_create_limit = 2
+    for source in sources:
+        shutil.copyfile(helper.get_file('plain.jpg'), source)
+        gp.db.set(source, 'queued')
+
+    status, count = gp.batch()
+    remaining = gp.db.get_all()
+    server.stop()
+    shutil.rmtree(folder)
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    creates = [json.loads(body.decode()) for path, headers, body in server.requests if path == '/v1/mediaItems:batchCreate']
+
+    assert status is False, status
+    assert count == 4, count
+    assert list(remaining) == [sources[1]], remaining
+    assert [len(create['newMediaItems']) for create in creates] == [2, 2, 1], creates
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-batch-create-retry' % gettempdir())
+def test_googlephotos_batch_create_retry(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    server = FakePhotosServer()
+    gp = get_fake_googlephotos(server)
+    server.failures = 1
+    status_server_error = gp.create_media_items(['token-a.jpg'])
+    server.failures = 1
+    server.failure_status = 429
+    status_throttled = gp.create_media_items(['token-b.jpg'])
+    server.stop()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    creates = [json.loads(body.decode())['newMediaItems'][0]['simpleMediaItem']['uploadToken'] for path, headers, body in server.requests if path == '/v1/mediaItems:batchCreate']
+
+    assert status_server_error == [None], status_server_error
+    assert status_throttled[0] is not None, status_throttled
+    assert creates == ['token-a.jpg', 'token-b.jpg', 'token-b.jpg'], creates
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-googlephotos-batch-create-timeout' % gettempdir())
+def test_googlephotos_batch_create_timeout(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write(config_string_fmt)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    server = FakePhotosServer()
+    gp = get_fake_googlephotos(server)
+    session_post = gp.session.post
+    errors = [requests.exceptions.ConnectTimeout(), requests.exceptions.ReadTimeout()]
+    def post(*args, **kwargs):
+        if(errors):
+            raise errors.pop(0)
+        return session_post(*args, **kwargs)
+
+    with mock.patch.object(gp.session, 'post', side_effect=post) as mock_post:
+        status_read_timeout = gp.create_media_items(['token-a.jpg'])
+        errors.append(requests.exceptions.ConnectTimeout())
+        status_connect_timeout = gp.create_media_items(['token-b.jpg'])
+    server.stop()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert status_read_timeout == [None], status_read_timeout
+    assert status_connect_timeout[0] is not None, status_connect_timeout
+    assert mock_post.call_count == 4, mock_post.call_count
+    assert len(server.requests) == 1, server.requests
@@ -3,13 +3,16 @@ from __future__ import absolute_import
 import unittest.mock as mock
 import os
 import sys
+import threading
+from json import dumps, loads
 from tempfile import gettempdir
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 
 from . import helper
 from elodie.config import load_config
-from elodie.plugins.plugins import Plugins, PluginBase, PluginDb
+from elodie.media.record import MediaRecord
+from elodie.plugins.plugins import Plugins, PluginBase, PluginDb, flush_plugin_dbs
 
 @mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-load-plugins-unset-backwards-compat' % gettempdir())
 def test_load_plugins_unset_backwards_compat(mock_get_config_file):
@@ -212,6 +215,237 @@ plugins=RuntimeError
     assert status_batch == True, status_batch
     assert status_before == True, status_before
 
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-after-queue-disabled' % gettempdir())
+def test_after_queue_disabled(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    started = plugins.start_after_queue()
+    status_after = plugins.run_all_after('', '', '', '')
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert started == False, started
+    assert status_after == True, status_after
+    assert plugins.classes['Dummy'].after_ran == True
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-after-queue' % gettempdir())
+def test_after_queue(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy,ThrowError
+async_after=true
+after_queue_size=1
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    started = plugins.start_after_queue()
+    statuses = [plugins.run_all_after('a', '', 'a-final', {}),
+                plugins.run_all_after('b', '', 'b-final', {})]
+    results = plugins.get_after_results() + plugins.stop_after_queue()
+    status_after = plugins.run_all_after('c', '', 'c-final', {})
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert started == True, started
+    assert statuses == [None, None], statuses
+    assert results == [('a', 'a-final', False), ('b', 'b-final', False)], results
+    assert plugins.classes['Dummy'].after_ran == True
+    assert plugins.after_queue is None
+    assert status_after == False, status_after
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-after-queue-synchronous' % gettempdir())
+def test_after_queue_synchronous_plugin(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy,ThrowError
+async_after=true
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    plugins.load()
+    plugins.classes['ThrowError'].synchronous_after = True
+    plugins.start_after_queue()
+    status_after = plugins.run_all_after('a', '', 'a-final', {})
+    results = plugins.stop_after_queue()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert status_after == False, status_after
+    assert results == [], results
+    assert plugins.classes['Dummy'].after_ran == False
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-batch-hooks' % gettempdir())
+def test_batch_hooks(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy
+batch_size=2
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    status_before = plugins.start_batch(['a', 'b'])
+    plugins.run_all_after('a', '', 'a-final', {})
+    status_after = plugins.finish_batch()
+    plugins.run_all_after('c', '', 'c-final', {})
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert plugins.batch_size == 2, plugins.batch_size
+    assert status_before == True, status_before
+    assert status_after == True, status_after
+    assert plugins.classes['Dummy'].batches == [('before', ['a', 'b']), ('after', ['a'])], plugins.classes['Dummy'].batches
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-batch-hooks-throw-error' % gettempdir())
+def test_batch_hooks_throw_error(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy,ThrowError
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    status_before = plugins.start_batch(['a'])
+    plugins.batch_records.append({'file_path': 'a'})
+    status_after = plugins.finish_batch()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert plugins.batch_size == 500, plugins.batch_size
+    assert status_before == False, status_before
+    assert status_after == False, status_after
+    assert plugins.classes['Dummy'].batches == [('before', ['a']), ('after', ['a'])], plugins.classes['Dummy'].batches
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-after-metadata-dict' % gettempdir())
+def test_after_metadata_is_dict(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    received = []
+    plugins = Plugins()
+    plugins.load()
+    plugins.classes['Dummy'].after = lambda *args: received.append(args[3])
+    plugins.start_batch(['a'])
+    plugins.run_all_after('a', '', 'a-final', MediaRecord(title='Some Title'))
+    records = list(plugins.batch_records)
+    plugins.finish_batch()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert type(received[0]) is dict, received
+    assert received[0]['title'] == 'Some Title', received
+    assert type(records[0]['metadata']) is dict, records
+    assert dumps(records[0]['metadata'])
+
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-plugin-timeout' % gettempdir())
+def test_plugin_timeout(mock_get_config_file):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy
+timeout=0.1
+max_failures=2
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    plugins.load()
+    finished = threading.Event()
+    plugins.classes['Dummy'].before = lambda *args: finished.wait(5)
+    status_first = plugins.run_all_before('a', '')
+    status_second = plugins.run_all_before('b', '')
+    status_third = plugins.run_all_before('c', '')
+    finished.set()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert status_first == True, status_first
+    assert status_second == True, status_second
+    assert status_third == True, status_third
+    assert plugins.stats[('Dummy', 'before')]['count'] == 2, plugins.stats
+    assert plugins.stats[('Dummy', 'before')]['timeouts'] == 2, plugins.stats
+    assert plugins.disabled == set(['Dummy']), plugins.disabled
+
+@mock.patch('builtins.print')
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-plugin-circuit-breaker' % gettempdir())
+def test_plugin_circuit_breaker(mock_get_config_file, mock_print):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=Dummy,RuntimeError
+max_failures=3
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    for i in range(5):
+        plugins.run_all_before('', '')
+    plugins.write_summary()
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    printed = ''.join(str(call) for call in mock_print.call_args_list)
+
+    assert plugins.disabled == set(['RuntimeError']), plugins.disabled
+    assert plugins.stats[('RuntimeError', 'before')]['errors'] == 3, plugins.stats
+    assert plugins.stats[('Dummy', 'before')]['count'] == 5, plugins.stats
+    assert plugins.classes['Dummy'].before_ran == True
+    assert 'RuntimeError (disabled)' in printed, printed
+
+@mock.patch('builtins.print')
+@mock.patch('elodie.config.get_config_file', return_value='%s/config.ini-plugin-circuit-breaker-plugin-error' % gettempdir())
+def test_plugin_circuit_breaker_plugin_error(mock_get_config_file, mock_print):
+    with open(mock_get_config_file.return_value, 'w') as f:
+        f.write("""
+[Plugins]
+plugins=ThrowError
+max_failures=2
+        """)
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    plugins = Plugins()
+    statuses = [plugins.run_all_before('', '') for i in range(3)]
+
+    if hasattr(load_config, 'config'):
+        del load_config.config
+
+    assert statuses == [False, False, True], statuses
+    assert plugins.disabled == set(['ThrowError']), plugins.disabled
+    assert plugins.stats[('ThrowError', 'before')]['errors'] == 2, plugins.stats
+
 def test_plugin_base_inherits_db():
     plugin_base = PluginBase()
     assert hasattr(plugin_base.db, 'get')
@@ -292,3 +526,80 @@ def test_db_set_dry_run(mock_print):
     
     # Verify dry-run message was printed
     mock_print.assert_called_once_with("[DRY-RUN][foobar_set_test] Would save to database 'dry_run_key': dry_run_value")
+
+def test_db_reads_file_once():
+    db = PluginDb('foobar_read_once')
+    db.set('a', '1')
+
+    with mock.patch('io.open') as mock_open:
+        assert db.get('a') == '1'
+        assert db.get_all() == {'a': '1'}
+
+    assert mock_open.called is False
+
+def test_db_flushes_every_n_changes():
+    db = PluginDb('foobar_flush_every')
+    try:
+        os.remove(db.db_file)
+    except OSError:
+        pass
+    db = PluginDb('foobar_flush_every')
+    db.flush_every = 3
+    db.flush_interval = 3600
+    for key in ('a', 'b'):
+        db.set(key, key)
+
+    with open(db.db_file) as f:
+        before = loads(f.read())
+    db.set('c', 'c')
+    with open(db.db_file) as f:
+        after = loads(f.read())
+
+    assert before == {}, before
+    assert after == {'a': 'a', 'b': 'b', 'c': 'c'}, after
+
+def test_db_flush():
+    db = PluginDb('foobar_flush')
+    db.flush_interval = 3600
+    db.set('a', '1')
+    db.delete('a')
+    db.set('b', '2')
+    db.flush()
+
+    assert PluginDb('foobar_flush').get_all() == {'b': '2'}
+    assert [f for f in os.listdir(os.path.dirname(db.db_file))
+            if f.startswith('.plugindb-')] == []
+
+def test_db_flush_keeps_changes_of_other_instances():
+    db = PluginDb('foobar_merge')
+    try:
+        os.remove(db.db_file)
+    except OSError:
+        pass
+    db = PluginDb('foobar_merge')
+    db.set('uploaded', '1')
+    db.set('kept', '1')
+    db.flush()
+
+    # Like a long running `serve` and an `elodie batch` which both loaded
+    #  the file before either of them wrote it.
+    serve_db = PluginDb('foobar_merge')
+    batch_db = PluginDb('foobar_merge')
+    serve_db.flush_interval = batch_db.flush_interval = 3600
+    batch_db.delete('uploaded')
+    batch_db.set('batch', '2')
+    batch_db.flush()
+    serve_db.set('serve', '3')
+    serve_db.flush()
+
+    assert PluginDb('foobar_merge').get_all() == {'kept': '1', 'batch': '2', 'serve': '3'}, PluginDb('foobar_merge').get_all()
+    assert serve_db.get('uploaded') is None, serve_db.get_all()
+
+def test_flush_plugin_dbs():
+    db = PluginDb('foobar_flush_all')
+    db.flush_interval = 3600
+    db.set('a', '1')
+
+    flush_plugin_dbs()
+
+    assert PluginDb('foobar_flush_all').get('a') == '1'
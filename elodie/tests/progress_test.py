@@ -0,0 +1,188 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import threading
+
+from io import StringIO
+from json import loads
+
+import pytest
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import progress
+from elodie import timing
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture(autouse=True)
+def reset_timing():
+    timing.reset()
+    yield
+    timing.reset()
+
+def test_rates():
+    clock = Clock()
+    tracker = progress.Progress(clock=clock)
+    tracker.start(10)
+    for i in range(4):
+        tracker.file_started(helper.get_file('plain.jpg'))
+        clock.now += 0.5
+        tracker.file_finished(helper.get_file('plain.jpg'), True)
+
+    files_per_second, mb_per_second, eta = tracker.rates()
+
+    size = os.path.getsize(helper.get_file('plain.jpg'))
+    assert files_per_second == 2.0, files_per_second
+    assert mb_per_second == size * 4 / 2.0 / 1000000, mb_per_second
+    assert eta == 3.0, eta
+
+def test_rates_without_total():
+    clock = Clock()
+    tracker = progress.Progress(clock=clock)
+    tracker.start()
+    clock.now += 1
+    tracker.file_finished(helper.get_file('plain.jpg'), True)
+
+    assert tracker.rates()[2] is None
+
+def test_rates_before_start():
+    assert progress.Progress().rates() == (0.0, 0.0, None)
+
+def test_json_events():
+    clock = Clock()
+    stream = StringIO()
+    tracker = progress.JsonProgress(stream, clock)
+    tracker.start(2)
+    tracker.file_started(helper.get_file('plain.jpg'))
+    clock.now += 0.25
+    tracker.file_finished(helper.get_file('plain.jpg'), None)
+    tracker.finish()
+
+    events = [loads(line) for line in stream.getvalue().splitlines()]
+
+    assert [e['event'] for e in events] == ['start', 'file_started', 'file_finished', 'finish'], events
+    assert events[0]['total'] == 2, events[0]
+    assert events[1]['bytes'] == os.path.getsize(helper.get_file('plain.jpg')), events[1]
+    assert events[2]['status'] == 'duplicate', events[2]
+    assert events[2]['seconds'] == 0.25, events[2]
+    assert events[2]['files_per_second'] == 4.0, events[2]
+    assert events[2]['eta_seconds'] == 0.25, events[2]
+    assert events[3]['completed'] == 1, events[3]
+
+@mock.patch('elodie.constants.profile', True)
+def test_json_events_include_stages():
+    stream = StringIO()
+    tracker = progress.JsonProgress(stream)
+    tracker.start()
+    timing.record('checksum', 1.0)
+    tracker.file_started('/does/not/exist.jpg')
+    timing.record('checksum', 0.5)
+    timing.record('metadata.read', 0.25)
+    tracker.file_finished('/does/not/exist.jpg', False)
+
+    event = loads(stream.getvalue().splitlines()[2])
+
+    assert event['status'] == 'error', event
+    assert event['bytes'] == 0, event
+    assert event['stages'] == {'checksum': 0.5, 'metadata.read': 0.25}, event
+
+def test_bar():
+    clock = Clock()
+    stream = StringIO()
+    tracker = progress.BarProgress(stream, clock, width=10)
+    tracker.start(4)
+    clock.now += 1
+    tracker.file_finished(helper.get_file('plain.jpg'), True)
+    tracker.finish()
+
+    output = stream.getvalue()
+
+    assert '[##--------] 1/4' in output, output
+    assert '1.0 files/s' in output, output
+    assert 'ETA 0:00:03' in output, output
+    assert output.endswith('\n'), output
+
+def test_bar_is_throttled():
+    clock = Clock()
+    stream = StringIO()
+    tracker = progress.BarProgress(stream, clock, interval=10)
+    tracker.start(4)
+    for i in range(3):
+        clock.now += 1
+        tracker.file_finished(helper.get_file('plain.jpg'), True)
+
+    assert stream.getvalue().count('\r') == 1, stream.getvalue()
+
+def test_dots(capsys):
+    tracker = progress.DotProgress()
+    tracker.start()
+    tracker.file_finished(helper.get_file('plain.jpg'), True)
+    tracker.file_finished(helper.get_file('plain.jpg'), False)
+    tracker.finish()
+
+    assert capsys.readouterr().out == '.x\n'
+
+def test_get_progress():
+    assert type(progress.get_progress()) is progress.Progress
+    assert isinstance(progress.get_progress('dots'), progress.DotProgress)
+    assert isinstance(progress.get_progress('bar'), progress.BarProgress)
+    assert isinstance(progress.get_progress('json'), progress.JsonProgress)
+
+def test_get_progress_writes_to_fd():
+    read_fd, write_fd = os.pipe()
+    try:
+        tracker = progress.get_progress('json', write_fd)
+        tracker.start(1)
+        tracker.stream.flush()
+
+        assert loads(os.read(read_fd, 4096).decode('utf-8'))['event'] == 'start'
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+def test_format_seconds():
+    assert progress.format_seconds(3725.4) == '1:02:05'
+
+def test_count_updates_total():
+    tracker = progress.Progress()
+    tracker.start(5)
+    tracker.count(iter(range(250)))
+    tracker.counter.join()
+
+    assert tracker.total == 250, tracker.total
+    assert tracker.counting is False
+
+def test_count_corrects_estimate():
+    tracker = progress.Progress()
+    tracker.start(500)
+    tracker.count(iter(range(3)))
+    tracker.counter.join()
+
+    assert tracker.total == 3, tracker.total
+
+def test_finish_before_counted():
+    def files():
+        yield helper.get_file('plain.jpg')
+        blocked.wait()
+        yield helper.get_file('plain.jpg')
+
+    blocked = threading.Event()
+    tracker = progress.Progress()
+    tracker.start()
+    tracker.count(files())
+    tracker.file_started(helper.get_file('plain.jpg'))
+    tracker.file_finished(helper.get_file('plain.jpg'), True)
+    tracker.finish()
+    blocked.set()
+    tracker.counter.join()
+
+    assert tracker.total == 1, tracker.total
@@ -1,11 +1,12 @@
 from __future__ import absolute_import
 # Project imports
 
+import csv
 import os
 import sys
 import unittest 
 
-from json import dumps
+from json import dumps, loads
 from unittest.mock import patch
 try:
     from StringIO import StringIO
@@ -14,6 +15,7 @@ except ImportError:
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 
+from . import helper
 from elodie import constants
 from elodie.result import Result
 
@@ -120,3 +122,74 @@ Duplicate, not imported        1"""
     result.append(('id2', False))
     result.append(('id3', None))
     call_result_and_assert(result, expected)
+
+def test_details_are_capped():
+    expected = """****** ERROR DETAILS ******
+File
+------
+id0
+id1
+... and 3 more
+
+
+****** SUMMARY ******
+Metric                     Count
+-----------------------  -------
+Success                        0
+Error                          5
+Duplicate, not imported        0"""
+    result = Result(max_details=2)
+    for i in range(5):
+        result.append(('id%d' % i, False))
+    call_result_and_assert(result, expected)
+
+def test_details_are_capped_with_report():
+    temporary_folder, folder = helper.create_working_folder()
+    report_file = '%s/report.jsonl' % folder
+
+    result = Result(report_file, max_details=1)
+    result.append(('id1', None))
+    result.append(('id2', None))
+
+    saved_stdout = sys.stdout
+    try:
+        out = StringIO()
+        sys.stdout = out
+        result.write()
+    finally:
+        sys.stdout = saved_stdout
+
+    assert '... and 1 more (see %s)' % report_file in out.getvalue(), out.getvalue()
+
+def test_report_jsonl():
+    temporary_folder, folder = helper.create_working_folder()
+    report_file = '%s/report.jsonl' % folder
+
+    result = Result(report_file)
+    result.append(('id1', True))
+    result.append(('id2', False))
+    result.append(('id3', None))
+    result.close()
+
+    with open(report_file, 'r') as f:
+        rows = [loads(line) for line in f]
+
+    assert rows == [
+        {'file': 'id1', 'status': 'success'},
+        {'file': 'id2', 'status': 'error'},
+        {'file': 'id3', 'status': 'duplicate'},
+    ], rows
+
+def test_report_csv():
+    temporary_folder, folder = helper.create_working_folder()
+    report_file = '%s/report.csv' % folder
+
+    result = Result(report_file)
+    result.append(('id,1', True))
+    result.append(('id2', None))
+    result.close()
+
+    with open(report_file, 'r', newline='') as f:
+        rows = list(csv.reader(f))
+
+    assert rows == [['file', 'status'], ['id,1', 'success'], ['id2', 'duplicate']], rows
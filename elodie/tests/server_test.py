@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie import constants
+from elodie.server import Server, is_running, request
+
+@pytest.fixture
+def server():
+    server = Server()
+    server.bind()
+    server.thread = threading.Thread(target=server.serve_forever)
+    server.thread.start()
+    yield server
+    if server.thread.is_alive():
+        list(request('shutdown'))
+    server.thread.join()
+
+def test_server_default_socket():
+    server = Server()
+    assert server.socket_path == constants.server_socket(), server.socket_path
+
+def test_server_ping(server):
+    events = list(request('ping'))
+    assert events == [{'id': 1, 'event': 'done', 'result': {'pid': os.getpid()}}], events
+
+def test_server_streams_progress_events(server):
+    def handler(args, emit):
+        for name in args['names']:
+            emit({'source': name})
+        return {'count': len(args['names'])}
+    server.add_handler('count', handler)
+
+    events = list(request('count', {'names': ['a', 'b']}, job_id='job'))
+
+    assert events == [
+        {'id': 'job', 'event': 'progress', 'source': 'a'},
+        {'id': 'job', 'event': 'progress', 'source': 'b'},
+        {'id': 'job', 'event': 'done', 'result': {'count': 2}},
+    ], events
+
+def test_server_unknown_command(server):
+    events = list(request('does-not-exist'))
+    assert len(events) == 1, events
+    assert events[0]['event'] == 'error', events
+
+def test_server_handler_exceptions_do_not_stop_server(server):
+    def handler(args, emit):
+        sys.exit(1)
+    server.add_handler('exit', handler)
+
+    events = list(request('exit'))
+    ping_events = list(request('ping'))
+
+    assert events[-1]['event'] == 'error', events
+    assert ping_events[-1]['event'] == 'done', ping_events
+
+def test_server_socket_permissions(server):
+    mode = os.stat(server.socket_path).st_mode & 0o777
+    assert mode == 0o600, oct(mode)
+
+def test_server_shutdown_removes_socket(server):
+    list(request('shutdown'))
+    server.thread.join()
+    server_running = is_running()
+
+    assert server_running == False
+    assert os.path.exists(server.socket_path) == False
+
+def test_server_replaces_stale_socket():
+    with open(constants.server_socket(), 'w') as f:
+        f.write('')
+
+    server = Server()
+    server.bind()
+    running = is_running()
+    server.close()
+
+    assert running == True
+
+def test_server_refuses_to_start_twice(server):
+    with pytest.raises(OSError):
+        Server().bind()
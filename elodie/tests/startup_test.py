@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+elodie_path = os.path.abspath('{}/../../elodie.py'.format(os.path.dirname(os.path.realpath(__file__))))
+
+#: Modules which are slow to import and must only be imported once needed.
+DEFERRED_MODULES = (
+    'PIL',
+    'requests',
+    'send2trash',
+    'tabulate',
+    'concurrent.futures',
+    'socketserver',
+    'googleapiclient',
+)
+
+#: Most modules elodie.py may import, including their dependencies, before
+#:  a command runs.
+MODULE_BUDGET = 150
+
+#: Microseconds elodie.py may spend importing its own modules and their
+#:  dependencies before a command runs. Wall clock time depends on how busy
+#:  the machine is so it's only checked when ELODIE_CHECK_STARTUP_TIME is
+#:  set.
+STARTUP_BUDGET = 150000
+
+COMMANDS = ('import', 'plan', 'apply', 'watch', 'serve', 'update',
+            'generate-db', 'verify', 'batch')
+
+def import_times(*args):
+    """Run elodie.py with `python -X importtime`.
+
+    :returns: dict of module name to cumulative import time in microseconds
+        for each module imported by elodie.py.
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', elodie_path] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert output.returncode == 0, output.stderr
+
+    times = {}
+    started = False
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level.
+        name = name[1:].rstrip()
+        # Modules imported while the interpreter starts aren't ours.
+        if not started:
+            started = name == 'site'
+            continue
+        times[name] = int(cumulative)
+    return times
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_startup_defers_slow_modules(command):
+    times = import_times(command, '--help')
+    imported = set(name.strip() for name in times)
+
+    for module in DEFERRED_MODULES:
+        assert module not in imported, '%s imported by %s' % (module, command)
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_startup_module_budget(command):
+    times = import_times(command, '--help')
+
+    assert len(times) <= MODULE_BUDGET, '%s imported %d modules' % (command, len(times))
+
+@pytest.mark.skipif(not os.environ.get('ELODIE_CHECK_STARTUP_TIME'),
+                    reason='set ELODIE_CHECK_STARTUP_TIME to check import times')
+@pytest.mark.parametrize('command', COMMANDS)
+def test_startup_budget(command):
+    times = import_times(command, '--help')
+    # Only top level imports, the rest are already part of their parent's
+    #  cumulative time.
+    total = sum(t for name, t in times.items() if not name.startswith(' '))
+
+    assert total < STARTUP_BUDGET, '%s took %dus to import' % (command, total)
+
+def test_verify_does_not_import_slow_modules():
+    times = import_times('verify')
+    imported = set(name.strip() for name in times)
+
+    assert 'PIL' not in imported
+    assert 'requests' not in imported
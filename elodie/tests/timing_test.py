@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+
+from json import load
+
+import pytest
+import unittest.mock as mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie import timing
+from elodie.localstorage import Db
+
+@pytest.fixture(autouse=True)
+def reset_timing():
+    timing.reset()
+    yield
+    timing.reset()
+
+def test_stage_not_recorded_when_disabled():
+    with timing.stage('disabled'):
+        pass
+
+    assert timing.summary() == {}
+
+@mock.patch('elodie.constants.profile', True)
+def test_stage_recorded_when_enabled():
+    with timing.stage('enabled'):
+        pass
+    with timing.stage('enabled'):
+        pass
+
+    summary = timing.summary()
+    assert summary['enabled']['count'] == 2, summary
+
+@mock.patch('elodie.constants.profile', True)
+def test_stage_recorded_when_exception_raised():
+    with pytest.raises(ValueError):
+        with timing.stage('raises'):
+            raise ValueError()
+
+    assert timing.summary()['raises']['count'] == 1
+
+@mock.patch('elodie.constants.profile', True)
+def test_timed_decorator():
+    @timing.timed('decorated')
+    def add(a, b):
+        return a + b
+
+    value = add(1, 2)
+
+    assert value == 3
+    assert timing.summary()['decorated']['count'] == 1
+
+def test_summary_aggregates():
+    for seconds in range(1, 101):
+        timing.record('aggregate', seconds)
+
+    summary = timing.summary()['aggregate']
+
+    assert summary == {'count': 100, 'total': 5050, 'p50': 50, 'p95': 95, 'max': 100}, summary
+
+@mock.patch('elodie.constants.profile', True)
+def test_checksum_is_timed():
+    Db().checksum(helper.get_file('valid.txt'))
+
+    assert timing.summary()['checksum']['count'] == 1
+
+def test_write(capsys):
+    timing.record('printed', 0.25)
+    timing.write()
+
+    output = capsys.readouterr().out
+    assert 'PROFILE' in output, output
+    assert 'printed' in output, output
+    assert '250.0' in output, output
+
+def test_write_json():
+    temporary_folder, folder = helper.create_working_folder()
+    profile_file = '%s/profile.json' % folder
+
+    timing.record('dumped', 0.5)
+    timing.write_json(profile_file)
+
+    with open(profile_file, 'r') as f:
+        profile = load(f)
+
+    assert profile['stages']['dumped']['count'] == 1, profile
+    assert profile['stages']['dumped']['total'] == 0.5, profile
+
+def test_summary_keeps_bounded_sample():
+    for seconds in range(1, 10001):
+        timing.record('bounded', seconds)
+
+    summary = timing.summary()['bounded']
+
+    assert len(timing.__STAGES__['bounded'].sample) == timing.Durations.sample_size
+    assert summary['count'] == 10000, summary
+    assert summary['total'] == 50005000, summary
+    assert summary['max'] == 10000, summary
+    assert 4500 <= summary['p50'] <= 5500, summary
+    assert 9000 <= summary['p95'] <= 10000, summary
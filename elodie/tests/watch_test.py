@@ -0,0 +1,176 @@
+from __future__ import absolute_import
+# Project imports
+import os
+import sys
+import shutil
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from . import helper
+from elodie.watch import Debouncer, InotifyWatcher, PollingWatcher, get_watcher, watch
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_debouncer_waits_for_quiet_period():
+    clock = FakeClock()
+    debouncer = Debouncer(2.0, clock)
+    debouncer.closed('/source/a.jpg')
+
+    clock.now = 1.0
+    ready_early = debouncer.ready()
+    clock.now = 2.0
+    ready = debouncer.ready()
+    ready_again = debouncer.ready()
+
+    assert ready_early == [], ready_early
+    assert ready == ['/source/a.jpg'], ready
+    assert ready_again == [], ready_again
+
+def test_debouncer_closed_again_resets_quiet_period():
+    clock = FakeClock()
+    debouncer = Debouncer(2.0, clock)
+    debouncer.closed('/source/a.jpg')
+    clock.now = 1.5
+    debouncer.closed('/source/a.jpg')
+
+    clock.now = 2.5
+    ready_early = debouncer.ready()
+    clock.now = 3.5
+    ready = debouncer.ready()
+
+    assert ready_early == [], ready_early
+    assert ready == ['/source/a.jpg'], ready
+
+def test_debouncer_modified_waits_for_close():
+    clock = FakeClock()
+    debouncer = Debouncer(2.0, clock)
+    debouncer.closed('/source/a.jpg')
+    debouncer.modified('/source/a.jpg')
+
+    clock.now = 10.0
+    ready = debouncer.ready()
+
+    assert ready == [], ready
+
+def test_debouncer_timeout():
+    clock = FakeClock()
+    debouncer = Debouncer(2.0, clock)
+    timeout_empty = debouncer.timeout()
+    debouncer.closed('/source/a.jpg')
+    clock.now = 0.5
+
+    assert timeout_empty is None
+    assert debouncer.timeout() == 1.5, debouncer.timeout()
+
+def test_polling_watcher_reports_new_files_only():
+    temporary_folder, folder = helper.create_working_folder()
+    existing = '%s/existing.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), existing)
+
+    watcher = PollingWatcher([folder], 0)
+    new = '%s/new.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), new)
+    events = watcher.poll(0)
+    events_again = watcher.poll(0)
+
+    shutil.rmtree(folder)
+
+    assert events == [(new, True)], events
+    assert events_again == [], events_again
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='inotify is only available on Linux')
+def test_inotify_watcher_reports_closed_files_in_new_directories():
+    temporary_folder, folder = helper.create_working_folder()
+
+    watcher = InotifyWatcher([folder])
+    os.makedirs('%s/subdir' % folder)
+    events = watcher.poll(1)
+    new = '%s/subdir/new.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), new)
+    events.extend(watcher.poll(1))
+    watcher.close()
+
+    shutil.rmtree(folder)
+
+    assert (new, True) in events, events
+
+def test_get_watcher_polling():
+    temporary_folder, folder = helper.create_working_folder()
+
+    watcher = get_watcher([folder], polling=True)
+
+    shutil.rmtree(folder)
+
+    assert isinstance(watcher, PollingWatcher), watcher
+
+def test_watch_calls_callback_with_settled_files():
+    temporary_folder, folder = helper.create_working_folder()
+
+    watcher = PollingWatcher([folder], 0)
+    new = '%s/new.txt' % folder
+    ignored = '%s/new.part' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), new)
+    shutil.copyfile(helper.get_file('valid.txt'), ignored)
+
+    imported = []
+    iterations = []
+    def running():
+        iterations.append(True)
+        return len(iterations) <= 3 and not imported
+
+    watch(watcher, imported.extend, 0, lambda p: p.endswith('.txt'), running)
+
+    shutil.rmtree(folder)
+
+    assert imported == [new], imported
+
+def test_debouncer_ignores_files_for_ignore_period():
+    clock = FakeClock()
+    debouncer = Debouncer(2.0, clock, ignore_period=5.0)
+    debouncer.closed('/dest/a.jpg')
+    debouncer.ignore('/dest/a.jpg')
+    debouncer.closed('/dest/a.jpg')
+
+    clock.now = 4.0
+    ready_ignored = debouncer.ready()
+    clock.now = 5.0
+    debouncer.closed('/dest/a.jpg')
+    clock.now = 7.0
+    ready = debouncer.ready()
+
+    assert ready_ignored == [], ready_ignored
+    assert ready == ['/dest/a.jpg'], ready
+    assert debouncer.ignored == {}, debouncer.ignored
+
+def test_watch_ignores_files_written_by_callback():
+    temporary_folder, folder = helper.create_working_folder()
+
+    watcher = PollingWatcher([folder], 0)
+    new = '%s/new.txt' % folder
+    written = '%s/written.txt' % folder
+    shutil.copyfile(helper.get_file('valid.txt'), new)
+
+    imported = []
+    def callback(files):
+        imported.extend(files)
+        shutil.copyfile(new, written)
+        return [written]
+
+    iterations = []
+    def running():
+        iterations.append(True)
+        return len(iterations) <= 5
+
+    watch(watcher, callback, 0, lambda p: p.endswith('.txt'), running)
+
+    shutil.rmtree(folder)
+
+    assert imported == [new], imported
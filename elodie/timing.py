@@ -0,0 +1,198 @@
+"""
+Record how long each stage of an import takes.
+
+Stages are timed with :func:`stage` or :func:`timed` and only recorded when
+:attr:`elodie.constants.profile` is True. The durations are aggregated into a
+count, total, median, 95th percentile and maximum for each stage. The
+percentiles are taken from a fixed size sample of the durations so long
+running processes don't keep every duration in memory.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+from builtins import object
+
+import random
+import threading
+
+from functools import wraps
+from json import dump
+from math import ceil
+from time import perf_counter
+
+from elodie import constants
+
+__STAGES__ = {}
+__LOCK__ = threading.Lock()
+
+
+class Durations(object):
+    """Running aggregate of the durations recorded for a stage.
+
+    The count, total and maximum are exact. Percentiles are estimated from a
+    uniform sample of at most `sample_size` durations, which holds every
+    duration until that many were recorded.
+
+    :param int sample_size: Maximum number of durations kept.
+    """
+
+    sample_size = 1024
+
+    def __init__(self, sample_size=None):
+        if sample_size is not None:
+            self.sample_size = sample_size
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.sample = []
+        # Seeded so the same durations always give the same summary.
+        self.random = random.Random(0)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.sample) < self.sample_size:
+            self.sample.append(seconds)
+            return
+        # Reservoir sampling keeps every duration with equal probability.
+        index = self.random.randrange(self.count)
+        if index < self.sample_size:
+            self.sample[index] = seconds
+
+
+class stage(object):
+    """Context manager which records the time spent in a stage.
+
+    :param str name: Name of the stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if constants.profile:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.start is not None:
+            record(self.name, perf_counter() - self.start)
+
+
+def timed(name):
+    """Decorator which records the time spent in a function as a stage.
+
+    :param str name: Name of the stage.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, seconds):
+    """Record a duration for a stage.
+
+    :param str name: Name of the stage.
+    :param float seconds: Time spent in the stage.
+    """
+    with __LOCK__:
+        if name not in __STAGES__:
+            __STAGES__[name] = Durations()
+        __STAGES__[name].add(seconds)
+
+
+def reset():
+    """Forget every duration recorded so far."""
+    with __LOCK__:
+        __STAGES__.clear()
+
+
+def totals():
+    """Get the total time recorded for each stage so far.
+
+    Comparing totals taken before and after a file is processed gives the
+    time that file spent in each stage.
+
+    :returns: dict of stage name to seconds.
+    """
+    with __LOCK__:
+        return dict((k, v.total) for k, v in __STAGES__.items())
+
+
+def percentile(durations, percent):
+    """Get a percentile of sorted durations using the nearest rank.
+
+    :param list durations: Sorted durations.
+    :param int percent: Percentile between 0 and 100.
+    :returns: float
+    """
+    rank = int(ceil(percent / 100.0 * len(durations))) - 1
+    return durations[min(max(rank, 0), len(durations) - 1)]
+
+
+def summary():
+    """Aggregate the recorded durations of each stage.
+
+    :returns: dict of stage name to a dict with count, total, p50, p95 and
+        max in seconds.
+    """
+    with __LOCK__:
+        stages = dict(
+            (k, (v.count, v.total, v.max, sorted(v.sample)))
+            for k, v in __STAGES__.items()
+        )
+
+    result = {}
+    for name, (count, total, maximum, sample) in stages.items():
+        result[name] = {
+            'count': count,
+            'total': total,
+            'p50': percentile(sample, 50),
+            'p95': percentile(sample, 95),
+            'max': maximum,
+        }
+    return result
+
+
+def write():
+    """Print a table of the aggregated durations of each stage."""
+    from tabulate import tabulate
+
+    stages = summary()
+    if not stages:
+        return
+
+    headers = ['Stage', 'Count', 'Total (s)', 'p50 (ms)', 'p95 (ms)',
+               'Max (ms)']
+    result = []
+    for name in sorted(stages, key=lambda k: stages[k]['total'],
+                       reverse=True):
+        this_stage = stages[name]
+        result.append([
+            name,
+            this_stage['count'],
+            this_stage['total'],
+            this_stage['p50'] * 1000,
+            this_stage['p95'] * 1000,
+            this_stage['max'] * 1000,
+        ])
+
+    print("\n")
+    print("****** PROFILE ******")
+    print(tabulate(result, headers=headers,
+                   floatfmt=('', '', '.3f', '.1f', '.1f', '.1f')))
+
+
+def write_json(file_path):
+    """Write the aggregated durations of each stage as JSON.
+
+    :param str file_path: Path of the file to write.
+    """
+    with open(file_path, 'w') as f:
+        dump({'stages': summary()}, f, indent=2, sort_keys=True)
@@ -18,6 +18,9 @@ from elodie.media.photo import Photo
 from elodie.media.video import Video
 from elodie.result import Result
 
+#: Number of files whose original name is written at once.
+BATCH_SIZE = 1000
+
 def main(argv):
     filesystem = FileSystem()
     result = Result()
@@ -25,31 +28,67 @@ def main(argv):
 
     paths = argv[1:]
 
+    sources = []
     for path in paths:
         path = os.path.expanduser(path)
         if os.path.isdir(path):
-            for source in filesystem.get_all_files(path, None):
-                status = add_original_name(source, subclasses)
-                result.append((_decode(source), status))
+            sources.extend(filesystem.get_all_files(path, None))
         else:
-            status = add_original_name(path, subclasses)
-            result.append((_decode(path), status))
+            sources.append(path)
+
+    for start in range(0, len(sources), BATCH_SIZE):
+        batch = sources[start:start + BATCH_SIZE]
+        statuses = add_original_names(batch, subclasses)
+        for source, status in zip(batch, statuses):
+            result.append((_decode(source), status))
 
     result.write()
 
 def add_original_name(source, subclasses):
-    media = Media.get_class_by_file(source, subclasses)
-    if media is None:
-        print('{} is not a valid media object'.format(source))
-        return
+    return add_original_names([source], subclasses)[0]
 
-    metadata = media.get_metadata()
-    if metadata['original_name'] is not None:
-        print('{} already has OriginalFileName...Skipping'.format(source))
-        return
+def add_original_names(sources, subclasses):
+    """Add the original name to several files.
+
+    The original names of every file except text files are written with a
+    single call to :meth:`~elodie.media.media.Media.set_tags_batch`.
+
+    :returns: list with the status of each file in the same order.
+    """
+    medias = [Media.get_class_by_file(source, subclasses)
+              for source in sources]
+    Media.prefetch_metadata(medias)
+
+    statuses = [None] * len(sources)
+    tags_by_media = []
+    positions = []
+    for i, (source, media) in enumerate(zip(sources, medias)):
+        if media is None:
+            print('{} is not a valid media object'.format(source))
+            continue
+
+        metadata = media.get_metadata()
+        if metadata is None:
+            continue
+        if metadata['original_name'] is not None:
+            print('{} already has OriginalFileName...Skipping'.format(source))
+            continue
+
+        original_name = parse_original_name_from_media(metadata)
+        if isinstance(media, Media):
+            # Like set_original_name() the current name is used if there's
+            #  no original name in it.
+            if not original_name:
+                original_name = os.path.basename(source)
+            tags_by_media.append(
+                (media, media.get_tags(original_name=original_name)))
+            positions.append(i)
+        else:
+            statuses[i] = media.set_original_name(original_name)
 
-    original_name = parse_original_name_from_media(metadata)
-    return media.set_original_name(original_name)
+    for i, status in zip(positions, Media.set_tags_batch(tags_by_media)):
+        statuses[i] = status
+    return statuses
 
 def parse_original_name_from_media(metadata):
     # 2015-07-23_04-31-12-img_9414-test3.jpg
@@ -0,0 +1,294 @@
+"""
+Watch directories for new files and import them as they arrive.
+
+On Linux we use inotify through ctypes so new files are picked up without
+walking the directory tree. Everywhere else, or if inotify isn't available,
+we fall back to periodically polling the directories for changes.
+
+.. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
+"""
+from __future__ import print_function
+from builtins import object
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from elodie import log
+
+# inotify event masks from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Debouncer(object):
+    """Track files which are being written until they've settled.
+
+    A file becomes ready once it was closed after writing (or moved into
+    place) and has seen no further activity for `quiet_period` seconds.
+    Activity on files which were ignored in the last `ignore_period` seconds
+    isn't tracked.
+
+    :param float quiet_period: Seconds without activity before a file is
+        considered complete.
+    :param clock: Function returning the current time in seconds.
+    :param float ignore_period: Seconds activity on an ignored file is
+        disregarded for.
+    """
+
+    def __init__(self, quiet_period=2.0, clock=time.monotonic,
+                 ignore_period=10.0):
+        self.quiet_period = quiet_period
+        self.clock = clock
+        self.ignore_period = ignore_period
+        self.pending = {}
+        self.ignored = {}
+
+    def ignore(self, path):
+        """Disregard activity on a file for the next `ignore_period` seconds.
+
+        This is used for files we wrote ourselves.
+        """
+        self.pending.pop(path, None)
+        self.ignored[path] = self.clock()
+
+    def is_ignored(self, path):
+        ignored_at = self.ignored.get(path)
+        if ignored_at is None:
+            return False
+        if self.clock() - ignored_at < self.ignore_period:
+            return True
+        del self.ignored[path]
+        return False
+
+    def closed(self, path):
+        """Record that a file was closed after writing or moved into place."""
+        if not self.is_ignored(path):
+            self.pending[path] = self.clock()
+
+    def modified(self, path):
+        """Record that a file is being written to again."""
+        self.pending.pop(path, None)
+
+    def ready(self):
+        """Get the files which have settled and stop tracking them.
+
+        :returns: list(str)
+        """
+        now = self.clock()
+        ready = sorted(p for p, t in self.pending.items()
+                       if now - t >= self.quiet_period)
+        for path in ready:
+            del self.pending[path]
+        expired = [p for p, t in self.ignored.items()
+                   if now - t >= self.ignore_period]
+        for path in expired:
+            del self.ignored[path]
+        return ready
+
+    def timeout(self):
+        """Seconds until the next pending file could become ready.
+
+        :returns: float or None if nothing is pending.
+        """
+        if not self.pending:
+            return None
+        oldest = min(self.pending.values())
+        return max(0.0, oldest + self.quiet_period - self.clock())
+
+
+class InotifyWatcher(object):
+    """Recursively watch directories using Linux inotify.
+
+    :param list paths: Directories to watch.
+    :raises OSError: If inotify is not available.
+    """
+
+    def __init__(self, paths):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.directories = {}
+        for path in paths:
+            self.add_directory(path)
+
+    def add_directory(self, path):
+        """Watch a directory and every directory below it.
+
+        :returns: list(str) of files which already exist in the directories.
+        """
+        existing = []
+        for dirname, dirnames, filenames in os.walk(path):
+            wd = self.libc.inotify_add_watch(
+                self.fd,
+                os.fsencode(dirname),
+                WATCH_MASK
+            )
+            if wd < 0:
+                log.warn('Could not watch %s' % dirname)
+                continue
+            self.directories[wd] = dirname
+            existing.extend(os.path.join(dirname, f) for f in filenames)
+        return existing
+
+    def poll(self, timeout):
+        """Wait for events.
+
+        :param float timeout: Maximum number of seconds to wait.
+        :returns: list(tuple(str, bool)) of paths and whether the file was
+            closed after writing.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                log.warn('inotify event queue overflowed, events were lost')
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if wd not in self.directories:
+                continue
+
+            path = os.path.join(self.directories[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have been written to the directory before
+                    #  we started watching it.
+                    events.extend((p, True) for p in self.add_directory(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                events.append((path, True))
+            elif mask & IN_MODIFY:
+                events.append((path, False))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """Watch directories by periodically comparing the size and modification
+    time of every file in them.
+
+    Files which exist when the watcher is created are not reported.
+
+    :param list paths: Directories to watch.
+    :param float interval: Seconds between scans.
+    """
+
+    def __init__(self, paths, interval=1.0):
+        self.paths = paths
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for path in self.paths:
+            for dirname, dirnames, filenames in os.walk(path):
+                for filename in filenames:
+                    file_path = os.path.join(dirname, filename)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    snapshot[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout):
+        """Wait for changes.
+
+        Every new or changed file is reported as closed. The Debouncer
+        resets its quiet period each time the file is reported again.
+
+        :param float timeout: Maximum number of seconds to wait.
+        :returns: list(tuple(str, bool))
+        """
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.scan()
+        events = [(p, True) for p, s in snapshot.items()
+                  if self.snapshot.get(p) != s]
+        self.snapshot = snapshot
+        return events
+
+    def close(self):
+        pass
+
+
+def get_watcher(paths, polling=False):
+    """Get the best available watcher for the given directories.
+
+    :param list paths: Directories to watch.
+    :param bool polling: Always use the PollingWatcher.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError, TypeError) as e:
+            log.warn('inotify unavailable, falling back to polling: %s' % e)
+    return PollingWatcher(paths)
+
+
+def watch(watcher, callback, quiet_period=2.0, should_import=None,
+          running=None):
+    """Watch for files and call `callback` once each one has settled.
+
+    :param watcher: An InotifyWatcher or PollingWatcher.
+    :param callback: Called with a list of file paths which are ready. It may
+        return the paths it wrote to, whose events are then ignored so they
+        aren't imported again.
+    :param float quiet_period: Seconds without activity before a file is
+        considered complete.
+    :param should_import: Optional function to filter file paths.
+    :param running: Optional function, the loop stops when it returns False.
+    """
+    debouncer = Debouncer(quiet_period)
+    while running is None or running():
+        timeout = debouncer.timeout()
+        if timeout is None or timeout > 1.0:
+            timeout = 1.0
+
+        for path, closed in watcher.poll(timeout):
+            if should_import is not None and not should_import(path):
+                continue
+            if closed:
+                debouncer.closed(path)
+            else:
+                debouncer.modified(path)
+
+        ready = [p for p in debouncer.ready() if os.path.isfile(p)]
+        if ready:
+            for path in callback(ready) or ():
+                debouncer.ignore(path)